@@ -0,0 +1,96 @@
+# --- 系統管理後台 ---
+# 從主程式拆出來，只有管理員登入後才 import (連帶 plotly.express 也延後載入)
+import os
+
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+
+import tracing
+from events import WRITER
+from frames import FRAMES
+from leaderboard import get_board
+from market_data import MARKET_CACHE, active_gateway
+from metrics import get_rollups
+from snapshots import SNAPSHOTS, SWEEPER
+from tracing import span
+from trades import TRADES, cached_analysis
+
+
+def render(files):
+    st.title("🔒 系統管理後台")
+    if st.button("⬅️ 返回遊戲"): st.session_state.is_admin = False; st.rerun()
+    rollups = get_rollups(); board = get_board()
+    tab_stats, tab_trades, tab_perf = st.tabs(["📊 流量統計", "🔬 交易分析", "⏱️ 效能"])
+    with tab_stats:
+        k1, k2, k3 = st.columns(3)
+        k1.metric("👁️ 總瀏覽", rollups.total("visits")); k2.metric("💬 回饋數", rollups.total("feedback")); k3.metric("🎮 遊戲場數", rollups.total("games"))
+        ws = WRITER.stats
+        st.caption(f"📝 事件寫入：已寫 {ws['written']} / 批次 {ws['batches']} / 待寫 {WRITER.pending()} / 丟棄 {ws['dropped']} / 失敗 {ws['failed']}")
+        st.caption(f"🧊 共用K棒：{FRAMES.live()} 份 / {FRAMES.nbytes() / 1024 / 1024:.1f} MB / 命中 {FRAMES.stats['hits']} / 建立 {FRAMES.stats['builds']}")
+        cs = MARKET_CACHE.stats; gw = active_gateway()
+        st.caption(f"🗄️ 行情快取：記憶體命中 {cs['mem_hits']} / 磁碟命中 {cs['disk_hits']} / 未命中 {cs['misses']} / 背景更新 {cs['refreshes']} / 錯誤 {cs['errors']}")
+        if gw is not None:
+            gs = gw.stats; lat = gw.latency(); opened = gw.open_circuits()
+            st.caption(f"🌐 下載閘道：請求 {gs['requests']} / 實際下載 {gs['downloads']} / 合併等待 {gs['coalesced']} / 失敗 {gs['failures']} (重試 {gs['retries']}) / "
+                       f"熔斷拒絕 {gs['rejected']} / 限流 {gs['throttled']} 次 {gs['throttle_wait_s']:.1f}s / 延遲 p50 {lat['p50_ms']:.0f} p95 {lat['p95_ms']:.0f} ms")
+            if opened: st.warning("⚡ 熔斷中：" + "、".join(f"{t} ({n} 次失敗，剩 {left:.0f}s)" for t, (n, left) in opened.items()))
+        st.caption(f"💾 進度快照：已寫 {SNAPSHOTS.stats['written']} / 接回 {SNAPSHOTS.stats['reads']} / 使用中 {SWEEPER.active()} 個 session / 閒置回收 {SWEEPER.stats['evicted']} / 重新取回 {SWEEPER.stats['rehydrated']}")
+        st.divider()
+        daily = rollups.series("visits_day")
+        if not daily.empty:
+            st.plotly_chart(px.line(daily.rename(columns={'bucket': 'Time', 'n': 'Visits'}), x='Time', y='Visits', title='每日訪問'), use_container_width=True)
+        c1, c2 = st.columns(2)
+        with c1:
+            hourly = rollups.series("visits_hour", last=48)
+            if not hourly.empty: st.plotly_chart(px.bar(hourly.rename(columns={'bucket': '時段', 'n': '訪問'}), x='時段', y='訪問', title='近 48 小時訪問'), use_container_width=True)
+        with c2:
+            hist = rollups.histogram()
+            if not hist.empty: st.plotly_chart(px.bar(hist.rename(columns={'bucket': '綜合戰力', 'n': '場數'}), x='綜合戰力', y='場數', title='戰力分布'), use_container_width=True)
+        st.subheader("🏆 英雄榜")
+        st.dataframe(board.top(200), use_container_width=True)
+        with st.expander("🔎 原始紀錄"):
+            # 原始檔只在勾選時才讀
+            if st.checkbox("載入回饋與流量原始紀錄"):
+                st.subheader("💬 意見回饋")
+                if os.path.exists(files["feedback"]):
+                    with span("csv.read"): fb = pd.read_csv(files["feedback"])
+                    st.dataframe(fb, use_container_width=True)
+                st.subheader("👁️ 最近流量")
+                if os.path.exists(files["traffic"]):
+                    with span("csv.read"): tr = pd.read_csv(files["traffic"]).tail(500)
+                    st.dataframe(tr, use_container_width=True)
+    with tab_trades:
+        # st.tabs 每次都會跑所有分頁，分析只在勾選時做，結果依檔名清單快取
+        if st.checkbox("載入交易分析"):
+            with span("trades.analyze"): res = cached_analysis()
+            if res is None: st.info("尚無成交紀錄")
+            else:
+                s = res["summary"]
+                k1, k2, k3, k4, k5 = st.columns(5)
+                k1.metric("成交筆數", f"{s['fills']:,}"); k2.metric("玩家", f"{s['players']:,}"); k3.metric("平倉勝率", f"{s['win_rate']:.1f}%")
+                k4.metric("持有中位數 (根)", f"{s['median_hold']:.0f}"); k5.metric("做多比例", f"{s['long_share']:.1f}%")
+                st.caption(f"🗂️ {len(TRADES.parts())} 個合併檔 + {len(TRADES.segments())} 個小段檔 / 本 process 已寫 {TRADES.stats['written']} 筆、合併 {TRADES.stats['compactions']} 次")
+                c1, c2 = st.columns(2)
+                with c1:
+                    st.markdown("**多空比較**"); st.dataframe(res["by_direction"].round(2), use_container_width=True)
+                with c2:
+                    hold = res["by_hold"].reset_index()
+                    st.plotly_chart(px.bar(hold, x='hold_bin', y='勝率', hover_data=['筆數'], labels={'hold_bin': '持有 K 棒數', '勝率': '勝率 (%)'}, title='持有時間 vs 勝率'), use_container_width=True)
+                st.markdown("**AI 提示的影響** (依開倉那根 K 棒的訊號和部位方向是否一致)")
+                st.dataframe(res["by_signal"].round(2), use_container_width=True)
+        if st.button("🗜️ 立即合併小段檔"): TRADES.compact(); st.rerun()
+    with tab_perf:
+        perf = tracing.summary()
+        if perf.empty: st.info("尚無資料")
+        else:
+            st.caption(f"每個階段最近 {tracing.MAX_SAMPLES} 次 (本 process)，單位 ms")
+            st.dataframe(perf.round(2), use_container_width=True, hide_index=True)
+            rerun = tracing.samples("rerun")
+            if rerun: st.plotly_chart(px.histogram(x=rerun, nbins=40, labels={'x': 'ms'}, title='整頁重跑耗時分布'), use_container_width=True)
+        c1, c2 = st.columns(2)
+        if c1.button("🧹 清除計時"): tracing.reset(); st.rerun()
+        st.session_state.profiling = c2.toggle("🔬 本 session 開啟 cProfile", value=st.session_state.get('profiling', False))
+        st.caption("玩家端可在網址加上 ?profile=1，只對該 session 開啟")
+        for when, label, text in reversed(tracing.PROFILES):
+            with st.expander(f"{when} {label}"): st.code(text)
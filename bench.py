@@ -0,0 +1,292 @@
+# --- 效能基準測試 ---
+# 全部使用合成資料，不需要網路。結果輸出 JSON，可以存成基準並和之後的結果比較。
+#
+#   python bench.py                          # 跑全部並印出
+#   python bench.py --save bench_baseline.json
+#   python bench.py --compare bench_baseline.json --threshold 0.2
+#   python bench.py --quick                  # 跳過 1M 筆英雄榜
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import charts
+import indicators
+import market_data
+import pyramid
+from leaderboard import Leaderboard
+from ledger import Ledger, risk_stats
+from trades import TradeStore, analyze, ANALYSIS_COLUMNS, SCHEMA
+
+
+def timeit(fn, repeat=7, warmup=1):
+    for _ in range(warmup): fn()
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter(); fn(); samples.append((time.perf_counter() - t0) * 1000)
+    return {"median_ms": statistics.median(samples), "min_ms": min(samples), "runs": repeat}
+
+
+def synthetic_frames():
+    p = market_data.SyntheticProvider(seed=0, end="2026-01-30")
+    return {t: p.fetch(t, "60d", "5m") for t in market_data.HOT_STOCKS_MAP}
+
+
+# --- load_data 篩選 ---
+def bench_screening(frames, results):
+    results["screen.vectorized_33"] = timeit(lambda: market_data.screen_frames(frames))
+
+    # 舊版：逐檔過濾
+    def legacy():
+        for df in frames.values():
+            d = df[df['Volume'] > 0]
+            if len(d) < 300 or d['Close'].iloc[-1] > 200: continue
+            fl = (d['High'] - d['Low']) / d['Open'] * 100
+            fl.mean() < 0.15 or fl.max() < 1.5
+    results["screen.legacy_loop_33"] = timeit(legacy)
+
+
+# --- 技術指標 ---
+def legacy_indicators(df):
+    df['MA5'] = df['Close'].rolling(window=5).mean()
+    df['MA22'] = df['Close'].rolling(window=22).mean()
+    df['MA60'] = df['Close'].rolling(window=60).mean()
+    df['MA240'] = df['Close'].rolling(window=240).mean()
+    df['MA22_Slope'] = df['MA22'].diff()
+    exp1 = df['Close'].ewm(span=12, adjust=False).mean()
+    exp2 = df['Close'].ewm(span=26, adjust=False).mean()
+    df['MACD'] = exp1 - exp2
+    df['Signal'] = df['MACD'].ewm(span=9, adjust=False).mean()
+    df['MACD_Hist'] = df['MACD'] - df['Signal']
+    df['Signal_Bull'] = ((df['MA5'] > df['MA22']) & (df['MA22_Slope'] > 0) & (df['MACD_Hist'] > 0) & (df['MACD_Hist'] > df['MACD_Hist'].shift(1)))
+    df['Signal_Bear'] = ((df['MA5'] < df['MA22']) & (df['MA22_Slope'] < 0) & (df['MACD_Hist'] < 0) & (df['MACD_Hist'] < df['MACD_Hist'].shift(1)))
+    return df
+
+
+def bench_indicators(frames, results):
+    one = next(iter(frames.values()))
+    closes = [df['Close'].to_numpy() for df in frames.values()]
+    results["indicators.pandas_legacy_1"] = timeit(lambda: legacy_indicators(one.copy()))
+    results["indicators.numpy_1"] = timeit(lambda: indicators.calculate_technical_indicators(one.copy()))
+    results["indicators.numpy_batch_33"] = timeit(lambda: indicators.compute_batch(closes))
+    results["indicators.prepare_each_33"] = timeit(lambda: [indicators.prepare_frame(df) for df in frames.values()])
+    results["indicators.prepare_batch_33"] = timeit(lambda: indicators.prepare_frames(list(frames.values())))
+    results["indicators.prepare_batch_lazy_33"] = timeit(lambda: indicators.prepare_frames(list(frames.values()), lazy=True))
+    src = indicators.source_close(one)
+    results["indicators.lazy_columns_1"] = timeit(lambda: indicators.lazy_columns(src, len(src) - indicators.WARMUP))
+
+    def stream():
+        s = indicators.IndicatorState()
+        for c in closes[0][:500]: s.update(c)
+    results["indicators.stream_500_bars"] = timeit(stream)
+
+
+# --- 操盤室 K 線圖 ---
+def legacy_figure(df, curr_idx):
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+    display_df = df.iloc[max(0, curr_idx - 100): curr_idx + 1]
+    fig = make_subplots(rows=3, cols=1, shared_xaxes=True, vertical_spacing=0.02, row_heights=[0.65, 0.15, 0.2])
+    fig.add_trace(go.Candlestick(x=display_df['Bar_Index'], open=display_df['Open'], high=display_df['High'], low=display_df['Low'], close=display_df['Close']), row=1, col=1)
+    for ma in ['MA5', 'MA22', 'MA60', 'MA240']:
+        fig.add_trace(go.Scatter(x=display_df['Bar_Index'], y=display_df[ma]), row=1, col=1)
+    vol_colors = ['#ef5350' if r['Open'] < r['Close'] else '#26a69a' for i, r in display_df.iterrows()]
+    fig.add_trace(go.Bar(x=display_df['Bar_Index'], y=display_df['Volume'], marker_color=vol_colors), row=2, col=1)
+    hist_c = ['#ef5350' if v > 0 else '#26a69a' for v in display_df['MACD_Hist']]
+    fig.add_trace(go.Bar(x=display_df['Bar_Index'], y=display_df['MACD_Hist'], marker_color=hist_c), row=3, col=1)
+    fig.add_trace(go.Scatter(x=display_df['Bar_Index'], y=display_df['MACD']), row=3, col=1)
+    fig.add_trace(go.Scatter(x=display_df['Bar_Index'], y=display_df['Signal']), row=3, col=1)
+    return fig
+
+
+def bench_chart(frames, results):
+    import plotly.graph_objects as go
+    import plotly.io as pio
+    df = indicators.prepare_frame(next(iter(frames.values())))
+    idx = [len(df) // 2]
+    ledger = Ledger()
+
+    def tick_legacy():
+        idx[0] += 1; legacy_figure(df, idx[0])
+    results["chart.legacy_build"] = timeit(tick_legacy)
+    results["chart.legacy_iterrows_colors"] = timeit(lambda: ['#ef5350' if r['Open'] < r['Close'] else '#26a69a' for i, r in df.iloc[:101].iterrows()])
+    results["chart.round_precompute"] = timeit(lambda: charts.RoundChart(df, show_hints=True))
+    rc = charts.RoundChart(df, show_hints=True)
+
+    def tick():
+        idx[0] += 1; rc.figure(idx[0] % (len(df) - 1), ledger, "t")
+    results["chart.delta_build"] = timeit(tick, repeat=50)
+    results["chart.pyramid_build"] = timeit(lambda: pyramid.Pyramid(df))
+    zoomed = charts.RoundChart(df, show_hints=True, pyramid=pyramid.Pyramid(df), view=charts.VIEWS["1 月"])
+
+    def tick_zoomed():
+        idx[0] += 1; zoomed.figure(idx[0] % (len(df) - 1), ledger, "t")
+    results["chart.zoomed_month_build"] = timeit(tick_zoomed, repeat=50)
+    # st.plotly_chart 內部等同 go.Figure(驗證) + to_json
+    results["chart.serialize"] = timeit(lambda: pio.to_json(go.Figure(rc.figure(len(df) - 1, ledger, "t")), validate=False))
+
+
+# --- 下單 ---
+def bench_trades(results):
+    rnd = random.Random(0)
+    seq = [(rnd.choice(["buy", "sell"]), 100 + rnd.random() * 10, rnd.choice([1000, 5000, 20000]), i) for i in range(1000)]
+
+    def run():
+        L = Ledger()
+        for a, p, q, i in seq: L.execute(a, p, q, i)
+        L.equity(100.0); L.markers(900, 1000)
+    results["ledger.execute_1000"] = timeit(run)
+
+    # 逐根權益：每根呼叫 equity() vs 一次向量化
+    L = Ledger()
+    for act, p, q, i in seq[:200]: L.execute(act, p, q, i * 10)
+    close = 100 + np.cumsum(np.random.default_rng(0).normal(0, 0.1, 3000))
+    results["ledger.equity_loop_3000"] = timeit(lambda: [L.equity(c) for c in close])   # 只算最後部位，當作下限
+    results["ledger.equity_curve_3000"] = timeit(lambda: risk_stats(L.equity_curve(close, 0, len(close) - 1)))
+
+
+# --- 英雄榜 ---
+def fake_scores(n, rng):
+    return pd.DataFrame({
+        "日期": pd.date_range("2025-12-01", periods=n, freq="min").strftime("%Y-%m-%d %H:%M"),
+        "玩家": rng.integers(0, 5000, n).astype(str), "股名": "三關通關",
+        "綜合戰力": rng.normal(0, 100, n).round(1), "狙擊率(%)": rng.normal(0, 1, n).round(2),
+        "總報酬(%)": rng.normal(0, 5, n).round(2), "總獲利($)": rng.normal(0, 50000, n).astype(int)})
+
+
+def bench_leaderboard(results, sizes, tmp):
+    rng = np.random.default_rng(0)
+    for n in sizes:
+        csv = os.path.join(tmp, f"lb_{n}.csv")
+        fake_scores(n, rng).to_csv(csv, index=False)
+        repeat = 3 if n >= 1000000 else 5
+        results[f"leaderboard.csv_load_sort_{n}"] = timeit(lambda: pd.read_csv(csv).sort_values(by="綜合戰力", ascending=False), repeat=repeat)
+        board = Leaderboard(os.path.join(tmp, f"lb_{n}.db"))
+        board.import_csv(csv)
+        results[f"leaderboard.sqlite_top50_{n}"] = timeit(lambda: board.top(50), repeat=repeat)
+        results[f"leaderboard.sqlite_rank_{n}"] = timeit(lambda: board.rank(12.3), repeat=repeat)
+        results[f"leaderboard.sqlite_rank_low_{n}"] = timeit(lambda: board.rank(-300), repeat=repeat)   # 名次越低，要算的筆數越多
+        results[f"leaderboard.sqlite_count_{n}"] = timeit(board.count, repeat=repeat)
+
+
+# --- 成交事件分析 ---
+def fake_trades(n, rng):
+    kind = rng.integers(0, 3, n)
+    return {"time": pd.date_range("2026-01-01", periods=n, freq="s").to_numpy(), "sid": rng.integers(0, 5000, n).astype(str),
+            "player": rng.integers(0, 5000, n).astype(str), "room": np.full(n, ""), "seed": rng.integers(0, 2 ** 32, n),
+            "round": rng.integers(1, 4, n), "ticker": np.full(n, "2330.TW"), "interval": np.full(n, "5m"),
+            "index": rng.integers(0, 3000, n), "side": rng.choice([1, -1], n), "kind": kind, "qty": np.full(n, 1000),
+            "price": rng.uniform(20, 200, n), "pnl": rng.normal(0, 5000, n), "roi": rng.normal(0, 2, n),
+            "position": rng.integers(-5, 6, n) * 1000, "hold_bars": np.where(kind == 1, rng.integers(0, 300, n), 0),
+            "signal": rng.integers(-1, 2, n), "entry_signal": rng.integers(-1, 2, n), "hints": rng.random(n) < 0.3}
+
+
+def bench_trade_analytics(results, n, tmp):
+    import pyarrow as pa
+    store = TradeStore(os.path.join(tmp, "trades"), compact_at=10 ** 9)
+    table = pa.table(fake_trades(n, np.random.default_rng(0)), schema=SCHEMA)
+    os.makedirs(store.root, exist_ok=True)
+    for chunk in table.to_batches(max_chunksize=n // 64): store._write_table(pa.Table.from_batches([chunk]), "seg")
+    results[f"trades.read_64_segments_{n}"] = timeit(lambda: store.frame(ANALYSIS_COLUMNS), repeat=3)
+    store.compact()
+    results[f"trades.read_compacted_{n}"] = timeit(lambda: store.frame(ANALYSIS_COLUMNS), repeat=5)
+    df = store.frame(ANALYSIS_COLUMNS)
+    results[f"trades.analyze_{n}"] = timeit(lambda: analyze(df), repeat=5)
+
+
+# --- 冷啟動 ---
+# 每次都開新的 process，量的是 import 與登入頁第一次執行 (streamlit 本身不算在內)
+STARTUP_IMPORTS = """
+import time, streamlit
+t0 = time.perf_counter()
+import market_data, indicators, charts, ledger, leaderboard, events, metrics, frames, rounds, rooms, tracing
+print((time.perf_counter() - t0) * 1000)
+"""
+STARTUP_FIRST_RUN = """
+import sys, time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=60)
+t0 = time.perf_counter(); at.run()
+print((time.perf_counter() - t0) * 1000)
+"""
+
+
+def cold(code, repeat=3):
+    here = os.path.dirname(os.path.abspath(__file__))
+    samples = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as tmp:   # 流量紀錄、SQLite、快取都寫到暫存目錄
+            env = dict(os.environ, PYTHONPATH=here, GAME_DATA_SOURCE="synthetic", GAME_CACHE_DIR=os.path.join(tmp, "cache"),
+                       GAME_LEADERBOARD_DB=os.path.join(tmp, "lb.db"), GAME_METRICS_DB=os.path.join(tmp, "m.db"))
+            out = subprocess.run([sys.executable, "-c", code, os.path.join(here, "trading_game.py")], cwd=tmp, env=env,
+                                 capture_output=True, text=True, check=True).stdout
+            samples.append(float(out.strip().splitlines()[-1]))
+    return {"median_ms": statistics.median(samples), "min_ms": min(samples), "runs": repeat}
+
+
+def bench_startup(results):
+    results["startup.import_app_modules"] = cold(STARTUP_IMPORTS)
+    results["startup.login_first_run"] = cold(STARTUP_FIRST_RUN)
+
+
+def run(quick=False):
+    results = {}
+    frames = synthetic_frames()
+    bench_screening(frames, results)
+    bench_indicators(frames, results)
+    bench_chart(frames, results)
+    bench_trades(results)
+    bench_startup(results)
+    with tempfile.TemporaryDirectory() as tmp:
+        bench_leaderboard(results, [10000, 100000] if quick else [10000, 100000, 1000000], tmp)
+        bench_trade_analytics(results, 100000 if quick else 500000, tmp)
+    return {"meta": {"python": sys.version.split()[0], "platform": platform.platform(), "time": time.strftime("%Y-%m-%d %H:%M:%S")},
+            "results": results}
+
+
+# 比較：median 變慢超過 threshold (比例) 且超過 min_delta_ms 才算退步 (次毫秒級的抖動不算)，回傳退步項目
+def compare(current, baseline, threshold=0.2, min_delta_ms=0.5):
+    regressions = []
+    for name, cur in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base: print(f"{name:<40} {cur['median_ms']:>10.3f} ms   (new)"); continue
+        ratio = cur["median_ms"] / base["median_ms"] if base["median_ms"] else float("inf")
+        slower = ratio > 1 + threshold and cur["median_ms"] - base["median_ms"] > min_delta_ms
+        flag = "  <-- REGRESSION" if slower else ""
+        print(f"{name:<40} {cur['median_ms']:>10.3f} ms   x{ratio:.2f} vs {base['median_ms']:.3f}{flag}")
+        if flag: regressions.append(name)
+    return regressions
+
+
+def main():
+    p = argparse.ArgumentParser(description="交易挑戰賽效能基準")
+    p.add_argument("--quick", action="store_true", help="跳過 1M 筆英雄榜")
+    p.add_argument("--out", default=None, help="結果 JSON 輸出路徑")
+    p.add_argument("--save", default=None, help="把結果存成基準檔")
+    p.add_argument("--compare", default=None, help="和基準檔比較")
+    p.add_argument("--threshold", type=float, default=0.2, help="退步門檻 (0.2 = 慢 20%%)")
+    p.add_argument("--min-delta-ms", type=float, default=0.5, help="慢不到這麼多毫秒就不算退步")
+    a = p.parse_args()
+    current = run(a.quick)
+    for path in (a.out, a.save):
+        if path:
+            with open(path, "w", encoding="utf-8") as f: json.dump(current, f, indent=2, ensure_ascii=False)
+    if a.compare:
+        with open(a.compare, encoding="utf-8") as f: baseline = json.load(f)
+        regressions = compare(current, baseline, a.threshold, a.min_delta_ms)
+        sys.exit(1 if regressions else 0)
+    for name, r in current["results"].items():
+        print(f"{name:<40} {r['median_ms']:>10.3f} ms  (min {r['min_ms']:.3f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# --- 操盤室 K 線圖 ---
+# 每局開始時把整段資料轉成 NumPy 陣列 (含量/MACD 柱顏色) 一次算好，
+# 之後每根 K 棒只更新各 trace 的視窗切片，版面樣板整個 process 共用一份。
+import numpy as np
+
+from pyramid import SESSION_MINUTES
+from tracing import span
+
+WINDOW = 100
+UP, DOWN = '#ef5350', '#26a69a'
+# 視野 (分鐘)；None 為原始解析度最近 WINDOW 根，其他視野顯示剛好涵蓋這段時間的根數 (最多 WINDOW 根)
+VIEWS = {"近 100 根": None, "1 天": SESSION_MINUTES, "1 週": SESSION_MINUTES * 5, "1 月": SESSION_MINUTES * 20}
+MA_STYLE = {'MA5': ('#FFD700', 1), 'MA22': ('#9370DB', 1), 'MA60': ('#2E8B57', 1.5), 'MA240': ('#A9A9A9', 2)}
+
+_LAYOUT = None
+
+
+def layout_template():
+    global _LAYOUT
+    if _LAYOUT is None:
+        from plotly.subplots import make_subplots
+        fig = make_subplots(rows=3, cols=1, shared_xaxes=True, vertical_spacing=0.02, row_heights=[0.65, 0.15, 0.2])
+        fig.update_layout(height=450, margin=dict(l=10, r=10, t=10, b=10), showlegend=False,
+                          title=dict(x=0.05, y=0.98, font=dict(color="white")),
+                          xaxis_rangeslider_visible=False, dragmode=False,
+                          paper_bgcolor='#0e1117', plot_bgcolor='#0e1117', font=dict(color='white'))
+        fig.update_xaxes(showticklabels=False, fixedrange=True, gridcolor='#333')
+        fig.update_yaxes(fixedrange=True, gridcolor='#333')
+        _LAYOUT = fig.to_dict()["layout"]
+    return _LAYOUT
+
+
+# 權益走勢小圖：直接輸出 inline SVG，不經過 plotly，每根 K 棒重畫也只是字串拼接
+def sparkline_svg(values, width=220, height=36, max_points=120):
+    v = np.asarray(values, dtype=np.float64)
+    if len(v) < 2: return ""
+    if len(v) > max_points: v = v[np.linspace(0, len(v) - 1, max_points).round().astype(int)]
+    lo, hi = v.min(), v.max()
+    x = np.linspace(1, width - 1, len(v)); y = height - 1 - (v - lo) / ((hi - lo) or 1) * (height - 2)
+    pts = " ".join(f"{a:.1f},{b:.1f}" for a, b in zip(x, y))
+    color = UP if v[-1] >= v[0] else DOWN   # 台股紅漲綠跌
+    return (f"<svg width='{width}' height='{height}' viewBox='0 0 {width} {height}'>"
+            f"<polyline fill='none' stroke='{color}' stroke-width='1.5' points='{pts}'/></svg>")
+
+
+class RoundChart:
+    # pyramid 給定時可以放大視野 (view 為分鐘數)，超過 WINDOW 根就改用較粗的解析度；
+    # lazy 是共用資料延後計算的欄位 (FrameStore.lazy)，df 裡沒有的 MA240 / 訊號從這裡拿
+    def __init__(self, df, show_hints=False, pyramid=None, view=None, lazy=None):
+        self.df = df
+        self.show_hints = show_hints
+        self.pyramid = pyramid
+        self.level = 0
+        self.count = WINDOW + 1   # 視窗內的 K 棒數
+        lazy = lazy or {}
+        col = lambda c: lazy[c] if c in lazy else df[c].to_numpy()   # 共用資料的唯讀 view，不複製
+        self.x = df['Bar_Index'].to_numpy()
+        self.o, self.h, self.l, self.c = col('Open'), col('High'), col('Low'), col('Close')
+        self.vol = col('Volume')
+        self.vol_colors = np.where(self.o < self.c, UP, DOWN)
+        self.ma = {m: col(m) for m in MA_STYLE}
+        self.macd, self.signal, self.hist = col('MACD'), col('Signal'), col('MACD_Hist')
+        self.hist_colors = np.where(self.hist > 0, UP, DOWN)
+        if show_hints:
+            self.bull_y = np.where(np.asarray(col('Signal_Bull'), dtype=bool), self.l * 0.995, np.nan)
+            self.bear_y = np.where(np.asarray(col('Signal_Bear'), dtype=bool), self.h * 1.005, np.nan)
+        self._traces = self._make_traces()
+        self._idx = None
+        self._lo = 0
+        self._trade_key = None
+        self.fig = {"data": list(self._traces.values()), "layout": dict(layout_template())}
+        self.set_view(view)
+
+    # 依視野長度挑解析度，再依該層每根的分鐘數決定顯示幾根：5 分 K 的「1 天」是原始解析度 54 根，不是固定 100 根
+    def set_view(self, view):
+        level, count = 0, WINDOW + 1
+        if self.pyramid is not None and view:
+            level = self.pyramid.pick(view / self.pyramid.base_minutes, WINDOW)
+            count = min(WINDOW, -(-view // (level or self.pyramid.base_minutes)))
+        if (level, count) != (self.level, self.count): self.level, self.count = level, count; self._idx = None
+
+    def _make_traces(self):
+        t = {'K': dict(type='candlestick', name="K線", increasing=dict(line=dict(color=UP)), decreasing=dict(line=dict(color=DOWN)), xaxis='x', yaxis='y')}
+        if self.show_hints:
+            t['bull'] = dict(type='scatter', mode='markers', name='轉強', marker=dict(symbol='triangle-up', size=10, color='#d90000'), xaxis='x', yaxis='y')
+            t['bear'] = dict(type='scatter', mode='markers', name='轉弱', marker=dict(symbol='triangle-down', size=10, color='#008000'), xaxis='x', yaxis='y')
+        for m, (color, width) in MA_STYLE.items():
+            t[m] = dict(type='scatter', name=m, line=dict(color=color, width=width), xaxis='x', yaxis='y')
+        t['buy'] = dict(type='scatter', mode='markers', name='買', marker=dict(symbol='triangle-up', size=12, color='red'), x=[], y=[], xaxis='x', yaxis='y')
+        t['sell'] = dict(type='scatter', mode='markers', name='賣', marker=dict(symbol='triangle-down', size=12, color='green'), x=[], y=[], xaxis='x', yaxis='y')
+        t['vol'] = dict(type='bar', name="量", marker=dict(), xaxis='x2', yaxis='y2')
+        t['hist'] = dict(type='bar', name="MACD", marker=dict(), xaxis='x3', yaxis='y3')
+        t['macd'] = dict(type='scatter', line=dict(color='#ffc107', width=1), xaxis='x3', yaxis='y3')
+        t['signal'] = dict(type='scatter', line=dict(color='#2196f3', width=1), xaxis='x3', yaxis='y3')
+        return t
+
+    # 只把視窗內的切片 (view，不複製) 換進 trace；同一根 K 棒重複呼叫直接回傳快取
+    def _shift(self, curr_idx):
+        if curr_idx == self._idx: return
+        if self.level: self._shift_level(curr_idx); return
+        s = slice(max(0, curr_idx - self.count + 1), curr_idx + 1)
+        ind = {k: v[s] for k, v in self.ma.items()}
+        ind.update(MACD=self.macd[s], Signal=self.signal[s], MACD_Hist=self.hist[s])
+        self._apply(curr_idx, self.x[s], self.o[s], self.h[s], self.l[s], self.c[s], self.vol[s], ind,
+                    self.vol_colors[s], self.hist_colors[s],
+                    (self.bull_y[s], self.bear_y[s]) if self.show_hints else None)
+
+    # 放大視野：從金字塔取粗 K 棒 (最後一根只彙總到目前這根)，K 棒數一樣固定在 WINDOW 以內
+    def _shift_level(self, curr_idx):
+        w = self.pyramid.window(self.level, curr_idx, self.count)
+        hints = None
+        if self.show_hints and "bull" in w:
+            hints = (np.where(w["bull"], w["l"] * 0.995, np.nan), np.where(w["bear"], w["h"] * 1.005, np.nan))
+        self._apply(curr_idx, w["x"], w["o"], w["h"], w["l"], w["c"], w["v"], w,
+                    np.where(w["o"] < w["c"], UP, DOWN), np.where(w["MACD_Hist"] > 0, UP, DOWN), hints)
+
+    def _apply(self, curr_idx, x, o, h, l, c, vol, ind, vol_colors, hist_colors, hints):
+        t = self._traces
+        t['K'].update(x=x, open=o, high=h, low=l, close=c)
+        if self.show_hints:
+            bull_y, bear_y = hints if hints is not None else ([], [])
+            t['bull'].update(x=x, y=bull_y); t['bear'].update(x=x, y=bear_y)
+        for m in MA_STYLE: t[m].update(x=x, y=ind[m])
+        t['vol'].update(x=x, y=vol); t['vol']['marker']['color'] = vol_colors
+        t['hist'].update(x=x, y=ind['MACD_Hist']); t['hist']['marker']['color'] = hist_colors
+        t['macd'].update(x=x, y=ind['MACD']); t['signal'].update(x=x, y=ind['Signal'])
+        self._idx = curr_idx
+        self._lo = int(x[0]) if len(x) else 0
+        self._trade_key = None   # 視窗移動後買賣點要重新篩
+
+    # 買賣點由帳本做二分搜尋取出，只有視窗移動或有新成交時才重查
+    def _set_trades(self, ledger, curr_idx):
+        key = (ledger.n_fills, ledger.round_start, curr_idx)
+        if key == self._trade_key: return
+        bx, by, sx, sy = ledger.markers(self._lo, curr_idx)
+        self._traces['buy'].update(x=bx, y=by); self._traces['sell'].update(x=sx, y=sy)
+        self._trade_key = key
+
+    def figure(self, curr_idx, ledger, title):
+        with span("chart.build"):
+            self._shift(curr_idx)
+            self._set_trades(ledger, curr_idx)
+            self.fig["layout"]["title"] = dict(self.fig["layout"]["title"], text=title)
+        return self.fig
+
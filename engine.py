@@ -0,0 +1,162 @@
+# --- 無介面模擬引擎 ---
+# 不經過 Streamlit，直接用 Ledger 重播回合：三關制、斷頭、綜合戰力都和遊戲相同。
+# 可以跑內建策略，並用 process pool 一次模擬上千場，拿來校正戰力公式與選股條件。
+#
+#   python engine.py --games 2000 --strategy signal --workers 4 --source synthetic
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from indicators import prepare_frames
+from ledger import Ledger, INITIAL_CAPITAL, power_score, risk_stats
+from rounds import pick_start   # 開局起點和遊戲相同
+
+ROUNDS = 3
+ROUND_BARS = 100   # 每關模擬的 K 棒數 (玩家平均大約玩這麼久才結算)
+LOT = 1000
+
+
+# --- 內建策略 ---
+# 策略介面：strategy(bars, i, ledger, rng) -> ("buy" | "sell", 股數) 或 None
+def signal_strategy(bars, i, ledger, rng):
+    if bars["Signal_Bull"][i] and ledger.position <= 0: return "buy", LOT * 5 + max(0, -ledger.position)
+    if bars["Signal_Bear"][i] and ledger.position >= 0: return "sell", LOT * 5 + max(0, ledger.position)
+    return None
+
+
+def random_strategy(bars, i, ledger, rng):
+    if rng.random() < 0.05: return rng.choice(["buy", "sell"]), LOT * rng.randint(1, 10)
+    return None
+
+
+def hold_strategy(bars, i, ledger, rng):
+    if ledger.position == 0 and ledger.n_fills == ledger.round_start:
+        return "buy", int(ledger.balance // bars["Close"][i] // LOT) * LOT or None
+    return None
+
+
+STRATEGIES = {"signal": signal_strategy, "random": random_strategy, "hold": hold_strategy}
+
+
+def frame_arrays(df):
+    return {c: df[c].to_numpy() for c in ("Close", "Signal_Bull", "Signal_Bear")}
+
+
+# 一關：從 start 開始逐根 K 棒交給策略，權益 <= 0 就斷頭；回傳 (權益, 是否斷頭, 最後一根)
+def play_round(bars, start, ledger, strategy, rng, n_bars=ROUND_BARS):
+    close = bars["Close"]
+    end = min(start + n_bars, len(close) - 1)
+    equity = ledger.equity(close[start])
+    for i in range(start, end + 1):
+        act = strategy(bars, i, ledger, rng)
+        if act and act[1]: ledger.execute(act[0], close[i], act[1], i)
+        equity = ledger.equity(close[i])
+        if equity <= 0: return equity, True, i
+    return equity, False, end
+
+
+# 一場三關；回合資料 rounds = [(ticker, bars, start), ...]
+def play_game(rounds, strategy, rng, n_bars=ROUND_BARS):
+    ledger = Ledger(INITIAL_CAPITAL)
+    equity = INITIAL_CAPITAL
+    curves = []
+    for r, (ticker, bars, start) in enumerate(rounds, start=1):
+        if r > 1: ledger.new_round(equity, r)
+        equity, bankrupt, last = play_round(bars, start, ledger, strategy, rng, n_bars)
+        curves.append(ledger.equity_curve(bars["Close"], start, last))
+        if bankrupt:
+            return {"rounds": r, "bankrupt": True, "equity": 0.0, "roi": -100.0, "sniper": ledger.avg_return(),
+                    "power": power_score(ledger.avg_return(), -100.0, 0), "trades": ledger.n_fills, **risk_stats(np.concatenate(curves))}
+    roi = (equity - INITIAL_CAPITAL) / INITIAL_CAPITAL * 100
+    risk = risk_stats(np.concatenate(curves))
+    return {"rounds": len(rounds), "bankrupt": False, "equity": equity, "roi": roi, "sniper": ledger.avg_return(),
+            "power": power_score(ledger.avg_return(), roi, equity, risk), "trades": ledger.n_fills, **risk}
+
+
+# --- process pool ---
+_FRAMES = {}
+
+
+def _init_worker(source, filters):
+    import market_data
+    provider = market_data.make_provider(source)
+    raw = {}
+    for t in market_data.HOT_STOCKS_MAP:
+        try: raw[t] = provider.fetch(t, "60d", "5m")
+        except Exception: pass
+    stats = market_data.screen_frames(raw, **filters)
+    eligible = list(stats.index[stats["eligible"]])
+    for t, df in zip(eligible, prepare_frames([raw[t] for t in eligible])):   # 合格的全部一次批次算指標
+        if len(df) >= 200: _FRAMES[t] = frame_arrays(df)
+
+
+def _run_games(args):
+    game_ids, strategy_name, seed, n_bars = args
+    strategy = STRATEGIES[strategy_name]
+    tickers = sorted(_FRAMES)
+    out = []
+    for g in game_ids:
+        rng = random.Random(seed * 1000003 + g)   # 每場都可重現
+        if not tickers: break
+        rounds = []
+        for _ in range(ROUNDS):
+            t = rng.choice(tickers); bars = _FRAMES[t]
+            rounds.append((t, bars, pick_start(len(bars["Close"]), rng)))
+        res = play_game(rounds, strategy, rng, n_bars)
+        res.update(game=g, tickers=",".join(r[0] for r in rounds))
+        out.append(res)
+    return out
+
+
+def run_batch(n_games, strategy="signal", workers=None, seed=0, source="synthetic", filters=None, n_bars=ROUND_BARS, chunk=100):
+    workers = workers or os.cpu_count() or 1
+    tasks = [(list(range(i, min(i + chunk, n_games))), strategy, seed, n_bars) for i in range(0, n_games, chunk)]
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(source, filters or {})) as pool:
+        for part in pool.map(_run_games, tasks): rows.extend(part)
+    return pd.DataFrame(rows)
+
+
+def summarize(df):
+    return {
+        "games": len(df),
+        "bankrupt_rate": float(df["bankrupt"].mean()) if len(df) else 0.0,
+        "roi_mean": float(df["roi"].mean()) if len(df) else 0.0,
+        "power_p10": float(np.percentile(df["power"], 10)) if len(df) else 0.0,
+        "power_p50": float(np.percentile(df["power"], 50)) if len(df) else 0.0,
+        "power_p90": float(np.percentile(df["power"], 90)) if len(df) else 0.0,
+        "trades_mean": float(df["trades"].mean()) if len(df) else 0.0,
+        "max_dd_p50": float(df["max_drawdown"].median()) if len(df) else 0.0,
+        "sharpe_p50": float(df["sharpe"].median()) if len(df) else 0.0,
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description="交易挑戰賽 headless 模擬")
+    p.add_argument("--games", type=int, default=1000)
+    p.add_argument("--strategy", choices=sorted(STRATEGIES), default="signal")
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--source", default="synthetic", help="yfinance / local / synthetic")
+    p.add_argument("--bars", type=int, default=ROUND_BARS, help="每關模擬幾根 K 棒")
+    p.add_argument("--max-price", type=float, default=None)
+    p.add_argument("--min-fluct-mean", type=float, default=None)
+    p.add_argument("--min-fluct-max", type=float, default=None)
+    p.add_argument("--out", default=None, help="逐場結果輸出 CSV")
+    a = p.parse_args()
+    filters = {k: v for k, v in (("max_price", a.max_price), ("min_fluct_mean", a.min_fluct_mean), ("min_fluct_max", a.min_fluct_max)) if v is not None}
+    t0 = time.perf_counter()
+    df = run_batch(a.games, a.strategy, a.workers, a.seed, a.source, filters, a.bars)
+    elapsed = time.perf_counter() - t0
+    if a.out: df.to_csv(a.out, index=False)
+    for k, v in summarize(df).items(): print(f"{k:>14}: {v:.4f}" if isinstance(v, float) else f"{k:>14}: {v}")
+    print(f"{'elapsed_s':>14}: {elapsed:.2f} ({len(df) / elapsed:.0f} games/s)")
+
+
+if __name__ == "__main__":
+    main()
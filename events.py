@@ -0,0 +1,128 @@
+# --- 事件寫入器 (流量 / 回饋 / 成績) ---
+# 各 session 只把事件丟進佇列，由背景執行緒批次寫出；
+# CSV 寫入時加跨 process 檔案鎖，可選 fsync 與檔案大小輪替。
+import atexit
+import csv
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from tracing import span
+
+try:
+    import fcntl
+except ImportError:   # Windows 沒有 fcntl，退回只靠單一 process 內的鎖
+    fcntl = None
+
+FLUSH_INTERVAL = 1.0
+MAX_QUEUE = 100000
+ROTATE_BYTES = 50 * 1024 * 1024
+
+
+class CsvSink:
+    def __init__(self, path, header, fsync=False, rotate_bytes=ROTATE_BYTES):
+        self.path = path
+        self.header = header
+        self.fsync = fsync
+        self.rotate_bytes = rotate_bytes
+
+    def _rotate(self):
+        if self.rotate_bytes and os.path.exists(self.path) and os.path.getsize(self.path) >= self.rotate_bytes:
+            root, ext = os.path.splitext(self.path)
+            os.replace(self.path, f"{root}.{time.strftime('%Y%m%d%H%M%S')}{ext}")
+
+    def write(self, rows):
+        with open(self.path + ".lock", "a") as lock:
+            if fcntl: fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._rotate()
+                new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+                with open(self.path, "a", encoding="utf-8", newline="") as f:
+                    w = csv.writer(f)
+                    if new: w.writerow(self.header)
+                    w.writerows([[r.get(h, "") for h in self.header] for r in rows])
+                    f.flush()
+                    if self.fsync: os.fsync(f.fileno())
+            finally:
+                if fcntl: fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class EventWriter:
+    def __init__(self, flush_interval=FLUSH_INTERVAL, max_queue=MAX_QUEUE):
+        self.flush_interval = flush_interval
+        self.sinks = {}
+        self.listeners = {}
+        self._q = queue.Queue(maxsize=max_queue)
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._setup = set()
+        self._setup_lock = threading.Lock()
+        self.stats = {"enqueued": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0, "listener_errors": 0}
+
+    # sink 可以是 CsvSink 或任何接受 rows 清單的函式
+    def register(self, stream, sink):
+        self.sinks[stream] = sink.write if hasattr(sink, "write") else sink
+
+    # 註冊 sink / listener、補算統計這類每個 process 只要做一次的設定；頁面每次重跑都會呼叫，只有第一次真的執行
+    def setup_once(self, name, fn):
+        with self._setup_lock:
+            if name in self._setup: return False
+            fn()   # 失敗就不記下來，下次重跑再試
+            self._setup.add(name)
+        return True
+
+    # 寫成功之後通知 listener (例如後台統計)，同名重複註冊會覆蓋
+    def listen(self, name, fn):
+        self.listeners[name] = fn
+
+    # sync=True 時在呼叫端當場寫出 (連同佇列裡其他事件)，寫完才回傳，給寫入後馬上要讀的地方用
+    def emit(self, stream, row, sync=False):
+        self._start()
+        try:
+            self._q.put_nowait((stream, row))
+            self.stats["enqueued"] += 1
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return False
+        if sync: self.flush()
+        return True
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    # 把目前佇列整批取出，同一個 stream 一次寫完
+    def flush(self):
+        with self._flush_lock:
+            batch = defaultdict(list)
+            while True:
+                try: stream, row = self._q.get_nowait()
+                except queue.Empty: break
+                batch[stream].append(row)
+            for stream, rows in batch.items():
+                sink = self.sinks.get(stream)
+                try:
+                    if sink is None: raise KeyError(stream)
+                    with span(f"events.write.{stream}"): sink(rows)
+                    self.stats["written"] += len(rows); self.stats["batches"] += 1
+                except Exception:
+                    self.stats["failed"] += len(rows)
+                    continue
+                for fn in list(self.listeners.values()):
+                    try: fn(stream, rows)
+                    except Exception: self.stats["listener_errors"] += 1
+
+    def pending(self):
+        return self._q.qsize()
+
+
+WRITER = EventWriter()
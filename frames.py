@@ -0,0 +1,147 @@
+# --- 共用 K 棒資料 (跨 session 唯讀) ---
+# 同一檔、同一版本的整理後資料整個 process 只存一份：價格/指標欄位 float32、成交量 int64、訊號欄位 bool。
+# session 只拿參考加上自己的 step / 起點；沒有 session 在用的資料由弱參考自動回收，
+# 另外保留最近用過的幾份強參考，避免熱門股被反覆重算。
+# MA240 與訊號欄位不放進共用資料，第一次有人要時才算，另外存一份陣列 (lazy)。
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+from indicators import LAZY_COLUMNS, lazy_columns, prepare_frame, prepare_frames, source_close
+from market_data import MARKET_CACHE
+from pyramid import Pyramid
+from tracing import span
+
+KEEP_RECENT = 8   # 沒人用也先留著的份數
+
+
+# 成交量不進 float32 (大量時 24 位元尾數會失真)，一律存成 int64
+def compact_frame(df):
+    out = df.copy()
+    for c in out.columns:
+        if c == "Volume": out[c] = out[c].fillna(0).round().astype(np.int64)
+        elif out[c].dtype == np.float64: out[c] = out[c].astype(np.float32)
+        elif out[c].dtype == np.int64: out[c] = out[c].astype(np.int32)
+    return out
+
+
+class FrameStore:
+    def __init__(self, cache=None, keep_recent=KEEP_RECENT):
+        self.cache = cache or MARKET_CACHE
+        self.keep_recent = keep_recent
+        self._frames = weakref.WeakValueDictionary()   # (ticker, period, interval, version) -> DataFrame
+        self._recent = OrderedDict()
+        self._building = {}
+        self._pyramids = {}   # id(frame) -> Pyramid，資料被回收時一起刪
+        self._sources = {}    # id(frame) -> 含暖機期的收盤價 (float64)，補算延後欄位用
+        self._lazy = {}       # id(frame) -> 延後欄位 {MA240, Signal_Bull, Signal_Bear}
+        self._warm = {}       # (period, interval) -> 合格名單批次整理好的資料 (強參考，名單換新時整批替換)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "builds": 0, "lazy_builds": 0}
+
+    # 回傳共用的整理後資料 (不含 LAZY_COLUMNS，要用時呼叫 lazy)；呼叫端只能讀，不可以改欄位
+    def get(self, ticker, period="60d", interval="5m"):
+        version, raw = self.cache.get_versioned(ticker, period, interval)
+        key = (ticker, period, interval, version)
+        with self._lock:
+            df = self._frames.get(key)
+            if df is not None:
+                self.stats["hits"] += 1
+                self._touch(key, df)
+                return df
+            building = self._building.get(key)
+            if building is None: building = self._building[key] = threading.Lock()
+        with building:   # 同一份資料只算一次，其他 session 等結果
+            with self._lock:
+                df = self._frames.get(key)
+                if df is not None:
+                    self.stats["hits"] += 1
+                    self._touch(key, df)
+                    return df
+            with span("indicators"): df = compact_frame(prepare_frame(raw, lazy=True))
+            with self._lock:
+                done = self._frames.get(key) # 可能已經由批次整理放進來
+                if done is not None: df = done
+                else: self._frames[key] = df; self._adopt(df, raw)
+                self._touch(key, df)
+                self._building.pop(key, None)
+                self.stats["builds"] += 1
+        return df
+
+    # 合格名單換新時呼叫：還沒整理過的檔案用一次批次指標計算全部整理好，之後開局直接命中
+    def warm(self, tickers, period="60d", interval="5m"):
+        raws = {}
+        for t in tickers:
+            try: version, raw = self.cache.get_versioned(t, period, interval)
+            except Exception: continue
+            raws[(t, period, interval, version)] = raw
+        with self._lock: todo = [k for k in raws if self._frames.get(k) is None and k not in self._building]
+        built = []
+        if todo:
+            with span("indicators.batch"): built = [compact_frame(df) for df in prepare_frames([raws[k] for k in todo], lazy=True)]
+        with self._lock:
+            for key, df in zip(todo, built):
+                if self._frames.get(key) is None: self._frames[key] = df; self._adopt(df, raws[key])
+            # 整份名單目前版本的資料都留強參考，沒人在玩也不會被回收
+            self._warm[(period, interval)] = [df for df in (self._frames.get(k) for k in raws) if df is not None]
+            self.stats["builds"] += len(built)
+        return len(built)
+
+    # 記下補算延後欄位要用的收盤價 (呼叫端持有 _lock)，資料被回收時一起刪
+    def _adopt(self, df, raw):
+        self._sources[id(df)] = source_close(raw)
+        weakref.finalize(df, self._forget, id(df))
+
+    def _forget(self, key):   # 回收時可能正拿著 _lock，這裡不再拿鎖 (dict.pop 本身是原子的)
+        self._sources.pop(key, None); self._lazy.pop(key, None)
+
+    # MA240 與轉強/轉弱訊號 (唯讀陣列，和資料逐列對齊)：第一次有人要 (圖表、提示、成交紀錄) 才算，同一份資料只算一次
+    def lazy(self, df):
+        with self._lock:
+            cols = self._lazy.get(id(df)); src = self._sources.get(id(df))
+        if cols is not None: return cols
+        if src is None:   # 不是這裡整理的資料：本來就含完整欄位就直接用，否則只能用自己的收盤價算 (前面暖機期是 NaN)
+            if all(c in df.columns for c in LAZY_COLUMNS): return {c: df[c].to_numpy() for c in LAZY_COLUMNS}
+            src = df["Close"].to_numpy(dtype=np.float64)
+        with span("indicators.lazy"): cols = lazy_columns(src, len(df))
+        cols = {k: v.astype(np.float32) if v.dtype == np.float64 else v for k, v in cols.items()}
+        for v in cols.values(): v.flags.writeable = False
+        with self._lock:
+            if id(df) in self._sources: cols = self._lazy.setdefault(id(df), cols)
+            self.stats["lazy_builds"] += 1
+        return cols
+
+    # 多解析度金字塔跟著共用資料走，第一次放大視野時才建，同一份資料只建一次
+    def pyramid(self, df):
+        with self._lock: p = self._pyramids.get(id(df))
+        if p is not None: return p
+        p = Pyramid(df, extra=self.lazy(df))
+        with self._lock:
+            if id(df) not in self._pyramids:
+                self._pyramids[id(df)] = p
+                weakref.finalize(df, self._pyramids.pop, id(df), None)
+            return self._pyramids[id(df)]
+
+    # 共用資料的 (ticker, period, interval, version)，快照記下版本用
+    def key_of(self, df):
+        with self._lock:
+            for key, v in self._frames.items():
+                if v is df: return key
+        return None
+
+    def _touch(self, key, df):
+        self._recent[key] = df
+        self._recent.move_to_end(key)
+        while len(self._recent) > self.keep_recent: self._recent.popitem(last=False)
+
+    def live(self):
+        return len(self._frames)
+
+    def nbytes(self):
+        with self._lock: frames = list(self._frames.values())
+        return int(sum(df.memory_usage(index=True).sum() for df in frames))
+
+
+FRAMES = FrameStore()
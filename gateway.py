@@ -0,0 +1,152 @@
+# --- 下載閘道 (Yahoo 保護) ---
+# 所有實際下載都經過這裡：
+#   * 同一個 (ticker, period, interval) 同時只有一個下載在跑，其他人等同一份結果 (single-flight)
+#   * 全域 token bucket 限制每秒下載數，避免被 Yahoo 限流
+#   * 單次下載失敗以指數退避 (加抖動) 重試
+#   * 每檔各自的熔斷器：連續失敗達門檻就冷卻一段時間 (每多失敗一次加倍)，冷卻中直接拒絕不連網
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+RATE = 4.0            # 每秒可開始幾個下載
+BURST = 16            # 一次最多連續幾個
+MAX_WAIT = 10.0       # 排隊等 token 最多幾秒
+RETRIES = 2           # 單次呼叫內再重試幾次
+BACKOFF = 0.5         # 重試退避起始秒數
+FAIL_THRESHOLD = 3    # 連續失敗幾次就熔斷
+COOLDOWN = 30.0       # 熔斷冷卻起始秒數
+MAX_COOLDOWN = 15 * 60
+LATENCY_SAMPLES = 1000
+
+
+class DownloadError(RuntimeError):
+    pass
+
+
+class CircuitOpen(DownloadError):
+    pass
+
+
+class RateLimited(DownloadError):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate=RATE, burst=BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._t = time.monotonic()
+        self._lock = threading.Lock()
+
+    # 取一個 token，最多等 max_wait 秒；回傳等了多久，等不到回傳 None
+    def acquire(self, max_wait=MAX_WAIT):
+        deadline = time.monotonic() + max_wait
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._t) * self.rate)
+                self._t = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                need = (1 - self._tokens) / self.rate
+            if now + need > deadline: return None
+            time.sleep(need); waited += need
+
+
+class DownloadGateway:
+    def __init__(self, fetcher, rate=RATE, burst=BURST, retries=RETRIES, backoff=BACKOFF,
+                 fail_threshold=FAIL_THRESHOLD, cooldown=COOLDOWN, max_cooldown=MAX_COOLDOWN, max_wait=MAX_WAIT):
+        self.fetcher = fetcher
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.retries = retries
+        self.backoff = backoff
+        self.fail_threshold = fail_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_wait = max_wait
+        self._inflight = {}    # key -> Future
+        self._breakers = {}    # ticker -> [連續失敗次數, 冷卻到何時]
+        self._latency = deque(maxlen=LATENCY_SAMPLES)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "downloads": 0, "coalesced": 0, "failures": 0, "retries": 0,
+                      "rejected": 0, "throttled": 0, "throttle_wait_s": 0.0}
+
+    def fetch(self, ticker, period="60d", interval="5m"):
+        key = (ticker, period, interval)
+        with self._lock:
+            self.stats["requests"] += 1
+            br = self._breakers.get(ticker)
+            if br is not None and time.time() < br[1]:
+                self.stats["rejected"] += 1
+                raise CircuitOpen(f"{ticker} cooling down for {br[1] - time.time():.0f}s after {br[0]} failures")
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader: fut = self._inflight[key] = Future()
+            else: self.stats["coalesced"] += 1
+        if not leader: return fut.result()
+        try:
+            df = self._download(key)
+            fut.set_result(df)
+            return df
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._lock: self._inflight.pop(key, None)
+
+    def _download(self, key):
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            if self.bucket is not None:
+                waited = self.bucket.acquire(self.max_wait)
+                if waited is None:
+                    self.stats["throttled"] += 1
+                    raise RateLimited(f"rate limit: no download slot for {key[0]} within {self.max_wait}s")
+                if waited: self.stats["throttled"] += 1; self.stats["throttle_wait_s"] += waited
+            t0 = time.perf_counter()
+            try:
+                df = self.fetcher(*key)
+                if df is None or df.empty: raise DownloadError(f"no data for {key[0]}")
+            except Exception as e:
+                if attempt < self.retries:
+                    self.stats["retries"] += 1
+                    time.sleep(delay * (0.5 + random.random()))   # 抖動，避免大家同時重試
+                    delay *= 2
+                    continue
+                self._failed(key[0])
+                if isinstance(e, DownloadError): raise
+                raise DownloadError(f"{key[0]}: {e!r}") from e   # 呼叫端只需要接 DownloadError
+            finally:
+                self._latency.append((time.perf_counter() - t0) * 1000)
+            self._succeeded(key[0])
+            return df
+
+    def _failed(self, ticker):
+        with self._lock:
+            self.stats["failures"] += 1
+            br = self._breakers.setdefault(ticker, [0, 0.0])
+            br[0] += 1
+            if br[0] >= self.fail_threshold:
+                br[1] = time.time() + min(self.cooldown * 2 ** (br[0] - self.fail_threshold), self.max_cooldown)
+
+    def _succeeded(self, ticker):
+        with self._lock:
+            self.stats["downloads"] += 1
+            self._breakers.pop(ticker, None)
+
+    # 目前熔斷中的檔案：{ticker: (失敗次數, 剩餘秒數)}
+    def open_circuits(self):
+        now = time.time()
+        with self._lock: return {t: (n, until - now) for t, (n, until) in self._breakers.items() if until > now}
+
+    def latency(self):
+        with self._lock: a = np.array(self._latency)
+        if not len(a): return {"p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+        return {"p50_ms": float(np.percentile(a, 50)), "p95_ms": float(np.percentile(a, 95)), "max_ms": float(a.max())}
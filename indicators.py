@@ -0,0 +1,181 @@
+# --- 技術指標引擎 ---
+# 全部用連續的 NumPy 陣列計算；批次版本一次處理多檔 (每列一檔)，
+# 合格名單換新時用來把整份名單一次整理好；串流版本每根 K 棒 O(1) 更新。
+# MA240 與轉強/轉弱訊號只有圖表、提示和成交紀錄用得到，共用資料可以先不算 (lazy)，第一次用到再補。
+from collections import deque
+
+import numpy as np
+
+MA_WINDOWS = (5, 22, 60, 240)
+LAZY_WINDOWS = (240,)
+WARMUP = max(MA_WINDOWS) - 1   # 開局前丟掉的暖機根數 (最長的均線算得出來才開始)
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+EMA_BLOCK = 64   # 分段閉式解的區塊長度，太長會有數值誤差
+COLUMNS = [f"MA{w}" for w in MA_WINDOWS] + ["MA22_Slope", "MACD", "Signal", "MACD_Hist"]
+SIGNAL_COLUMNS = ["Signal_Bull", "Signal_Bear"]
+LAZY_COLUMNS = [f"MA{w}" for w in LAZY_WINDOWS] + SIGNAL_COLUMNS
+
+
+def _as_2d(x):
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    return (x[None, :], True) if x.ndim == 1 else (x, False)
+
+
+# 滑動平均：cumsum 相減，前 w-1 根為 NaN (與 pandas rolling 一致)
+def rolling_mean(x, w):
+    x2, squeeze = _as_2d(x)
+    out = np.full_like(x2, np.nan)
+    if x2.shape[1] >= w:
+        c = np.cumsum(x2, axis=1)
+        out[:, w - 1:] = c[:, w - 1:]
+        out[:, w:] -= c[:, :-w]
+        out[:, w - 1:] /= w
+    return out[0] if squeeze else out
+
+
+# EMA (adjust=False)：y[t] = a*x[t] + (1-a)*y[t-1]
+# 每個區塊內用閉式解 y[k] = d^(k+1)*y0 + a*d^k*cumsum(x[j]*d^-j)，只剩 n/EMA_BLOCK 次 Python 迴圈
+def ema(x, span):
+    x2, squeeze = _as_2d(x)
+    a = 2.0 / (span + 1); d = 1.0 - a
+    n = x2.shape[1]
+    out = np.empty_like(x2)
+    if n == 0: return out[0] if squeeze else out
+    k = np.arange(EMA_BLOCK, dtype=np.float64)
+    dk = d ** k; dinv = d ** -k; dk1 = dk * d
+    prev = x2[:, 0].copy()
+    out[:, 0] = prev
+    start = 1
+    while start < n:
+        stop = min(start + EMA_BLOCK, n); m = stop - start
+        blk = a * dk[:m] * np.cumsum(x2[:, start:stop] * dinv[:m], axis=1)
+        out[:, start:stop] = dk1[:m] * prev[:, None] + blk
+        prev = out[:, stop - 1]
+        start = stop
+    return out[0] if squeeze else out
+
+
+def _shift1(x):
+    out = np.empty_like(x); out[..., 0] = np.nan; out[..., 1:] = x[..., :-1]
+    return out
+
+
+def compute(close, signals=True, windows=MA_WINDOWS):
+    close, squeeze = _as_2d(close)
+    res = {f"MA{w}": rolling_mean(close, w) for w in windows}
+    slope = np.full_like(close, np.nan); slope[:, 1:] = np.diff(res["MA22"], axis=1)
+    res["MA22_Slope"] = slope
+    macd = ema(close, MACD_FAST) - ema(close, MACD_SLOW)
+    res["MACD"] = macd
+    res["Signal"] = ema(macd, MACD_SIGNAL)
+    res["MACD_Hist"] = macd - res["Signal"]
+    if signals: res.update(compute_signals(res))
+    return {k: v[0] for k, v in res.items()} if squeeze else res
+
+
+# NaN 比較一律為 False，和 pandas 版本行為相同
+def compute_signals(res):
+    hist = res["MACD_Hist"]; prev = _shift1(hist)
+    with np.errstate(invalid="ignore"):
+        bull = (res["MA5"] > res["MA22"]) & (res["MA22_Slope"] > 0) & (hist > 0) & (hist > prev)
+        bear = (res["MA5"] < res["MA22"]) & (res["MA22_Slope"] < 0) & (hist < 0) & (hist < prev)
+    return {"Signal_Bull": bull, "Signal_Bear": bear}
+
+
+# 多檔一次算：長度不同時靠右對齊，左側補第一筆價格，算完再把不完整的部分設為 NaN
+def compute_batch(closes, signals=True, windows=MA_WINDOWS):
+    closes = [np.asarray(c, dtype=np.float64) for c in closes]
+    n = max((len(c) for c in closes), default=0)
+    mat = np.empty((len(closes), n), dtype=np.float64)
+    pads = np.array([n - len(c) for c in closes])
+    for i, c in enumerate(closes):
+        mat[i, pads[i]:] = c
+        mat[i, :pads[i]] = c[0] if len(c) else np.nan
+    res = compute(mat, signals=False, windows=windows)
+    t = np.arange(n)[None, :]
+    for w in windows:
+        res[f"MA{w}"][t < pads[:, None] + w - 1] = np.nan
+    res["MA22_Slope"][t < pads[:, None] + 22] = np.nan
+    if signals: res.update(compute_signals(res))
+    return [{k: v[i, pads[i]:] for k, v in res.items()} for i in range(len(closes))]
+
+
+def calculate_technical_indicators(df, signals=True, windows=MA_WINDOWS):
+    try:
+        res = compute(df['Close'].to_numpy(dtype=np.float64), signals=signals, windows=windows)
+        for k, v in res.items(): df[k] = v
+        return df
+    except: return df
+
+
+# 暖機期明確切掉 (不靠 MA240 的 NaN)，lazy 時沒有 MA240 欄位，留下的 K 棒也一樣
+def _finish_frame(df):
+    df = df.iloc[WARMUP:].dropna()
+    df.reset_index(inplace=True); df['Bar_Index'] = range(len(df))
+    return df
+
+
+def _windows(lazy):
+    return tuple(w for w in MA_WINDOWS if w not in LAZY_WINDOWS) if lazy else MA_WINDOWS
+
+
+# 開局前的資料整理：去掉零量 K 棒、算指標、丟掉暖機期、加上 Bar_Index
+# lazy=True 時不算 LAZY_COLUMNS，之後用 lazy_columns(source_close(原始資料), len(df)) 補
+def prepare_frame(df, lazy=False):
+    df = df[df['Volume'] > 0].copy()
+    return _finish_frame(calculate_technical_indicators(df, signals=not lazy, windows=_windows(lazy)))
+
+
+# 同上，多檔一次算 (compute_batch)，結果和逐檔 prepare_frame 相同
+def prepare_frames(dfs, lazy=False):
+    dfs = [df[df['Volume'] > 0].copy() for df in dfs]
+    closes = [df['Close'].to_numpy(dtype=np.float64) for df in dfs]
+    for df, res in zip(dfs, compute_batch(closes, signals=not lazy, windows=_windows(lazy))):
+        for k, v in res.items(): df[k] = v
+    return [_finish_frame(df) for df in dfs]
+
+
+# 延後欄位的來源：去掉零量 K 棒、還沒切掉暖機期的收盤價
+def source_close(df):
+    return df.loc[df['Volume'] > 0, 'Close'].to_numpy(dtype=np.float64)
+
+
+# 延後計算的欄位 (MA240 + 訊號)：用含暖機期的完整收盤價算，取最後 n 根對齊整理好的資料，
+# 和一開始就全部算的結果完全相同
+def lazy_columns(close, n):
+    res = compute(close, windows=(5, 22) + LAZY_WINDOWS)
+    return {k: res[k][len(res[k]) - n:] for k in LAZY_COLUMNS}
+
+
+class IndicatorState:
+    # 串流版本：每進一根 K 棒 O(1) 更新全部指標，輸出和批次版本相同
+    def __init__(self):
+        self._buf = {w: deque() for w in MA_WINDOWS}
+        self._sum = {w: 0.0 for w in MA_WINDOWS}
+        self._ema = {}
+        self._prev_ma22 = np.nan
+        self._prev_hist = np.nan
+
+    def _ema_step(self, key, x, span):
+        prev = self._ema.get(key)
+        y = x if prev is None else prev + 2.0 / (span + 1) * (x - prev)
+        self._ema[key] = y
+        return y
+
+    def update(self, close):
+        close = float(close)
+        out = {}
+        for w in MA_WINDOWS:
+            buf = self._buf[w]; buf.append(close); self._sum[w] += close
+            if len(buf) > w: self._sum[w] -= buf.popleft()
+            out[f"MA{w}"] = self._sum[w] / w if len(buf) == w else np.nan
+        out["MA22_Slope"] = out["MA22"] - self._prev_ma22
+        self._prev_ma22 = out["MA22"]
+        macd = self._ema_step("fast", close, MACD_FAST) - self._ema_step("slow", close, MACD_SLOW)
+        sig = self._ema_step("signal", macd, MACD_SIGNAL)
+        hist = macd - sig
+        out.update(MACD=macd, Signal=sig, MACD_Hist=hist)
+        prev, self._prev_hist = self._prev_hist, hist
+        out["Signal_Bull"] = bool(out["MA5"] > out["MA22"] and out["MA22_Slope"] > 0 and hist > 0 and hist > prev)
+        out["Signal_Bear"] = bool(out["MA5"] < out["MA22"] and out["MA22_Slope"] < 0 and hist < 0 and hist < prev)
+        return out
@@ -0,0 +1,145 @@
+# --- 英雄榜 (SQLite, WAL) ---
+# 綜合戰力與日期都有索引：前 N 名分頁不需要整表排序。
+# 排名查詢靠兩層戰力直方圖 (每 1 分、每 100 分一格) 加總筆數，由 trigger 在寫入時同步更新，
+# 不論名次高低都只掃固定數量的格子，不必逐筆數過比自己高的紀錄。
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+DB_PATH = os.environ.get("GAME_LEADERBOARD_DB", "leaderboard_tw_v4.db")
+CSV_PATH = "leaderboard_tw_v4.csv"
+PAGE_SIZE = 50
+HIST_OFFSET = 1 << 20   # 戰力加上這個位移再取整數當格子編號 (CAST 是往 0 截斷，不能有負數)
+HIST_COARSE = 100       # 粗格 = 細格 // 100
+
+# 資料庫欄位 -> 畫面欄位 (沿用原本 CSV 的中文欄名)
+COLUMNS = {"date": "日期", "player": "玩家", "stock": "股名", "power": "綜合戰力",
+           "sniper": "狙擊率(%)", "roi": "總報酬(%)", "profit": "總獲利($)"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL, player TEXT, stock TEXT,
+    power REAL NOT NULL, sniper REAL, roi REAL, profit INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_scores_power ON scores(power DESC);
+CREATE INDEX IF NOT EXISTS idx_scores_date ON scores(date);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS score_hist (level INTEGER NOT NULL, bucket INTEGER NOT NULL, n INTEGER NOT NULL, PRIMARY KEY (level, bucket));
+CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, n INTEGER NOT NULL);
+CREATE TRIGGER IF NOT EXISTS scores_hist_ins AFTER INSERT ON scores BEGIN
+    INSERT INTO score_hist VALUES (1, max(0, CAST(NEW.power + {off} AS INTEGER)), 1) ON CONFLICT (level, bucket) DO UPDATE SET n = n + 1;
+    INSERT INTO score_hist VALUES (2, max(0, CAST(NEW.power + {off} AS INTEGER)) / {coarse}, 1) ON CONFLICT (level, bucket) DO UPDATE SET n = n + 1;
+    UPDATE counters SET n = n + 1 WHERE key = 'scores';
+END;
+CREATE TRIGGER IF NOT EXISTS scores_hist_del AFTER DELETE ON scores BEGIN
+    UPDATE score_hist SET n = n - 1 WHERE level = 1 AND bucket = max(0, CAST(OLD.power + {off} AS INTEGER));
+    UPDATE score_hist SET n = n - 1 WHERE level = 2 AND bucket = max(0, CAST(OLD.power + {off} AS INTEGER)) / {coarse};
+    UPDATE counters SET n = n - 1 WHERE key = 'scores';
+END;
+"""
+
+
+class Leaderboard:
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._local = threading.local()   # sqlite 連線不能跨執行緒共用，每個執行緒一條
+        self.conn().executescript(SCHEMA.format(off=HIST_OFFSET, coarse=HIST_COARSE))
+        self._build_hist()
+
+    def conn(self):
+        c = getattr(self._local, "conn", None)
+        if c is None:
+            c = sqlite3.connect(self.path, timeout=10)
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = c
+        return c
+
+    def add(self, date, player, stock, power, sniper, roi, profit):
+        with self.conn() as c:
+            cur = c.execute("INSERT INTO scores (date, player, stock, power, sniper, roi, profit) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (date, player, stock, power, sniper, roi, profit))
+            return cur.lastrowid
+
+    # 事件寫入器批次寫入用，rows 為 dict (鍵同資料庫欄位)
+    def add_many(self, rows):
+        with self.conn() as c:
+            c.executemany("INSERT INTO scores (date, player, stock, power, sniper, roi, profit) VALUES (:date, :player, :stock, :power, :sniper, :roi, :profit)", rows)
+
+    # 舊資料庫第一次開啟時補建直方圖與總筆數；之後都由 trigger 維護
+    def _build_hist(self):
+        c = self.conn()
+        if c.execute("SELECT 1 FROM counters WHERE key = 'scores'").fetchone(): return
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            if not c.execute("SELECT 1 FROM counters WHERE key = 'scores'").fetchone():
+                c.execute("DELETE FROM score_hist")
+                c.execute("INSERT INTO score_hist SELECT 1, max(0, CAST(power + ? AS INTEGER)) AS b, COUNT(*) FROM scores GROUP BY b", (HIST_OFFSET,))
+                c.execute("INSERT INTO score_hist SELECT 2, bucket / ? AS b, SUM(n) FROM score_hist WHERE level = 1 GROUP BY b", (HIST_COARSE,))
+                c.execute("INSERT INTO counters VALUES ('scores', (SELECT COUNT(*) FROM scores))")
+            c.commit()
+        except Exception:
+            c.rollback(); raise
+
+    def count(self):
+        return self.conn().execute("SELECT n FROM counters WHERE key = 'scores'").fetchone()[0]
+
+    def top(self, n=PAGE_SIZE, page=0):
+        cur = self.conn().execute(f"SELECT {', '.join(COLUMNS)} FROM scores ORDER BY power DESC LIMIT ? OFFSET ?", (n, page * n))
+        df = pd.DataFrame(cur.fetchall(), columns=list(COLUMNS.values()))
+        df.index = range(page * n + 1, page * n + 1 + len(df))
+        return df
+
+    def since(self, date_prefix):
+        cur = self.conn().execute(f"SELECT {', '.join(COLUMNS)} FROM scores WHERE date >= ? ORDER BY date", (date_prefix,))
+        return pd.DataFrame(cur.fetchall(), columns=list(COLUMNS.values()))
+
+    # 名次 = 戰力比自己高的筆數 + 1
+    #   = 更高的粗格合計 + 同一粗格裡更高的細格合計 + 自己這一細格裡比自己高的筆數 (走 power 索引)
+    # 一個 SQL 敘述讀完，總筆數和名次來自同一個快照
+    def rank(self, power):
+        fine = max(0, int(power + HIST_OFFSET)); coarse = fine // HIST_COARSE
+        higher, total = self.conn().execute("""SELECT
+            (SELECT COALESCE(SUM(n), 0) FROM score_hist WHERE level = 2 AND bucket > ?)
+          + (SELECT COALESCE(SUM(n), 0) FROM score_hist WHERE level = 1 AND bucket > ? AND bucket < ?)
+          + (SELECT COUNT(*) FROM scores WHERE power > ? AND power < ?),
+            (SELECT n FROM counters WHERE key = 'scores')""",
+            (coarse, fine, (coarse + 1) * HIST_COARSE, power, fine + 1 - HIST_OFFSET)).fetchone()
+        pct = (higher + 1) / total * 100 if total else 100.0
+        return higher + 1, total, pct
+
+    # 舊的 CSV 只匯入一次，匯入紀錄寫在 meta 表；BEGIN IMMEDIATE 避免多個 process 重複匯入
+    def import_csv(self, csv_path=CSV_PATH):
+        if not os.path.exists(csv_path): return 0
+        df = pd.read_csv(csv_path).rename(columns={v: k for k, v in COLUMNS.items()})
+        df = df.reindex(columns=list(COLUMNS)).dropna(subset=["power"])
+        df["profit"] = pd.to_numeric(df["profit"], errors="coerce").round()
+        rows = [tuple(None if pd.isna(v) else v for v in r) for r in df.itertuples(index=False)]
+        c = self.conn()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            if c.execute("SELECT 1 FROM meta WHERE key = 'csv_imported'").fetchone():
+                c.rollback(); return 0
+            c.executemany("INSERT INTO scores (date, player, stock, power, sniper, roi, profit) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            c.execute("INSERT INTO meta (key, value) VALUES ('csv_imported', ?)", (csv_path,))
+            c.commit()
+        except Exception:
+            c.rollback(); raise
+        return len(rows)
+
+
+_BOARD = None
+_BOARD_LOCK = threading.Lock()
+
+
+def get_board():
+    global _BOARD
+    with _BOARD_LOCK:
+        if _BOARD is None:
+            _BOARD = Leaderboard()
+            try: _BOARD.import_csv()
+            except Exception: pass
+    return _BOARD
@@ -0,0 +1,207 @@
+# --- 交易帳本 ---
+# 純邏輯，不依賴 Streamlit：成交紀錄存成結構化 NumPy 陣列，
+# 權益 O(1) 計算、買賣點視窗查詢 O(log n)，交易紀錄文字需要時才產生。
+import numpy as np
+
+INITIAL_CAPITAL = 10000000.0
+FEE_RATE = 0.002
+
+BUY, SELL = 1, -1
+# 成交種類：開倉/加碼、平倉、反手
+OPEN, CLOSE, REVERSE = 0, 1, 2
+
+FILL_DTYPE = np.dtype([
+    ("index", "i8"), ("side", "i1"), ("kind", "i1"), ("round", "i2"),
+    ("qty", "i8"), ("price", "f8"), ("pnl", "f8"), ("roi", "f8"), ("fee", "f8"),   # fee：這筆實際扣掉的手續費
+    ("a", "f8"), ("pos", "i8"),   # 成交後的權益線 equity = a + pos * price，權益曲線用
+])
+RISK_WEIGHTS = {"max_drawdown": 0.0, "sharpe": 0.0}   # 風險項權重，0 = 不列入戰力
+
+
+class Ledger:
+    __slots__ = ("balance", "position", "avg_cost", "round", "round_start", "round_balance", "opened_at", "_fills", "_n")
+
+    def __init__(self, balance=INITIAL_CAPITAL, capacity=64):
+        self.balance = float(balance)
+        self.position = 0
+        self.avg_cost = 0.0
+        self.round = 1
+        self.round_start = 0        # 本關第一筆成交在 _fills 裡的位置
+        self.round_balance = self.balance   # 本關開始時的資金
+        self.opened_at = -1         # 目前部位從哪一根 K 棒開始持有 (算持有時間用)
+        self._fills = np.zeros(capacity, dtype=FILL_DTYPE)
+        self._n = 0
+
+    # 新的一關：部位歸零、帶入資金，成交紀錄保留 (戰力要算全部關卡的狙擊率)
+    def new_round(self, balance, round_no=None):
+        self.balance = float(balance)
+        self.position = 0
+        self.avg_cost = 0.0
+        self.opened_at = -1
+        self.round = self.round + 1 if round_no is None else round_no
+        self.round_start = self._n
+        self.round_balance = self.balance
+
+    # 本關重來：丟掉本關的成交，資金回到本關開始時
+    def restart_round(self):
+        self._n = self.round_start
+        self.new_round(self.round_balance, self.round)
+
+    def _record(self, index, side, kind, qty, price, pnl=0.0, roi=0.0, fee=0.0):
+        if self._n == len(self._fills):
+            grown = np.zeros(len(self._fills) * 2, dtype=FILL_DTYPE)
+            grown[:self._n] = self._fills
+            self._fills = grown
+        a, b = self.equity_line()
+        self._fills[self._n] = (index, side, kind, self.round, qty, price, pnl, roi, fee, a, b)
+        self._n += 1
+
+    # 規則與舊版 execute_trade 完全相同 (含手續費算法：平倉和反手各按整筆股數扣一次)；資金不足回傳 False
+    def execute(self, action, price, qty, index):
+        price = float(price); pos = self.position; avg = self.avg_cost
+        fee = price * qty * FEE_RATE
+        side = BUY if action == "buy" else SELL
+        if pos * side < 0:
+            close_qty = min(abs(pos), qty); remaining_qty = qty - close_qty
+            diff = avg - price if side == BUY else price - avg   # 不用乘 -side，打平時才不會出現 -0.00%
+            profit = diff * close_qty
+            trade_roi = diff / avg * 100
+            if side == BUY: self.balance += (avg * close_qty + profit - fee)
+            else: self.balance += (price * close_qty - fee)
+            self.position += close_qty * side
+            self._record(index, side, CLOSE, close_qty, price, profit, trade_roi, fee)
+            if remaining_qty > 0:
+                cost_new = price * remaining_qty
+                if self.balance >= cost_new:
+                    self.balance -= (cost_new + fee); self.position += remaining_qty * side
+                    self.avg_cost = price; self.opened_at = index
+                    self._record(index, side, REVERSE, remaining_qty, price, fee=fee)
+            return True
+        cost = price * qty
+        if self.balance < cost: return False
+        self.balance -= (cost + fee)
+        if pos == 0: self.opened_at = index
+        self.avg_cost = ((avg * abs(pos)) + cost) / (abs(pos) + qty); self.position += qty * side
+        self._record(index, side, OPEN, qty, price, fee=fee)
+        return True
+
+    def unrealized(self, price):
+        pos = self.position
+        if pos > 0: return (price - self.avg_cost) * pos
+        if pos < 0: return (self.avg_cost - price) * -pos
+        return 0
+
+    # 總權益：多單以市價計，空單以保證金 (均價) + 未實現損益計
+    def equity(self, price):
+        pos = self.position
+        if pos > 0: return self.balance + pos * price
+        if pos < 0: return self.balance + (-pos * self.avg_cost + self.unrealized(price))
+        return self.balance
+
+    # 權益對價格是線性的：equity(price) == a + b * price，b 就是部位 (多空都成立)
+    def equity_line(self):
+        pos = self.position
+        return (self.balance + 2 * -pos * self.avg_cost if pos < 0 else self.balance), pos
+
+    # 快照用：純量欄位 + 成交紀錄 (不含預留的空位)
+    def dump(self):
+        return {"balance": self.balance, "position": int(self.position), "avg_cost": self.avg_cost,
+                "round": int(self.round), "round_start": int(self.round_start), "round_balance": self.round_balance,
+                "opened_at": int(self.opened_at)}, self.fills.copy()
+
+    @classmethod
+    def load(cls, state, fills):
+        led = cls(state["balance"], capacity=max(64, len(fills) * 2))
+        led.position = int(state["position"]); led.avg_cost = float(state["avg_cost"])
+        led.round = int(state["round"]); led.round_start = int(state["round_start"])
+        led.opened_at = int(state.get("opened_at", -1)); led.round_balance = float(state.get("round_balance", led.balance))
+        led._fills[:len(fills)] = fills; led._n = len(fills)
+        return led
+
+    # 資料重新下載後 K 棒位置整體平移，本關的成交位置跟著移
+    def shift_round(self, offset):
+        self._fills["index"][self.round_start:self._n] += offset
+        if self.opened_at >= 0: self.opened_at += offset
+
+    # 本關第 start~end 根的逐根權益 (向量化)：每根取「在這根以前最後一筆成交」的權益線乘上收盤價
+    def equity_curve(self, close, start, end):
+        f = self.round_fills
+        k = np.searchsorted(f["index"], np.arange(start, end + 1), side="right") - 1
+        a = np.where(k >= 0, f["a"][k], self.round_balance) if len(f) else np.full(end - start + 1, self.round_balance)
+        b = np.where(k >= 0, f["pos"][k], 0) if len(f) else 0
+        return a + b * np.asarray(close[start:end + 1], dtype=np.float64)
+
+    @property
+    def fills(self):
+        return self._fills[:self._n]
+
+    @property
+    def round_fills(self):
+        return self._fills[self.round_start:self._n]
+
+    def trade_returns(self):
+        f = self.fills
+        return f["roi"][f["kind"] == CLOSE]
+
+    def avg_return(self):
+        r = self.trade_returns()
+        return float(r.mean()) if len(r) else 0.0
+
+    # 本關 [lo, hi] 之間的買賣點；同一關的成交 index 單調遞增，用二分搜尋
+    def markers(self, lo, hi):
+        f = self.round_fills
+        a = np.searchsorted(f["index"], lo, side="left"); b = np.searchsorted(f["index"], hi, side="right")
+        w = f[a:b]
+        # 同一個動作 (同一根 K 棒、同方向) 拆成平倉+反手兩筆時只畫一個點
+        if len(w) > 1:
+            keep = np.ones(len(w), dtype=bool)
+            keep[1:] = (w["index"][1:] != w["index"][:-1]) | (w["side"][1:] != w["side"][:-1]) | (w["kind"][1:] != REVERSE)
+            w = w[keep]
+        buy = w[w["side"] == BUY]; sell = w[w["side"] == SELL]
+        return buy["index"], buy["price"] * 0.99, sell["index"], sell["price"] * 1.01
+
+    def history(self, last=10):
+        return [format_fill(f) for f in self.round_fills[-last:]]
+
+    @property
+    def n_fills(self):
+        return self._n
+
+
+# 綜合戰力：狙擊率 40% + 總報酬 30% + 獲利力 30%；risk (risk_stats 的結果) 給了才依 RISK_WEIGHTS 加減風險項
+def power_score(avg_sniper, roi, assets, risk=None, weights=None):
+    profit_score = (assets - INITIAL_CAPITAL) / 10000
+    score = (avg_sniper * 40) + (roi * 30) + (profit_score * 0.3 * 30)
+    if risk:
+        w = weights or RISK_WEIGHTS
+        score += -w["max_drawdown"] * risk["max_drawdown"] + w["sharpe"] * risk["sharpe"]
+    return score
+
+
+# 權益曲線的風險指標：最大回撤 (%)、最長水下 K 棒數、類夏普值 (逐根報酬平均 / 標準差 * sqrt(根數))
+def risk_stats(equity):
+    eq = np.asarray(equity, dtype=np.float64)
+    if len(eq) < 2: return {"max_drawdown": 0.0, "underwater_bars": 0, "underwater_pct": 0.0, "sharpe": 0.0}
+    peak = np.maximum.accumulate(eq)
+    dd = np.where(peak > 0, 1 - eq / peak, 0.0)
+    under = dd > 1e-12
+    # 最長連續水下：每段水下的長度 = 段尾位置 - 段頭位置
+    edges = np.diff(np.r_[0, under.astype(np.int8), 0])
+    runs = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        r = np.diff(eq) / eq[:-1]
+    r = r[np.isfinite(r)]
+    sd = r.std() if len(r) > 1 else 0.0
+    return {"max_drawdown": float(dd.max() * 100), "underwater_bars": int(runs.max()) if len(runs) else 0,
+            "underwater_pct": float(under.mean() * 100), "sharpe": float(r.mean() / sd * np.sqrt(len(r))) if sd > 0 else 0.0}
+
+
+def format_fill(f):
+    qty, price = int(f["qty"]), float(f["price"])
+    if f["side"] == BUY:
+        if f["kind"] == CLOSE: return f"🔴 空單回補 {qty}股 (損: {int(f['pnl'])}, {f['roi']:.2f}%)"
+        if f["kind"] == REVERSE: return f"🔴 反手做多 {qty}股 @ {price:.2f}"
+        return f"🔴 買進 {qty}股 @ {price:.2f}"
+    if f["kind"] == CLOSE: return f"🟢 賣出 {qty}股 (損: {int(f['pnl'])}, {f['roi']:.2f}%)"
+    if f["kind"] == REVERSE: return f"🟢 反手放空 {qty}股 @ {price:.2f}"
+    return f"🟢 放空 {qty}股 @ {price:.2f}"
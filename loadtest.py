@@ -0,0 +1,231 @@
+# --- 多人同時連線壓力測試 ---
+# 用 Streamlit 的 AppTest (無頭模式) 同時跑 N 個 session，走真正的遊戲流程：
+# 登入 -> 載入關卡 -> 逐根前進 (隨機買賣) -> 結算三關 -> 英雄榜。
+# yfinance 換成本地假模組 (合成 K 棒 + 可設定的下載延遲)，不需要網路。
+# 量整頁重跑延遲 p50/p95/p99、吞吐量與每個 session 的 RSS 增量。
+#
+#   python loadtest.py                          # 預設 1,2,4,8 個 session
+#   python loadtest.py --sessions 1,4,16 --ticks 40
+#   python loadtest.py --save load_baseline.json
+#   python loadtest.py --compare load_baseline.json --threshold 0.3
+#   python loadtest.py --max-p95-ms 500         # p95 超過就回傳 1 (CI 用)
+#
+# 注意：
+#   * AppTest 不會觸發 fragment 的計時重跑，自動播放的每一根改用「⏭」按鈕 (整頁重跑)，
+#     量到的是比實際播放更重的上限。
+#   * AppTest 每次 run 都會換掉全域的 Runtime 實例，同一個 process 裡不能同時跑兩個，
+#     所以每個 session 各開一個 process，全部共用同一組暫存資料檔 (行情快取、英雄榜、快照、成交紀錄)，
+#     各自暖機完成後同時開跑。CPU、磁碟與檔案鎖的競爭都量得到；單一 process 內的 GIL 競爭量不到，
+#     同時 session 數超過 CPU 核心數時的延遲才是要看的重點。
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP = os.path.join(HERE, "trading_game.py")
+STAGES = ("login", "load", "tick", "trade", "settle", "board")
+
+
+# --- 假的 yfinance ---
+# 走原本的 FallbackProvider -> YFinanceProvider 路徑，只有 yf.download 換掉
+def install_yf_stub(latency_ms=0.0):
+    from market_data import SyntheticProvider
+    provider = SyntheticProvider()
+    yf = types.ModuleType("yfinance")
+
+    def download(ticker, period="60d", interval="5m", progress=False, **kwargs):
+        if latency_ms: time.sleep(latency_ms / 1000)
+        return provider.fetch(ticker, period, interval)
+    yf.download = download
+    sys.modules["yfinance"] = yf
+    return yf
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            info = dict(line.split(":", 1) for line in f)
+        return int(info["VmRSS"].split()[0]) / 1024, int(info["VmHWM"].split()[0]) / 1024
+    except (OSError, KeyError, ValueError):
+        import resource   # 非 Linux：只有高峰值
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+        return peak, peak
+
+
+class SessionError(RuntimeError):
+    pass
+
+
+# --- 單一玩家 ---
+class Player:
+    def __init__(self, name, rng, ticks, trade_p, rounds, timeout=120):
+        from streamlit.testing.v1 import AppTest
+        self.at = AppTest.from_file(APP, default_timeout=timeout)
+        self.name = name
+        self.rng = rng
+        self.ticks = ticks
+        self.trade_p = trade_p
+        self.rounds = rounds
+        self.samples = []   # (stage, ms)
+
+    def run(self, stage):
+        t0 = time.perf_counter()
+        self.at.run()
+        self.samples.append((stage, (time.perf_counter() - t0) * 1000))
+        if self.at.exception: raise SessionError(f"{stage}: {self.at.exception[0].message}")
+
+    def click(self, label, stage):
+        for b in self.at.button:
+            if any(x in b.label for x in label.split("|")): b.click(); return self.run(stage)
+        raise SessionError(f"{stage}: button {label!r} not found")
+
+    def play(self):
+        self.run("login")
+        self.at.text_input[0].set_value(self.name)
+        self.click("進入操盤室", "load")   # 送出表單 + 載入第一關
+        for r in range(self.rounds):
+            for _ in range(self.ticks):
+                if self.rng.random() < self.trade_p: self.click(self.rng.choice(["買進", "賣出"]), "trade")
+                else: self.click("⏭", "tick")
+            self.click("結算本局|最終結算", "settle")
+        self.run("board")   # 通關後自動切到英雄榜
+
+
+# --- worker：一個 process 跑一個 session ---
+# 暖機完印出 ready，等主程式送 go 再開跑，最後印出一行 JSON
+def worker(bot, ticks, trade_p, rounds, seed, latency_ms):
+    install_yf_stub(latency_ms)
+    import streamlit.testing.v1   # noqa: F401  先載入，不算在 session 裡
+    Player(f"warmup{bot}", random.Random(seed * 1000 + bot + 500), 2, 0.5, 1).play()   # 暖機：模組載入、行情快取、篩選名單
+    base_rss, _ = rss_mb()
+    player = Player(f"bot{bot}", random.Random(seed * 1000 + bot), ticks, trade_p, rounds)
+    print("ready", flush=True)
+    sys.stdin.readline()
+    error = None
+    try: player.play()
+    except Exception as e: error = repr(e)
+    _, peak_rss = rss_mb()
+    return {"samples": player.samples, "error": error, "base_rss_mb": base_rss, "peak_rss_mb": peak_rss}
+
+
+def percentiles(a):
+    return {"p50_ms": float(np.percentile(a, 50)), "p95_ms": float(np.percentile(a, 95)),
+            "p99_ms": float(np.percentile(a, 99)), "max_ms": float(a.max())}
+
+
+# 每個 session 數用一個新的暫存目錄，n 個 worker 共用裡面的資料檔
+def run_level(n, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, PYTHONPATH=HERE, GAME_DATA_SOURCE="yfinance", GAME_CACHE_DIR=os.path.join(tmp, "cache"),
+                   GAME_LEADERBOARD_DB=os.path.join(tmp, "lb.db"), GAME_METRICS_DB=os.path.join(tmp, "m.db"),
+                   GAME_SNAPSHOT_DIR=os.path.join(tmp, "sessions"), GAME_TRADES_DIR=os.path.join(tmp, "trades"))
+        procs = []
+        for i in range(n):
+            cmd = [sys.executable, os.path.abspath(__file__), "--worker", str(i), "--ticks", str(args.ticks),
+                   "--trade-p", str(args.trade_p), "--rounds", str(args.rounds), "--seed", str(args.seed),
+                   "--latency-ms", str(args.latency_ms)]
+            err = open(os.path.join(tmp, f"worker{i}.err"), "w+")   # stderr 寫檔，避免管線塞滿卡住
+            procs.append((subprocess.Popen(cmd, cwd=tmp, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                           stderr=err, text=True), err))
+
+        def fail(p, err):
+            for q, _ in procs: q.kill()
+            err.seek(0)
+            raise RuntimeError(err.read()[-2000:] or f"worker exited with {p.returncode}")
+
+        for p, err in procs:
+            for line in p.stdout:
+                if line.strip() == "ready": break
+            else: p.wait(); fail(p, err)
+        t0 = time.perf_counter()
+        for p, _ in procs: p.stdin.write("go\n"); p.stdin.flush()
+        results = []
+        for p, err in procs:
+            out = p.communicate()[0]
+            if p.returncode != 0: fail(p, err)
+            results.append(json.loads(out.strip().splitlines()[-1]))
+            err.close()
+        wall = time.perf_counter() - t0
+
+    samples = [s for r in results for s in r["samples"]]
+    errors = [r["error"] for r in results if r["error"]]
+    ms = np.array([m for _, m in samples]) if samples else np.zeros(1)
+    stages = {}
+    for st in STAGES:
+        a = np.array([m for s, m in samples if s == st])
+        if len(a): stages[st] = dict(percentiles(a), n=len(a))
+    base = np.array([r["base_rss_mb"] for r in results]); peak = np.array([r["peak_rss_mb"] for r in results])
+    return dict(percentiles(ms), sessions=n, reruns=len(samples), wall_s=wall, reruns_per_s=len(samples) / wall,
+                sessions_per_min=(n - len(errors)) / wall * 60, base_rss_mb=float(base.mean()), peak_rss_mb=float(peak.max()),
+                mb_per_session=float((peak - base).mean()), errors=errors[:5], n_errors=len(errors), stages=stages)
+
+
+def report(levels):
+    print(f"{'sessions':>8} {'reruns':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'rerun/s':>8} {'peakMB':>8} {'MB/sess':>8} {'err':>4}")
+    for r in levels:
+        print(f"{r['sessions']:>8} {r['reruns']:>7} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['max_ms']:>8.1f} "
+              f"{r['reruns_per_s']:>8.1f} {r['peak_rss_mb']:>8.1f} {r['mb_per_session']:>8.1f} {r['n_errors']:>4}")
+    last = levels[-1]
+    print("\n各階段 p95 (ms，最大 session 數)：" + "  ".join(f"{k} {v['p95_ms']:.1f}" for k, v in last["stages"].items()))
+
+
+# 比較：同一個 session 數的 p95 變慢超過 threshold 算退步
+def compare(current, baseline, threshold=0.3):
+    base = {r["sessions"]: r for r in baseline["levels"]}
+    bad = []
+    for r in current["levels"]:
+        b = base.get(r["sessions"])
+        if b and r["p95_ms"] > b["p95_ms"] * (1 + threshold): bad.append((r["sessions"], b["p95_ms"], r["p95_ms"]))
+    return bad
+
+
+def main():
+    p = argparse.ArgumentParser(description="多人同時連線壓力測試")
+    p.add_argument("--sessions", default="1,2,4,8", help="逗號分隔的同時 session 數")
+    p.add_argument("--ticks", type=int, default=20, help="每關前進幾根")
+    p.add_argument("--trade-p", type=float, default=0.2, help="每一根下單的機率")
+    p.add_argument("--rounds", type=int, default=3)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--latency-ms", type=float, default=0.0, help="假 yf.download 的延遲")
+    p.add_argument("--out", default=None, help="結果 JSON 輸出路徑")
+    p.add_argument("--save", default=None, help="把結果存成基準檔")
+    p.add_argument("--compare", default=None, help="和基準檔比較")
+    p.add_argument("--threshold", type=float, default=0.3, help="p95 退步門檻 (0.3 = 慢 30%%)")
+    p.add_argument("--max-p95-ms", type=float, default=None, help="任一 session 數的 p95 超過就失敗")
+    p.add_argument("--worker", type=int, default=None, help=argparse.SUPPRESS)
+    a = p.parse_args()
+
+    if a.worker is not None:
+        print(json.dumps(worker(a.worker, a.ticks, a.trade_p, a.rounds, a.seed, a.latency_ms)))
+        return
+
+    levels = []
+    for n in [int(x) for x in a.sessions.split(",") if x.strip()]:
+        levels.append(run_level(n, a))
+        print(f"... {n} sessions done ({levels[-1]['wall_s']:.1f}s)", file=sys.stderr)
+    res = {"meta": {"python": sys.version.split()[0], "time": time.strftime("%Y-%m-%d %H:%M:%S"), "ticks": a.ticks,
+                    "trade_p": a.trade_p, "rounds": a.rounds, "latency_ms": a.latency_ms}, "levels": levels}
+    report(levels)
+    for path in filter(None, [a.out, a.save]):
+        with open(path, "w") as f: json.dump(res, f, indent=2)
+    failed = any(r["n_errors"] for r in levels)
+    if a.max_p95_ms is not None:
+        over = [r["sessions"] for r in levels if r["p95_ms"] > a.max_p95_ms]
+        if over: print(f"\np95 超過 {a.max_p95_ms} ms：{over} sessions"); failed = True
+    if a.compare:
+        with open(a.compare) as f: bad = compare(res, json.load(f), a.threshold)
+        for n, b, c in bad: print(f"REGRESSION {n} sessions: p95 {b:.1f} -> {c:.1f} ms")
+        failed = failed or bool(bad)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
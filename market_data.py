@@ -0,0 +1,481 @@
+# --- 行情資料：provider + 快取 (跨 session / 跨 process 共用) ---
+# 記憶體 LRU 在前、磁碟 Parquet 在後，key = (ticker, period, interval)
+import argparse
+import os
+import random
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from gateway import DownloadError, DownloadGateway
+from tracing import span
+
+CACHE_DIR = os.environ.get("GAME_CACHE_DIR", "market_cache")
+CACHE_TTL = 30 * 60                    # 秒，過期後背景更新，先回舊資料
+MEM_MAX_BYTES = 256 * 1024 * 1024      # 記憶體層上限
+DISK_MAX_BYTES = 1024 * 1024 * 1024    # 磁碟層上限
+
+HOT_STOCKS_MAP = {
+    '6462.TWO': '神盾', '8054.TWO': '安國', '6684.TWO': '安格', '3529.TWO': '力旺', 
+    '6531.TW': '愛普', '6643.TW': 'M31', '3661.TW': '世芯-KY',
+    '4979.TW': '華星光', '3363.TW': '上詮', '3450.TW': '聯鈞', '4908.TWO': '前鼎', 
+    '3163.TWO': '波若威', '4977.TW': '眾達-KY',
+    '1519.TW': '華城', '1514.TW': '亞力', '1513.TW': '中興電', '1609.TW': '大亞',
+    '6806.TW': '森崴能源', '9958.TW': '世紀鋼',
+    '6472.TWO': '保瑞', '4763.TWO': '材料-KY', '1795.TWO': '美時', '4114.TWO': '健喬',
+    '3017.TW': '奇鋐', '3324.TWO': '雙鴻', '8996.TWO': '高力', '3653.TW': '健策',
+    '3032.TW': '偉訓', '8210.TW': '勤誠',
+    '3583.TW': '辛耘', '3131.TW': '弘塑', '6187.TWO': '萬潤', '5443.TWO': '均豪'
+}
+
+# 選股條件
+MIN_BARS = 300
+MAX_PRICE = 200
+MIN_FLUCT_MEAN = 0.15
+MIN_FLUCT_MAX = 1.5
+SCREEN_WORKERS = 8
+SCREEN_TTL = 30 * 60
+RATE_LIMIT = float(os.environ.get("GAME_DOWNLOAD_RATE", "4"))   # 每秒最多開始幾個 Yahoo 下載
+
+
+# --- 資料來源 (provider) ---
+# 每個 provider 只需要實作 fetch(ticker, period, interval) -> OHLCV DataFrame
+# 合成資料只在明確設定 GAME_DATA_SOURCE=synthetic 時使用，真實來源失敗時不會拿假資料頂替
+DATA_SOURCE = os.environ.get("GAME_DATA_SOURCE", "yfinance")   # yfinance / local / synthetic
+FIXTURE_DIR = os.environ.get("GAME_FIXTURE_DIR", "fixtures")
+OHLCV = ["Open", "High", "Low", "Close", "Volume"]
+BAR_DTYPE = np.dtype([("Datetime", "i8")] + [(c, "f8") for c in OHLCV])
+TW_TZ = "Asia/Taipei"
+
+
+def parse_period_days(period):
+    return int(period[:-1]) * {"d": 1, "w": 7, "y": 365}.get(period[-1], 1) if period[-1] in "dwy" else 60
+
+
+def parse_interval_minutes(interval):
+    if interval.endswith("m"): return int(interval[:-1])
+    if interval.endswith("h"): return int(interval[:-1]) * 60
+    return 5
+
+
+class YFinanceProvider:
+    name = "yfinance"
+
+    def fetch(self, ticker, period, interval):
+        import yfinance as yf   # 載入要半秒以上，用到才 import
+        with span("yf.download"):
+            df = yf.download(ticker, period=period, interval=interval, progress=False)
+        if isinstance(df.columns, pd.MultiIndex): df.columns = df.columns.get_level_values(0)
+        return df
+
+
+class SyntheticProvider:
+    name = "synthetic"
+    persist = False   # 假資料不寫進共用快取，免得被當成真的行情
+
+    # 台股盤中 09:00~13:30，價格、波動度由 ticker 決定，同一檔每次產生的都一樣
+    def __init__(self, seed=0, end=None):
+        self.seed = seed
+        self.end = end
+
+    def fetch(self, ticker, period, interval):
+        rng = np.random.default_rng([self.seed, zlib.crc32(ticker.encode())])
+        step = parse_interval_minutes(interval)
+        end = pd.Timestamp(self.end) if self.end is not None else pd.Timestamp.now(tz=TW_TZ)
+        if end.tzinfo is None: end = end.tz_localize(TW_TZ)
+        days = pd.bdate_range(end=end.normalize().tz_localize(None), periods=max(1, parse_period_days(period) * 5 // 7))
+        offsets = pd.timedelta_range("09:00:00", "13:25:00", freq=f"{step}min")
+        idx = pd.DatetimeIndex((days.values[:, None] + offsets.values[None, :]).ravel()).tz_localize(TW_TZ)
+        n, per_day = len(idx), len(offsets)
+
+        # 開收盤波動大、中午小的 U 型日內結構
+        u = np.linspace(-1, 1, per_day) ** 2
+        shape = np.tile(0.6 + 0.9 * u, len(days))
+        base_vol = rng.uniform(0.0012, 0.003) * np.sqrt(step / 5)
+        regime = np.repeat(rng.uniform(0.6, 1.8, len(days)), per_day)
+        drift = np.repeat(rng.normal(0, 0.0004, len(days)), per_day)
+        ret = drift + rng.standard_normal(n) * base_vol * shape * regime
+        jumps = rng.random(n) < 0.004
+        ret[jumps] += rng.normal(0, 0.025, jumps.sum())
+        close = rng.uniform(30, 150) * np.exp(np.cumsum(ret))
+        open_ = np.concatenate([[close[0]], close[:-1]]) * (1 + rng.normal(0, base_vol * 0.2, n))
+        wick = np.abs(rng.standard_normal((2, n))) * base_vol * shape * regime * 0.6
+        high = np.maximum(open_, close) * (1 + wick[0])
+        low = np.minimum(open_, close) * (1 - wick[1])
+        volume = np.round(rng.lognormal(np.log(rng.uniform(50, 400)), 0.6, n) * shape * 1000)
+        df = pd.DataFrame({"Open": open_, "High": high, "Low": low, "Close": close, "Volume": volume}, index=idx)
+        df.index.name = "Datetime"
+        return df
+
+
+class LocalProvider:
+    name = "local"
+
+    # 讀取預錄的 K 棒：{ticker}_{interval}.npy (memmap 結構陣列) 或 .parquet；
+    # 沒有檔案時交給 fallback，沒給就丟 DownloadError (不會自己編資料)
+    def __init__(self, root=FIXTURE_DIR, fallback=None):
+        self.root = root
+        self.fallback = fallback
+
+    def _path(self, ticker, interval, ext):
+        return os.path.join(self.root, f"{ticker}_{interval}.{ext}")
+
+    def fetch(self, ticker, period, interval):
+        npy = self._path(ticker, interval, "npy")
+        if os.path.exists(npy):
+            arr = np.load(npy, mmap_mode="r")
+            idx = pd.DatetimeIndex(pd.to_datetime(arr["Datetime"], utc=True)).tz_convert(TW_TZ)
+            df = pd.DataFrame({c: np.asarray(arr[c]) for c in OHLCV}, index=idx)
+        elif os.path.exists(self._path(ticker, interval, "parquet")):
+            df = pd.read_parquet(self._path(ticker, interval, "parquet"))
+        elif self.fallback is not None:
+            return self.fallback.fetch(ticker, period, interval)
+        else:
+            raise DownloadError(f"no fixture for {ticker} ({interval})")
+        df.index.name = "Datetime"
+        days = parse_period_days(period)
+        return df[df.index >= df.index[-1] - pd.Timedelta(days=days)] if len(df) else df
+
+    # 把任一來源的資料錄成本地 fixture
+    def record(self, ticker, df, interval="5m", fmt="npy"):
+        os.makedirs(self.root, exist_ok=True)
+        if fmt == "parquet":
+            df[OHLCV].to_parquet(self._path(ticker, interval, "parquet")); return
+        idx = df.index if df.index.tz is not None else df.index.tz_localize(TW_TZ)
+        arr = np.empty(len(df), dtype=BAR_DTYPE)
+        arr["Datetime"] = idx.tz_convert("UTC").as_unit("ns").asi8
+        for c in OHLCV: arr[c] = df[c].to_numpy(dtype="f8")
+        np.save(self._path(ticker, interval, "npy"), arr)
+
+
+class FallbackProvider:
+    name = "fallback"
+
+    # 主要來源失敗或回傳空資料時改用備援 (例如 Yahoo 掛掉時用本地資料)；
+    # 備援也沒有時丟出主要來源的 DownloadError (熔斷 / 限流 / 下載失敗)，讓選關跳過這一檔
+    def __init__(self, primary, secondary):
+        self.primary = primary
+        self.secondary = secondary
+
+    def fetch(self, ticker, period, interval):
+        err = None
+        try:
+            df = self.primary.fetch(ticker, period, interval)
+            if df is not None and not df.empty: return df
+        except Exception as e:
+            err = e
+        try:
+            return self.secondary.fetch(ticker, period, interval)
+        except DownloadError:
+            if isinstance(err, DownloadError): raise err
+            raise
+
+
+class GatedProvider:
+    name = "gated"
+
+    # 連網的來源包一層閘道：合併同時請求、限流、退避、熔斷；失敗一律丟 DownloadError，讓 FallbackProvider 接手
+    def __init__(self, provider, gateway=None):
+        self.provider = provider
+        self.gateway = gateway or DownloadGateway(provider.fetch, rate=RATE_LIMIT)
+
+    def fetch(self, ticker, period, interval):
+        return self.gateway.fetch(ticker, period, interval)
+
+
+def make_provider(source=DATA_SOURCE):
+    if source == "synthetic": return SyntheticProvider()
+    if source == "local": return LocalProvider()
+    return FallbackProvider(GatedProvider(YFinanceProvider()), LocalProvider())
+
+
+PROVIDER = make_provider()
+
+
+# 目前使用中的下載閘道 (後台看統計用)；不連網的來源沒有
+def active_gateway(provider=None):
+    p = provider or PROVIDER
+    if isinstance(p, FallbackProvider): p = p.primary
+    return p.gateway if isinstance(p, GatedProvider) else None
+
+
+class MarketDataCache:
+    # persist=False 時只用記憶體層，不讀也不寫共用的磁碟快取 (合成資料用)
+    def __init__(self, fetcher=PROVIDER.fetch, cache_dir=CACHE_DIR, ttl=CACHE_TTL,
+                 mem_max_bytes=MEM_MAX_BYTES, disk_max_bytes=DISK_MAX_BYTES, persist=True):
+        self.fetcher = fetcher
+        self.cache_dir = cache_dir
+        self.persist = persist
+        self.ttl = ttl
+        self.mem_max_bytes = mem_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._mem = OrderedDict()   # key -> (fetched_at, df, nbytes)
+        self._mem_bytes = 0
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._warm_thread = None
+        self.stats = {"mem_hits": 0, "disk_hits": 0, "misses": 0, "refreshes": 0, "errors": 0}
+
+    # 讀取：記憶體 -> 磁碟 -> 網路；過期的資料照樣回傳並在背景更新
+    def get(self, ticker, period="60d", interval="5m"):
+        return self.get_versioned(ticker, period, interval)[1]
+
+    # 同上，另外回傳資料版本 (抓取時間)，給下游做快取 key
+    def get_versioned(self, ticker, period="60d", interval="5m"):
+        key = (ticker, period, interval)
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None:
+                self._mem.move_to_end(key)
+                self.stats["mem_hits"] += 1
+        if hit is None:
+            hit = self._read_disk(key)
+            if hit is not None:
+                self.stats["disk_hits"] += 1
+                self._put_mem(key, hit[0], hit[1])
+        if hit is None:
+            self.stats["misses"] += 1
+            return self._fetch(key)
+        fetched_at, df = hit[0], hit[1]
+        if time.time() - fetched_at > self.ttl: self.refresh_async(key)
+        return fetched_at, df
+
+    def refresh_async(self, key):
+        with self._lock:
+            if key in self._refreshing: return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                # 其他 process 可能已經更新過磁碟檔，先看磁碟再決定要不要連網
+                hit = self._read_disk(key)
+                if hit is not None and time.time() - hit[0] <= self.ttl: self._put_mem(key, hit[0], hit[1])
+                else: self._fetch(key)
+                self.stats["refreshes"] += 1
+            except Exception:
+                pass
+            finally:
+                with self._lock: self._refreshing.discard(key)
+        threading.Thread(target=run, daemon=True).start()
+
+    # 開站預熱：背景把整個清單抓一遍，之後開局不必再連網
+    def warm_up(self, tickers, period="60d", interval="5m"):
+        if self._warm_thread is not None: return self._warm_thread
+
+        def run():
+            for t in tickers:
+                try: self.get(t, period, interval)
+                except Exception: pass
+        self._warm_thread = threading.Thread(target=run, daemon=True)
+        self._warm_thread.start()
+        return self._warm_thread
+
+    def _fetch(self, key):
+        try:
+            with span("market_data.fetch"): df = self.fetcher(*key)
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        if df is None or df.empty:
+            self.stats["errors"] += 1
+            raise ValueError(f"no data for {key[0]}")
+        with self._lock: hit = self._mem.get(key)
+        if hit is not None and hit[1] is df: return hit[0], df   # 同一次下載的其他等待者，已經有人寫過快取
+        now = time.time()
+        self._put_mem(key, now, df)
+        self._write_disk(key, df)
+        return now, df
+
+    def _put_mem(self, key, fetched_at, df):
+        nbytes = int(df.memory_usage(index=True).sum())
+        with self._lock:
+            old = self._mem.pop(key, None)
+            if old is not None: self._mem_bytes -= old[2]
+            self._mem[key] = (fetched_at, df, nbytes)
+            self._mem_bytes += nbytes
+            while self._mem_bytes > self.mem_max_bytes and len(self._mem) > 1:
+                _, (_, _, b) = self._mem.popitem(last=False)
+                self._mem_bytes -= b
+
+    def _path(self, key):
+        safe = "_".join(k.replace("/", "-") for k in key)
+        return os.path.join(self.cache_dir, f"{safe}.parquet")
+
+    def _read_disk(self, key):
+        if not self.persist: return None
+        path = self._path(key)
+        try:
+            fetched_at = os.path.getmtime(path)
+            with span("market_data.disk_read"): return fetched_at, pd.read_parquet(path)
+        except Exception:
+            return None
+
+    # 先寫暫存檔再 os.replace，多個 process 同時寫也不會讀到半個檔案
+    def _write_disk(self, key, df):
+        if not self.persist: return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._path(key)
+            tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+            df.to_parquet(tmp)
+            os.replace(tmp, path)
+            self._evict_disk()
+        except Exception:
+            pass
+
+    def _evict_disk(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".parquet"): continue
+            p = os.path.join(self.cache_dir, name)
+            try: st_ = os.stat(p)
+            except OSError: continue
+            entries.append((st_.st_mtime, st_.st_size, p))
+        total = sum(e[1] for e in entries)
+        for _, size, p in sorted(entries):
+            if total <= self.disk_max_bytes: break
+            try: os.remove(p); total -= size
+            except OSError: pass
+
+    def clear_memory(self):
+        with self._lock:
+            self._mem.clear(); self._mem_bytes = 0
+
+
+# 同一個 process 內所有 session 共用
+MARKET_CACHE = MarketDataCache(persist=getattr(PROVIDER, "persist", True))
+
+
+# --- 選股篩選 (並行下載 + 向量化過濾) ---
+# frames: {ticker: df}，回傳每檔的統計與是否合格 (index = ticker)
+def screen_frames(frames, min_bars=MIN_BARS, max_price=MAX_PRICE, min_fluct_mean=MIN_FLUCT_MEAN, min_fluct_max=MIN_FLUCT_MAX):
+    cols = ["last_price", "fluct_mean", "fluct_max", "bars", "eligible"]
+    tickers = list(frames.keys())
+    if not tickers: return pd.DataFrame(columns=cols)
+    # 所有檔案首尾相接成一條陣列，用 segment id 分組，一次算完全部統計
+    arr = {c: np.concatenate([frames[t][c].to_numpy(dtype=np.float64).ravel() for t in tickers]) for c in ("Open", "High", "Low", "Close", "Volume")}
+    seg = np.repeat(np.arange(len(tickers)), [len(frames[t]) for t in tickers])
+    keep = arr["Volume"] > 0
+    seg = seg[keep]
+    fluct = (arr["High"][keep] - arr["Low"][keep]) / arr["Open"][keep] * 100
+    close = arr["Close"][keep]
+    bars = np.bincount(seg, minlength=len(tickers))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fluct_mean = np.bincount(seg, weights=fluct, minlength=len(tickers)) / bars
+    fluct_max = np.full(len(tickers), np.nan); last_price = np.full(len(tickers), np.nan)
+    if len(seg):
+        starts = np.flatnonzero(np.r_[True, seg[1:] != seg[:-1]])
+        ends = np.r_[starts[1:], len(seg)] - 1
+        fluct_max[seg[starts]] = np.maximum.reduceat(fluct, starts)
+        last_price[seg[starts]] = close[ends]
+    stats = pd.DataFrame({"last_price": last_price, "fluct_mean": fluct_mean, "fluct_max": fluct_max, "bars": bars},
+                         index=pd.Index(tickers, name="Ticker"))
+    stats["eligible"] = ((stats["bars"] >= min_bars) & (stats["last_price"] <= max_price)
+                         & (stats["fluct_mean"] >= min_fluct_mean) & (stats["fluct_max"] >= min_fluct_max))
+    return stats[cols]
+
+
+# 一份合格名單對應一種 (period, interval)；波動門檻以 5 分 K 為準，其他週期依 sqrt(時間) 換算
+class EligibilityIndex:
+    def __init__(self, cache=None, workers=SCREEN_WORKERS, ttl=SCREEN_TTL, period="60d", interval="5m"):
+        self.cache = cache or MARKET_CACHE
+        self.workers = workers
+        self.ttl = ttl
+        self.period = period
+        self.interval = interval
+        k = (parse_interval_minutes(interval) / 5) ** 0.5
+        self.filters = {"min_fluct_mean": MIN_FLUCT_MEAN * k, "min_fluct_max": MIN_FLUCT_MAX * k}
+        self.stats = None
+        self.eligible = ()   # 排序過的 tuple，重建時整個換掉，不會原地修改
+        self.built_at = 0.0
+        self._lock = threading.Lock()
+        self._building = False
+
+    def _fetch_all(self, tickers):
+        def one(t):
+            try: return t, self.cache.get(t, self.period, self.interval)
+            except Exception: return t, None
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return {t: df for t, df in pool.map(one, tickers) if df is not None}
+
+    def build(self, tickers):
+        stats = screen_frames(self._fetch_all(tickers), **self.filters)
+        with self._lock:
+            self.stats = stats
+            self.eligible = tuple(sorted(stats.index[stats["eligible"]]))
+            self.built_at = time.time()
+        return self
+
+    # 第一次同步建立，之後過期就在背景重建，選股永遠不用等
+    def ensure(self, tickers):
+        if self.stats is None: return self.build(tickers)
+        if time.time() - self.built_at > self.ttl:
+            with self._lock:
+                if self._building: return self
+                self._building = True
+
+            def run():
+                try: self.build(tickers)
+                except Exception: pass
+                finally: self._building = False
+            threading.Thread(target=run, daemon=True).start()
+        return self
+
+    def draw(self, rng=None):
+        pool = self.eligible
+        return (rng or random).choice(pool) if pool else None
+
+
+_SCREENERS = {}   # (period, interval) -> EligibilityIndex
+_SCREENERS_LOCK = threading.Lock()
+
+
+# 1 分 K 的關卡要用 1 分 K 的資料判斷合不合格，每種週期各一份名單
+def screener(period="60d", interval="5m"):
+    with _SCREENERS_LOCK:
+        index = _SCREENERS.get((period, interval))
+        if index is None: index = _SCREENERS[(period, interval)] = EligibilityIndex(period=period, interval=interval)
+        return index
+
+
+SCREENER = screener()
+
+
+# 錄製本地 fixture：python market_data.py --record [--tickers 2330.TW ...]
+# 錄好的檔案放在 FIXTURE_DIR (可以進版控)，之後 GAME_DATA_SOURCE=local 或 Yahoo 失敗時離線可玩
+def record_fixtures(tickers, period="60d", interval="5m", root=FIXTURE_DIR, fmt="npy", source=None):
+    source = source or GatedProvider(YFinanceProvider())
+    local = LocalProvider(root)
+    done = []
+    for t in tickers:
+        try: df = source.fetch(t, period, interval)
+        except Exception as e: print(f"{t:>10}: 失敗 {e}"); continue
+        if df is None or df.empty: print(f"{t:>10}: 沒有資料"); continue
+        local.record(t, df, interval, fmt)
+        done.append(t); print(f"{t:>10}: {len(df)} 根")
+    return done
+
+
+def main():
+    p = argparse.ArgumentParser(description="行情資料工具")
+    p.add_argument("--record", action="store_true", help="把 Yahoo 的資料錄成本地 fixture")
+    p.add_argument("--tickers", nargs="*", default=None, help="預設為 HOT_STOCKS_MAP 全部")
+    p.add_argument("--period", default="60d")
+    p.add_argument("--interval", default="5m")
+    p.add_argument("--out", default=FIXTURE_DIR)
+    p.add_argument("--fmt", choices=["npy", "parquet"], default="npy")
+    a = p.parse_args()
+    if not a.record: p.print_help(); return
+    tickers = a.tickers or list(HOT_STOCKS_MAP)
+    done = record_fixtures(tickers, a.period, a.interval, a.out, a.fmt)
+    print(f"錄好 {len(done)} / {len(tickers)} 檔 -> {a.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# --- 後台統計 (預先彙總) ---
+# 事件寫出時順便累加計數器：每日/每小時瀏覽、回饋數、遊戲場數、戰力分布，
+# 後台只讀這些彙總值，不再整份讀 CSV 做 groupby。
+import math
+import os
+import sqlite3
+import threading
+from collections import Counter
+
+import pandas as pd
+
+DB_PATH = os.environ.get("GAME_METRICS_DB", "metrics.db")
+SCORE_BIN = 10   # 戰力分布每格寬度
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    metric TEXT NOT NULL, bucket TEXT NOT NULL, n INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (metric, bucket)
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def score_bucket(power):
+    return str(int(math.floor(float(power) / SCORE_BIN) * SCORE_BIN))
+
+
+# 一批事件 -> {(metric, bucket): 次數}
+def rollup_rows(stream, rows):
+    c = Counter()
+    for r in rows:
+        if stream == "traffic":
+            t = str(r.get("Time", ""))
+            c[("visits", "all")] += 1; c[("visits_day", t[:10])] += 1; c[("visits_hour", t[:13])] += 1
+        elif stream == "feedback":
+            c[("feedback", "all")] += 1; c[("feedback_day", str(r.get("Time", ""))[:10])] += 1
+        elif stream == "score":
+            c[("games", "all")] += 1; c[("games_day", str(r.get("date", ""))[:10])] += 1
+            try: c[("score_bin", score_bucket(r["power"]))] += 1
+            except (KeyError, TypeError, ValueError): pass
+    return c
+
+
+class Rollups:
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self.backfilled = False
+        self.conn().executescript(SCHEMA)
+
+    def conn(self):
+        c = getattr(self._local, "conn", None)
+        if c is None:
+            c = sqlite3.connect(self.path, timeout=10)
+            c.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = c
+        return c
+
+    def add(self, counts):
+        if not counts: return
+        with self.conn() as c:
+            c.executemany("INSERT INTO counters (metric, bucket, n) VALUES (?, ?, ?) "
+                          "ON CONFLICT(metric, bucket) DO UPDATE SET n = n + excluded.n",
+                          [(m, b, n) for (m, b), n in counts.items()])
+
+    # 給事件寫入器當 listener：(stream, rows) 寫成功後呼叫
+    def on_events(self, stream, rows):
+        self.add(rollup_rows(stream, rows))
+
+    def total(self, metric):
+        row = self.conn().execute("SELECT COALESCE(SUM(n), 0) FROM counters WHERE metric = ?", (metric,)).fetchone()
+        return row[0]
+
+    def series(self, metric, last=None):
+        sql = "SELECT bucket, n FROM counters WHERE metric = ? ORDER BY bucket"
+        if last: sql = f"SELECT * FROM ({sql} DESC LIMIT {int(last)}) ORDER BY bucket"
+        return pd.DataFrame(self.conn().execute(sql, (metric,)).fetchall(), columns=["bucket", "n"])
+
+    def histogram(self):
+        df = self.series("score_bin")
+        if df.empty: return df
+        df["bucket"] = df["bucket"].astype(int)
+        return df.sort_values("bucket").reset_index(drop=True)
+
+    # 第一次啟動時從既有的 CSV / 英雄榜補齊歷史資料，只做一次
+    def backfill(self, traffic_csv, feedback_csv, board):
+        if self.backfilled: return False
+        self.backfilled = True
+        c = self.conn()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            if c.execute("SELECT 1 FROM meta WHERE key = 'backfilled'").fetchone():
+                c.rollback(); return False
+            counts = Counter()
+            if os.path.exists(traffic_csv):
+                for chunk in pd.read_csv(traffic_csv, usecols=["Time"], chunksize=100000):
+                    t = chunk["Time"].astype(str)
+                    for key, s in (("visits_day", t.str[:10]), ("visits_hour", t.str[:13])):
+                        for b, n in s.value_counts().items(): counts[(key, b)] += int(n)
+                    counts[("visits", "all")] += len(chunk)
+            if os.path.exists(feedback_csv):
+                fb = pd.read_csv(feedback_csv, usecols=["Time"])
+                counts[("feedback", "all")] += len(fb)
+                for b, n in fb["Time"].astype(str).str[:10].value_counts().items(): counts[("feedback_day", b)] += int(n)
+            for date, power in board.conn().execute("SELECT date, power FROM scores"):
+                counts.update(rollup_rows("score", [{"date": date, "power": power}]))
+            c.executemany("INSERT INTO counters (metric, bucket, n) VALUES (?, ?, ?) "
+                          "ON CONFLICT(metric, bucket) DO UPDATE SET n = n + excluded.n",
+                          [(m, b, n) for (m, b), n in counts.items()])
+            c.execute("INSERT INTO meta (key, value) VALUES ('backfilled', '1')")
+            c.commit()
+            return True
+        except Exception:
+            c.rollback(); raise
+
+
+_ROLLUPS = None
+_ROLLUPS_LOCK = threading.Lock()
+
+
+def get_rollups():
+    global _ROLLUPS
+    with _ROLLUPS_LOCK:
+        if _ROLLUPS is None: _ROLLUPS = Rollups()
+    return _ROLLUPS
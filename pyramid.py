@@ -0,0 +1,65 @@
+# --- 多解析度 K 棒金字塔 ---
+# 每檔資料整理好之後一次算出 1m/5m/15m/60m (比原始解析度粗的各層)，全部用 reduceat 向量化。
+# 圖表依視野挑一層，使每次送到瀏覽器的 K 棒數固定在 max_points 以內，不管歷史多長。
+# 播放中的最後一根粗 K 棒只彙總到目前這根為止，不會洩漏未來的價格。
+import numpy as np
+import pandas as pd
+
+LEVELS = (1, 5, 15, 60)   # 分鐘
+SESSION_MINUTES = 270     # 台股盤中 09:00~13:30，一天的分鐘數
+INDICATORS = ("MA5", "MA22", "MA60", "MA240", "MACD", "Signal", "MACD_Hist")
+
+
+class Pyramid:
+    # extra：不在 df 裡的欄位 (共用資料延後計算的 MA240 / 訊號)
+    def __init__(self, df, levels=LEVELS, extra=None):
+        ts = pd.to_datetime(df["Datetime"], utc=True).dt.as_unit("ns").astype("int64").to_numpy()
+        step = np.median(np.diff(ts)) / 60e9 if len(ts) > 1 else 5
+        self.base_minutes = int(round(step))
+        self.n = len(df)
+        extra = extra or {}
+        has = lambda c: c in extra or c in df.columns
+        col = lambda c: extra[c] if c in extra else df[c].to_numpy()
+        self.o, self.h, self.l, self.c, self.v = col("Open"), col("High"), col("Low"), col("Close"), col("Volume")
+        self.ind = {k: col(k) for k in INDICATORS if has(k)}
+        self.bull = np.asarray(col("Signal_Bull"), dtype=bool) if has("Signal_Bull") else None
+        self.bear = np.asarray(col("Signal_Bear"), dtype=bool) if has("Signal_Bear") else None
+        # 每一層：各粗 K 棒在原始資料的起點 / 終點，以及彙總好的 OHLCV
+        self.levels = {}
+        for m in levels:
+            if m <= self.base_minutes: continue
+            key = ts // int(m * 60e9)   # 台北 UTC+8 沒有日光節約，整點/15 分對齊
+            starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+            ends = np.r_[starts[1:], self.n] - 1
+            lv = {"starts": starts, "ends": ends,
+                  "o": self.o[starts], "h": np.maximum.reduceat(self.h, starts), "l": np.minimum.reduceat(self.l, starts),
+                  "c": self.c[ends], "v": np.add.reduceat(self.v, starts)}
+            if self.bull is not None:
+                lv["bull"] = np.logical_or.reduceat(self.bull, starts); lv["bear"] = np.logical_or.reduceat(self.bear, starts)
+            self.levels[m] = lv
+
+    # 視野 span_bars (原始 K 棒數) 要塞進 max_points 根時用哪一層；0 表示原始解析度
+    def pick(self, span_bars, max_points):
+        if span_bars <= max_points: return 0
+        for m in sorted(self.levels):
+            if span_bars * self.base_minutes / m <= max_points: return m
+        return max(self.levels) if self.levels else 0
+
+    # 第 m 層、截至原始第 i 根的最後 count 根粗 K 棒 (最後一根只算到 i)
+    def window(self, m, i, count):
+        lv = self.levels[m]
+        b = int(np.searchsorted(lv["starts"], i, side="right")) - 1
+        a = max(0, b - count + 1)
+        s0 = lv["starts"][b]
+        out = {"x": lv["starts"][a:b + 1],
+               "o": lv["o"][a:b + 1], "h": lv["h"][a:b + 1].copy(), "l": lv["l"][a:b + 1].copy(),
+               "c": lv["c"][a:b + 1].copy(), "v": lv["v"][a:b + 1].copy()}
+        out["h"][-1] = self.h[s0:i + 1].max(); out["l"][-1] = self.l[s0:i + 1].min()
+        out["c"][-1] = self.c[i]; out["v"][-1] = self.v[s0:i + 1].sum()
+        # 指標沿用原始解析度在每根粗 K 棒收盤時的值
+        at = lv["ends"][a:b + 1].copy(); at[-1] = i
+        out.update({k: v[at] for k, v in self.ind.items()})
+        if self.bull is not None:
+            out["bull"] = lv["bull"][a:b + 1].copy(); out["bear"] = lv["bear"][a:b + 1].copy()
+            out["bull"][-1] = self.bull[s0:i + 1].any(); out["bear"][-1] = self.bear[s0:i + 1].any()
+        return out
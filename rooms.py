@@ -0,0 +1,157 @@
+# --- 比賽房間 (同步多人) ---
+# 一間房只有一條時鐘：K 棒位置由開賽時間推算，所有玩家看同一檔、同一根 K 棒，資料共用。
+# 每個 session 只保留自己的 Ledger；房間排行榜只在成交時更新，每根 K 棒不必重算全部玩家。
+#
+# 權益對價格是線性的 (equity = a + b * price，b 為部位)，所以把玩家依部位分組、組內依 a 排序：
+# 前 N 名用各組做 heap 合併，排名用各組二分搜尋，成本只跟「不同部位數」有關，跟房間人數無關。
+import bisect
+import heapq
+import random
+import string
+import threading
+import time
+
+from ledger import INITIAL_CAPITAL
+from rounds import RoundError, build_round, new_seed
+
+ROOM_BARS = 120        # 一場比賽播幾根 K 棒
+ROOM_INTERVAL = 0.5    # 每根 K 棒秒數 (和單人自動播放相同)
+ROOM_LEAD = 15         # 建立後幾秒開賽，讓玩家進場
+ROOM_TTL = 30 * 60     # 比賽結束後保留多久
+
+
+class RoomBoard:
+    def __init__(self):
+        self._groups = {}    # 部位 b -> 依 a 排序的 [(a, player), ...]
+        self._lines = {}     # player -> (a, b)
+        self.names = {}
+
+    def update(self, player, a, b, name=None):
+        old = self._lines.get(player)
+        if old is not None:
+            g = self._groups[old[1]]
+            g.pop(bisect.bisect_left(g, (old[0], player)))
+            if not g: del self._groups[old[1]]
+        bisect.insort(self._groups.setdefault(b, []), (a, player))
+        self._lines[player] = (a, b)
+        if name is not None: self.names[player] = name
+
+    def __len__(self):
+        return len(self._lines)
+
+    def __contains__(self, player):
+        return player in self._lines
+
+    def equity(self, player, price):
+        a, b = self._lines[player]
+        return a + b * price
+
+    # 各組從 a 最大的開始取，heap 合併出前 n 名
+    def top(self, price, n=10):
+        heap = []
+        for b, g in self._groups.items():
+            a, p = g[-1]
+            heap.append((-(a + b * price), p, b, len(g) - 1))
+        heapq.heapify(heap)
+        out = []
+        while heap and len(out) < n:
+            neg, p, b, i = heapq.heappop(heap)
+            out.append((self.names.get(p, p), -neg))
+            if i > 0:
+                a, q = self._groups[b][i - 1]
+                heapq.heappush(heap, (-(a + b * price), q, b, i - 1))
+        return out
+
+    # 名次 = 權益比自己高的人數 + 1
+    def rank(self, player, price):
+        mine = self.equity(player, price)
+        higher = 0
+        for b, g in self._groups.items():
+            higher += len(g) - bisect.bisect_right(g, (mine - b * price + 1e-6, chr(0x10FFFF)))
+        return higher + 1, len(self._lines)
+
+
+class Room:
+    def __init__(self, code, seed=None, bars=ROOM_BARS, interval=ROOM_INTERVAL, lead=ROOM_LEAD):
+        self.code = code
+        self.seed = new_seed() if seed is None else seed
+        rnd = build_round(self.seed, 1)
+        if rnd is None: raise RoundError("no eligible ticker")
+        self.ticker, self.name, self.data = rnd["ticker"], rnd["name"], rnd["data"]
+        self.start = rnd["start"]
+        self.end = min(self.start + bars, len(self.data) - 1)
+        self.interval = interval
+        self.starts_at = time.time() + lead
+        self.board = RoomBoard()
+        self._close = self.data["Close"].to_numpy()
+        self._lock = threading.Lock()
+        self._standings = (None, None)
+
+    # 共用時鐘：目前的 K 棒位置
+    def clock(self, now=None):
+        elapsed = (now or time.time()) - self.starts_at
+        if elapsed <= 0: return self.start
+        return min(self.start + int(elapsed / self.interval), self.end)
+
+    def started(self, now=None):
+        return (now or time.time()) >= self.starts_at
+
+    def finished(self, now=None):
+        return self.clock(now) >= self.end
+
+    @property
+    def ends_at(self):
+        return self.starts_at + (self.end - self.start) * self.interval
+
+    def price(self, idx=None):
+        return round(float(self._close[self.clock() if idx is None else idx]), 2)
+
+    def join(self, player, name):
+        with self._lock:
+            if player not in self.board: self.board.update(player, INITIAL_CAPITAL, 0, name)
+
+    # 玩家成交後回報自己的權益線
+    def report(self, player, ledger, name=None):
+        a, b = ledger.equity_line()
+        with self._lock:
+            self.board.update(player, a, b, name)
+            self._standings = (None, None)
+
+    # 同一根 K 棒內所有 session 共用同一份前 N 名
+    def standings(self, n=10):
+        idx = self.clock()
+        key, val = self._standings
+        if key == (idx, n): return val
+        with self._lock:
+            val = self.board.top(self.price(idx), n)
+            self._standings = ((idx, n), val)
+        return val
+
+    def rank(self, player):
+        with self._lock: return self.board.rank(player, self.price())
+
+
+ROOMS = {}
+_ROOMS_LOCK = threading.Lock()
+
+
+def _prune(now):
+    for code in [c for c, r in ROOMS.items() if r is not None and now - r.ends_at > ROOM_TTL]: del ROOMS[code]
+
+
+def create_room(seed=None, **kwargs):
+    with _ROOMS_LOCK:
+        _prune(time.time())
+        code = "".join(random.choices(string.ascii_uppercase, k=4))
+        while code in ROOMS: code = "".join(random.choices(string.ascii_uppercase, k=4))
+        ROOMS[code] = None   # 先佔住代碼，載入資料時不鎖住整個房間表
+    try: room = Room(code, seed, **kwargs)
+    except Exception:
+        with _ROOMS_LOCK: ROOMS.pop(code, None)
+        raise
+    with _ROOMS_LOCK: ROOMS[code] = room
+    return room
+
+
+def get_room(code):
+    with _ROOMS_LOCK: return ROOMS.get((code or "").strip().upper())
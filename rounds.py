@@ -0,0 +1,111 @@
+# --- 關卡產生與預先載入 ---
+# 每一關由 (種子, 關卡編號) 決定選哪一檔、從哪根 K 棒開始，同一組種子永遠是同樣的三關。
+# 玩家還在玩本關時，背景就先把後面幾關的資料準備好，結算後直接換上。
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from frames import FRAMES
+from gateway import DownloadError
+from market_data import HOT_STOCKS_MAP, screener
+from tracing import span
+
+MAX_RETRIES = 60
+MIN_ROUND_BARS = 200
+PREFETCH_DEPTH = 2
+PREFETCH_WORKERS = 4
+PERIODS = {"1m": "7d", "5m": "60d"}   # Yahoo 的 1 分 K 最多只給 7 天
+
+_POOL = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+_WARMED = {}   # (period, interval) -> 已經批次整理過的名單建立時間
+
+
+class RoundError(RuntimeError):   # 合格名單是空的或全部不能用
+    pass
+
+
+def new_seed():
+    return random.randrange(2 ** 32)
+
+
+# 開局起點：保留前 50 根與後 150 根
+def pick_start(n, rng):
+    max_start = n - 150
+    return rng.randint(50, max_start) if max_start > 50 else 50
+
+
+# 合格名單換新 (第一次建立或背景重建) 時，背景把整份名單的 K 棒一次批次整理好
+def warm_frames(index):
+    key = (index.period, index.interval)
+    if _WARMED.get(key) == index.built_at: return
+    _WARMED[key] = index.built_at
+    _POOL.submit(FRAMES.warm, index.eligible, index.period, index.interval)
+
+
+# 產生一關：{"ticker", "name", "data", "start"}；全部重試失敗回傳 None，沒有可用的合格標的丟 RoundError
+# 從排序過的合格名單快照抽，抽到 skip 裡的就再抽一次 (不管 skip 裡有什麼，亂數序列都一樣)，
+# 同一組種子在資料相同時永遠是同樣的關卡。skip 是呼叫端 (每個 session、每種週期) 的快照，這裡只讀不改，
+# 這次新發現不能用的檔案放進 bad 交回呼叫端合併，不動共用名單。
+def build_round(seed, round_no, tickers=None, max_retries=MAX_RETRIES, interval="5m", skip=(), bad=None):
+    tickers = tickers or list(HOT_STOCKS_MAP.keys())
+    skip = set(skip)
+    bad = set() if bad is None else bad
+    rng = random.Random(f"{seed}:{round_no}")
+    period = PERIODS.get(interval, "60d")
+    with span("load_data.screen"): index = screener(period, interval).ensure(tickers)   # 並行下載 + 向量化過濾，只從本週期的合格名單抽
+    warm_frames(index)
+    pool = index.eligible
+    for _ in range(max_retries):
+        if skip.issuperset(pool): raise RoundError("no eligible ticker")
+        ticker = rng.choice(pool)
+        if ticker in skip: continue
+        try:
+            with span("load_data.attempt"): df = FRAMES.get(ticker, period, interval)   # 跨 session 共用的唯讀資料
+            if len(df) < MIN_ROUND_BARS: skip.add(ticker); bad.add(ticker); continue
+            return {"ticker": ticker, "name": HOT_STOCKS_MAP.get(ticker, "未知"), "data": df, "start": pick_start(len(df), rng)}
+        except DownloadError:   # 熔斷 / 限流 / 下載失敗：這個 session 不再抽這一檔
+            skip.add(ticker); bad.add(ticker)
+        except Exception:
+            continue
+    return None
+
+
+class RoundPrefetcher:
+    def __init__(self, seed, max_rounds=3, depth=PREFETCH_DEPTH, interval="5m"):
+        self.seed = seed
+        self.interval = interval
+        self.max_rounds = max_rounds
+        self.depth = depth
+        self.skip = set()   # 這個 session、這種週期已確認不能用的檔案 (背景執行緒會合併，讀寫都要拿 _lock)
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    # 預先準備 current 之後的 depth 關
+    def schedule(self, current):
+        with self._lock:
+            for r in range(current + 1, min(current + self.depth, self.max_rounds) + 1):
+                if r not in self._futures: self._futures[r] = _POOL.submit(self._build, r)
+
+    def ready(self, round_no):
+        f = self._futures.get(round_no)
+        return f is not None and f.done()
+
+    # 取出某一關；還沒排進佇列就當場產生 (結果和預先載入的一樣)
+    def take(self, round_no, timeout=None):
+        with self._lock: f = self._futures.pop(round_no, None)
+        if f is None: return self._build(round_no)
+        try: return f.result(timeout=timeout)
+        except Exception: return self._build(round_no)
+
+    # 拿 skip 的快照去產生關卡，新發現的壞檔案再鎖住合併回去
+    def _build(self, round_no):
+        with self._lock: skip = frozenset(self.skip)
+        bad = set()
+        try: return build_round(self.seed, round_no, interval=self.interval, skip=skip, bad=bad)
+        finally:
+            with self._lock: self.skip |= bad
+
+    def cancel(self):
+        with self._lock:
+            for f in self._futures.values(): f.cancel()
+            self._futures.clear()
@@ -0,0 +1,174 @@
+# --- 遊戲進度快照 / 閒置 session 回收 ---
+# 每個 session 一個小檔：meta (JSON) + 成交紀錄 (Ledger 的結構化陣列原樣)，用 npz 存。
+# 成交、結算、換關時經由事件寫入器寫出，同一個 session 一批只寫最後一份；重新部署後靠網址的 ?sid= 接回來。
+# 佔記憶體的東西 (共用資料參考、圖表預算、權益曲線、預先載入) 放在 LiveState 裡，閒置太久由背景清掉，
+# 玩家回來時依快照裡的資料版本重新取得，只要幾毫秒。
+import io
+import json
+import os
+import re
+import threading
+import time
+import uuid
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from ledger import FILL_DTYPE
+
+SNAPSHOT_DIR = os.environ.get("GAME_SNAPSHOT_DIR", "sessions")
+SNAPSHOT_VERSION = 3   # 2：成交紀錄多了權益線欄位；3：多了手續費欄位
+SNAPSHOT_TTL = 3 * 24 * 3600   # 多久沒更新的快照會被清掉
+IDLE_TIMEOUT = 10 * 60         # 多久沒動作就釋放記憶體
+SWEEP_INTERVAL = 30
+
+_SID = re.compile(r"[0-9a-f]{32}")
+
+
+def valid_sid(sid):
+    return bool(sid) and _SID.fullmatch(sid) is not None
+
+
+def dumps(meta, fills):
+    buf = io.BytesIO()
+    meta = dict(meta, v=SNAPSHOT_VERSION)
+    np.savez(buf, meta=np.frombuffer(json.dumps(meta, ensure_ascii=False).encode("utf-8"), dtype=np.uint8),
+             fills=np.ascontiguousarray(fills, dtype=FILL_DTYPE))
+    return buf.getvalue()
+
+
+# 版本不合回傳 None (格式改了就當作沒有快照)
+def loads(raw):
+    with np.load(io.BytesIO(raw), allow_pickle=False) as z:
+        meta = json.loads(z["meta"].tobytes().decode("utf-8"))
+        if meta.get("v") != SNAPSHOT_VERSION: return None
+        return meta, z["fills"].astype(FILL_DTYPE, copy=False)
+
+
+class SnapshotStore:
+    def __init__(self, root=SNAPSHOT_DIR, ttl=SNAPSHOT_TTL):
+        self.root = root
+        self.ttl = ttl
+        self.stats = {"written": 0, "deleted": 0, "reads": 0, "misses": 0}
+
+    def _path(self, sid):
+        return os.path.join(self.root, f"{sid}.npz")
+
+    # 事件寫入器的 sink：rows 是 {"sid", "meta", "fills"} 或 {"sid", "delete": True}，同一個 sid 只留最後一筆
+    def write(self, rows):
+        last = {}
+        for r in rows: last[r["sid"]] = r
+        os.makedirs(self.root, exist_ok=True)
+        for sid, r in last.items():
+            if not valid_sid(sid): continue
+            if r.get("delete"): self.delete(sid); continue
+            tmp = f"{self._path(sid)}.{uuid.uuid4().hex}.tmp"
+            with open(tmp, "wb") as f: f.write(dumps(r["meta"], r["fills"]))
+            os.replace(tmp, self._path(sid))
+            self.stats["written"] += 1
+
+    def read(self, sid):
+        if not valid_sid(sid): return None
+        try:
+            with open(self._path(sid), "rb") as f: raw = f.read()
+            snap = loads(raw)
+        except Exception:
+            snap = None
+        self.stats["reads" if snap else "misses"] += 1
+        return snap
+
+    def delete(self, sid):
+        try:
+            os.remove(self._path(sid))
+            self.stats["deleted"] += 1
+        except OSError:
+            pass
+
+    def prune(self, now=None):
+        now = now or time.time()
+        try: names = os.listdir(self.root)
+        except OSError: return 0
+        n = 0
+        for name in names:
+            path = os.path.join(self.root, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl: os.remove(path); n += 1
+            except OSError:
+                pass
+        return n
+
+
+# 換了資料版本 (重新下載過) 時，用本關起點的時間找回新資料裡的位置；找不到回傳 None
+def realign(df, start, start_ts):
+    ts = pd.to_datetime(df["Datetime"], utc=True).dt.as_unit("ns").astype("int64").to_numpy()
+    i = int(np.searchsorted(ts, start_ts))
+    if i >= len(ts) or ts[i] != start_ts: return None
+    return i - start
+
+
+def bar_ts(df, i):
+    return int(pd.Timestamp(df["Datetime"].iloc[i]).as_unit("ns").value)
+
+
+# 一個 session 佔記憶體的部分；session_state 只放參考，回收時清空內容
+class LiveState:
+    __slots__ = ("data", "chart", "prefetch", "curve", "seen", "evicted", "__weakref__")
+
+    def __init__(self):
+        self.data = self.chart = self.prefetch = self.curve = None
+        self.seen = time.time()
+        self.evicted = False
+
+    def touch(self):
+        self.seen = time.time()
+
+    def evict(self):
+        if self.prefetch is not None: self.prefetch.cancel()
+        self.data = self.chart = self.prefetch = self.curve = None
+        self.evicted = True
+
+
+class IdleSweeper:
+    def __init__(self, store=None, timeout=IDLE_TIMEOUT, interval=SWEEP_INTERVAL):
+        self.store = store
+        self.timeout = timeout
+        self.interval = interval
+        self._live = weakref.WeakSet()   # session 結束後自動消失
+        self._lock = threading.Lock()
+        self._thread = None
+        self.stats = {"evicted": 0, "rehydrated": 0}
+
+    def track(self, live):
+        with self._lock:
+            self._live.add(live)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return live
+
+    def sweep(self, now=None):
+        now = now or time.time()
+        with self._lock: items = list(self._live)
+        n = 0
+        for live in items:
+            if not live.evicted and live.data is not None and now - live.seen > self.timeout:
+                live.evict(); n += 1
+        self.stats["evicted"] += n
+        return n
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sweep()
+                if self.store is not None: self.store.prune()
+            except Exception:
+                pass
+
+    def active(self):
+        with self._lock: return sum(1 for live in self._live if live.data is not None)
+
+
+SNAPSHOTS = SnapshotStore()
+SWEEPER = IdleSweeper(SNAPSHOTS)
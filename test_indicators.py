@@ -0,0 +1,100 @@
+# --- 技術指標測試 ---
+# pytest test_indicators.py；批次、串流、延後計算三種算法的結果必須一致
+import numpy as np
+import pandas as pd
+import pytest
+
+import indicators
+from indicators import COLUMNS, LAZY_COLUMNS, SIGNAL_COLUMNS, WARMUP, IndicatorState, compute, compute_batch
+
+
+def walk(n, seed=0, start=100.0):
+    rng = np.random.default_rng(seed)
+    return np.round(start * np.exp(np.cumsum(rng.normal(0, 0.004, n))), 2)
+
+
+def bars(n, seed=0):
+    close = walk(n, seed)
+    vol = np.random.default_rng(seed + 1).integers(0, 5000, n).astype(float)
+    vol[::37] = 0   # 零量 K 棒要被濾掉
+    idx = pd.date_range("2026-01-05 09:00", periods=n, freq="5min", tz="Asia/Taipei", name="Datetime")
+    return pd.DataFrame({"Open": close, "High": close * 1.002, "Low": close * 0.998, "Close": close, "Volume": vol}, index=idx)
+
+
+def assert_same(a, b):
+    for k in COLUMNS: np.testing.assert_allclose(a[k], b[k], rtol=1e-9, atol=1e-9, equal_nan=True, err_msg=k)
+    for k in SIGNAL_COLUMNS: assert np.array_equal(np.asarray(a[k], dtype=bool), np.asarray(b[k], dtype=bool)), k
+
+
+def test_compute_matches_pandas():
+    close = walk(800, 1)
+    s = pd.Series(close)
+    res = compute(close)
+    for w in indicators.MA_WINDOWS:
+        np.testing.assert_allclose(res[f"MA{w}"], s.rolling(w).mean(), rtol=1e-9, equal_nan=True)
+    macd = s.ewm(span=12, adjust=False).mean() - s.ewm(span=26, adjust=False).mean()
+    np.testing.assert_allclose(res["MACD"], macd, rtol=1e-9, atol=1e-12)
+    np.testing.assert_allclose(res["Signal"], macd.ewm(span=9, adjust=False).mean(), rtol=1e-9, atol=1e-12)
+
+
+def test_batch_matches_single_with_ragged_lengths():
+    closes = [walk(n, seed) for seed, n in enumerate((900, 300, 241, 50))]
+    for c, res in zip(closes, compute_batch(closes)): assert_same(res, compute(c))
+
+
+def test_stream_matches_batch():
+    close = walk(1000, 2)
+    res = compute(close)
+    state = IndicatorState()
+    rows = [state.update(c) for c in close]
+    stream = {k: np.array([r[k] for r in rows]) for k in COLUMNS + SIGNAL_COLUMNS}
+    assert_same(stream, res)
+    assert res["Signal_Bull"].any() and res["Signal_Bear"].any()   # 測試資料要真的有訊號
+
+
+def test_stream_update_is_constant_memory():
+    state = IndicatorState()
+    for c in walk(2000, 3): state.update(c)
+    assert all(len(state._buf[w]) == w for w in indicators.MA_WINDOWS)
+
+
+def test_lazy_frame_plus_lazy_columns_equals_eager_frame():
+    raw = bars(1500, 4)
+    eager = indicators.prepare_frame(raw)
+    lazy = indicators.prepare_frame(raw, lazy=True)
+    assert len(lazy) == len(eager) == (raw["Volume"] > 0).sum() - WARMUP
+    assert not set(LAZY_COLUMNS) & set(lazy.columns)
+    assert lazy["Bar_Index"].tolist() == list(range(len(lazy)))
+    pd.testing.assert_frame_equal(lazy, eager[lazy.columns])
+    cols = indicators.lazy_columns(indicators.source_close(raw), len(lazy))
+    for k in LAZY_COLUMNS: assert np.array_equal(cols[k], eager[k].to_numpy()), k
+
+
+def test_prepare_frames_matches_prepare_frame():
+    raws = [bars(n, seed) for seed, n in enumerate((1200, 700, 260))]
+    for lazy in (False, True):
+        for one, raw in zip(indicators.prepare_frames(raws, lazy=lazy), raws):
+            pd.testing.assert_frame_equal(one, indicators.prepare_frame(raw, lazy=lazy))
+
+
+def test_short_history_leaves_no_rows():
+    assert len(indicators.prepare_frame(bars(200, 5), lazy=True)) == 0
+
+
+def test_frame_store_builds_lazy_columns_once():
+    from frames import FrameStore
+
+    class Cache:
+        def __init__(self): self.raw = bars(1500, 6)
+        def get_versioned(self, ticker, period, interval): return 1, self.raw
+
+    store = FrameStore(cache=Cache())
+    df = store.get("X")
+    assert "MA240" not in df.columns
+    eager = indicators.prepare_frame(store.cache.raw)
+    cols = store.lazy(df)
+    np.testing.assert_array_equal(cols["MA240"], eager["MA240"].to_numpy(dtype=np.float32))
+    assert np.array_equal(cols["Signal_Bull"], eager["Signal_Bull"].to_numpy())
+    assert store.lazy(df) is cols and store.stats["lazy_builds"] == 1
+    with pytest.raises(ValueError): cols["MA240"][0] = 0   # 共用陣列唯讀
+    assert store.pyramid(df).ind["MA240"] is cols["MA240"]
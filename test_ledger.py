@@ -0,0 +1,192 @@
+# --- 帳本測試 ---
+# pytest test_ledger.py；只依賴 numpy，不需要 Streamlit / 網路
+import random
+
+import numpy as np
+import pytest
+
+from ledger import CLOSE, FEE_RATE, INITIAL_CAPITAL, OPEN, REVERSE, SELL, Ledger, format_fill
+from snapshots import dumps, loads
+
+
+# 舊版 trading_game.execute_trade 的算法 (拿掉 Streamlit)，帳本必須逐筆一致
+def legacy_execute(s, action, price, qty):
+    price = float(price); pos = s["position"]; avg = s["avg_cost"]
+    fee = price * qty * 0.002
+    if action == "buy":
+        if pos < 0:
+            cover_qty = min(abs(pos), qty); remaining_qty = qty - cover_qty
+            profit = (avg - price) * cover_qty
+            trade_roi = (avg - price) / avg * 100
+            s["trade_returns"].append(trade_roi)
+            s["balance"] += (avg * cover_qty + profit - fee); s["position"] += cover_qty
+            s["history"].append(f"🔴 空單回補 {cover_qty}股 (損: {int(profit)}, {trade_roi:.2f}%)")
+            if remaining_qty > 0 and s["balance"] >= price * remaining_qty:
+                s["balance"] -= (price * remaining_qty + fee); s["position"] += remaining_qty; s["avg_cost"] = price
+                s["history"].append(f"🔴 反手做多 {remaining_qty}股 @ {price:.2f}")
+        elif s["balance"] >= price * qty:
+            s["balance"] -= (price * qty + fee)
+            s["avg_cost"] = (avg * pos + price * qty) / (pos + qty); s["position"] += qty
+            s["history"].append(f"🔴 買進 {qty}股 @ {price:.2f}")
+    else:
+        if pos > 0:
+            sell_qty = min(pos, qty); remaining_qty = qty - sell_qty
+            profit = (price - avg) * sell_qty
+            trade_roi = (price - avg) / avg * 100
+            s["trade_returns"].append(trade_roi)
+            s["balance"] += (price * sell_qty - fee); s["position"] -= sell_qty
+            s["history"].append(f"🟢 賣出 {sell_qty}股 (損: {int(profit)}, {trade_roi:.2f}%)")
+            if remaining_qty > 0 and s["balance"] >= price * remaining_qty:
+                s["balance"] -= (price * remaining_qty + fee); s["position"] -= remaining_qty; s["avg_cost"] = price
+                s["history"].append(f"🟢 反手放空 {remaining_qty}股 @ {price:.2f}")
+        elif s["balance"] >= price * qty:
+            s["balance"] -= (price * qty + fee)
+            s["avg_cost"] = (avg * abs(pos) + price * qty) / (abs(pos) + qty); s["position"] -= qty
+            s["history"].append(f"🟢 放空 {qty}股 @ {price:.2f}")
+
+
+def legacy_equity(s, price):
+    pos, avg = s["position"], s["avg_cost"]
+    if pos > 0: return s["balance"] + pos * price
+    if pos < 0: return s["balance"] + (abs(pos) * avg + (avg - price) * abs(pos))
+    return s["balance"]
+
+
+def test_open_and_add_averages_cost_and_charges_fee():
+    led = Ledger()
+    assert led.execute("buy", 100, 1000, 0)
+    assert led.execute("buy", 110, 1000, 1)
+    assert led.position == 2000
+    assert led.avg_cost == pytest.approx(105)
+    fees = 100 * 1000 * FEE_RATE + 110 * 1000 * FEE_RATE
+    assert led.balance == pytest.approx(INITIAL_CAPITAL - 210000 - fees)
+    assert list(led.fills["kind"]) == [OPEN, OPEN]
+    assert led.fills["fee"].tolist() == pytest.approx([200, 220])
+    assert led.opened_at == 0
+
+
+def test_partial_close_keeps_position_and_avg_cost():
+    led = Ledger()
+    led.execute("buy", 100, 3000, 0)
+    led.execute("sell", 120, 1000, 5)
+    assert led.position == 2000 and led.avg_cost == 100
+    f = led.fills[-1]
+    assert (f["kind"], f["side"], f["qty"]) == (CLOSE, SELL, 1000)
+    assert f["pnl"] == pytest.approx(20000)
+    assert f["roi"] == pytest.approx(20)
+    assert f["fee"] == pytest.approx(120 * 1000 * FEE_RATE)
+    assert led.trade_returns().tolist() == pytest.approx([20])
+
+
+def test_flip_long_to_short_charges_fee_on_both_legs():
+    led = Ledger()
+    led.execute("buy", 100, 1000, 0)
+    before = led.balance
+    led.execute("sell", 90, 3000, 7)
+    fee = 90 * 3000 * FEE_RATE   # 舊版算法：平倉和反手各按整筆股數扣一次
+    assert led.position == -2000 and led.avg_cost == 90 and led.opened_at == 7
+    assert list(led.fills["kind"]) == [OPEN, CLOSE, REVERSE]
+    assert led.fills["fee"][1:].tolist() == pytest.approx([fee, fee])
+    assert led.balance == pytest.approx(before + 90 * 1000 - fee - (90 * 2000 + fee))
+    assert format_fill(led.fills[-1]) == "🟢 反手放空 2000股 @ 90.00"
+
+
+def test_flip_short_to_long_and_cover_math():
+    led = Ledger()
+    led.execute("sell", 50, 2000, 0)
+    led.execute("buy", 40, 3000, 3)
+    close = led.fills[1]
+    assert close["pnl"] == pytest.approx(20000) and close["roi"] == pytest.approx(20)
+    assert led.position == 1000 and led.avg_cost == 40
+
+
+def test_reverse_leg_skipped_when_funds_run_out():
+    led = Ledger(balance=150000)
+    led.execute("buy", 100, 1000, 0)
+    assert led.execute("sell", 100, 5000, 1)
+    assert led.position == 0
+    assert list(led.fills["kind"]) == [OPEN, CLOSE]
+
+
+def test_rejected_order_records_nothing():
+    led = Ledger(balance=50000)
+    assert not led.execute("buy", 100, 1000, 0)
+    assert led.n_fills == 0 and led.balance == 50000 and led.position == 0
+
+
+def test_short_equity_uses_margin_plus_unrealized():
+    led = Ledger()
+    led.execute("sell", 100, 1000, 0)
+    assert led.unrealized(90) == pytest.approx(10000)
+    assert led.equity(90) == pytest.approx(led.balance + 100 * 1000 + 10000)
+    a, b = led.equity_line()
+    assert a + b * 90 == pytest.approx(led.equity(90))
+
+
+def test_equity_curve_matches_bar_by_bar_replay():
+    rng = np.random.default_rng(3)
+    close = np.round(100 + np.cumsum(rng.normal(0, 1, 300)), 2)
+    led = Ledger(); ref = Ledger(); start = 20
+    expected = []
+    trades = {25: ("buy", 2000), 40: ("sell", 5000), 41: ("sell", 1000), 90: ("buy", 6000), 200: ("sell", 1000)}
+    for i in range(start, len(close)):
+        if i in trades:
+            action, qty = trades[i]
+            led.execute(action, close[i], qty, i); ref.execute(action, close[i], qty, i)
+        expected.append(ref.equity(close[i]))
+    assert led.equity_curve(close, start, len(close) - 1) == pytest.approx(expected)
+    assert Ledger().equity_curve(close, 0, 9) == pytest.approx([INITIAL_CAPITAL] * 10)
+
+
+def test_new_round_keeps_fills_and_restart_round_drops_them():
+    led = Ledger()
+    led.execute("buy", 100, 1000, 10); led.execute("sell", 110, 1000, 20)
+    carried = led.equity(110)
+    led.new_round(carried)
+    assert led.round == 2 and led.round_start == 2 and len(led.round_fills) == 0
+    led.execute("sell", 50, 2000, 5)
+    led.restart_round()
+    assert led.n_fills == 2 and led.round == 2
+    assert led.balance == carried and led.position == 0 and led.avg_cost == 0 and led.opened_at == -1
+    assert len(led.trade_returns()) == 1   # 前一關的平倉還在
+
+
+def test_shift_round_moves_only_current_round():
+    led = Ledger()
+    led.execute("buy", 100, 1000, 10)
+    led.new_round(led.equity(100))
+    led.execute("buy", 100, 1000, 30); led.execute("buy", 101, 1000, 35)
+    led.shift_round(-5)
+    assert led.fills["index"].tolist() == [10, 25, 30]
+    assert led.opened_at == 25
+    bx, _, sx, _ = led.markers(0, 100)
+    assert bx.tolist() == [25, 30] and len(sx) == 0
+
+
+def test_dump_load_and_snapshot_round_trip():
+    led = Ledger()
+    led.execute("buy", 100, 1000, 1); led.execute("sell", 105, 3000, 4)
+    state, fills = led.dump()
+    meta, back = loads(dumps({"ledger": state}, fills))
+    again = Ledger.load(meta["ledger"], back)
+    assert np.array_equal(again.fills, led.fills)
+    assert again.fills["fee"].tolist() == pytest.approx(led.fills["fee"].tolist())
+    assert (again.balance, again.position, again.avg_cost, again.opened_at) == (led.balance, led.position, led.avg_cost, led.opened_at)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_parity_with_legacy_execute_trade(seed):
+    rng = random.Random(seed)
+    led = Ledger()
+    s = {"balance": INITIAL_CAPITAL, "position": 0, "avg_cost": 0.0, "trade_returns": [], "history": []}
+    price = 100.0
+    for i in range(200):
+        price = round(max(1.0, price * (1 + rng.gauss(0, 0.02))), 2)
+        action = rng.choice(["buy", "sell"]); qty = rng.choice([1000, 2000, 5000, 20000, 50000])
+        led.execute(action, price, qty, i); legacy_execute(s, action, price, qty)
+        assert led.balance == pytest.approx(s["balance"], abs=1e-6)
+        assert led.position == s["position"]
+        assert led.avg_cost == pytest.approx(s["avg_cost"], abs=1e-9)
+        assert led.equity(price) == pytest.approx(legacy_equity(s, price), abs=1e-6)
+    assert led.trade_returns().tolist() == pytest.approx(s["trade_returns"])
+    assert led.history(len(s["history"])) == s["history"]
@@ -0,0 +1,92 @@
+# --- 效能追蹤 (span) ---
+# 每個階段包一個 span，耗時丟進整個 process 共用的環形緩衝，後台算 p50/p95/p99。
+# cProfile 可針對單一 session 開啟 (網址加 ?profile=1 或後台勾選)，結果留最近幾份給後台看。
+import cProfile
+import io
+import pstats
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+
+MAX_SAMPLES = 1000   # 每個階段保留最近幾次
+MAX_PROFILES = 10
+
+_SPANS = defaultdict(lambda: deque(maxlen=MAX_SAMPLES))
+_LOCK = threading.Lock()
+PROFILES = deque(maxlen=MAX_PROFILES)   # (時間, session 標記, pstats 文字)
+
+
+def record(name, ms):
+    with _LOCK: _SPANS[name].append(ms)
+
+
+@contextmanager
+def span(name):
+    t0 = time.perf_counter()
+    try: yield
+    finally: record(name, (time.perf_counter() - t0) * 1000)
+
+
+def traced(name):
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name): return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def summary():
+    with _LOCK: snap = {k: np.array(v) for k, v in _SPANS.items() if v}
+    rows = [{"stage": k, "n": len(a), "p50_ms": np.percentile(a, 50), "p95_ms": np.percentile(a, 95),
+             "p99_ms": np.percentile(a, 99), "max_ms": a.max()} for k, a in sorted(snap.items())]
+    return pd.DataFrame(rows, columns=["stage", "n", "p50_ms", "p95_ms", "p99_ms", "max_ms"])
+
+
+# 每個 process 只記第一次 (冷啟動)
+_ONCE = set()
+
+
+def record_once(name, ms):
+    with _LOCK:
+        if name in _ONCE: return
+        _ONCE.add(name)
+    record(name, ms)
+
+
+def samples(name):
+    with _LOCK: return list(_SPANS.get(name, ()))
+
+
+def reset():
+    with _LOCK: _SPANS.clear()
+
+
+# --- 整頁重跑 ---
+# 腳本開頭 begin_rerun、結尾 end_rerun；中途 st.rerun()/st.stop() 的那次不計入
+def begin_rerun(state, profile=False):
+    prof = state.pop("_profiler", None)
+    if prof is not None:   # 上一次被中斷，沒走到結尾
+        try: prof.disable()
+        except Exception: pass
+    state["_rerun_t0"] = time.perf_counter()
+    if profile:
+        prof = cProfile.Profile()
+        try: prof.enable(); state["_profiler"] = prof
+        except ValueError: pass   # 已有其他 profiler 在跑
+
+
+def end_rerun(state, label=""):
+    t0 = state.pop("_rerun_t0", None)
+    if t0 is not None: record("rerun", (time.perf_counter() - t0) * 1000)
+    prof = state.pop("_profiler", None)
+    if prof is not None:
+        prof.disable()
+        out = io.StringIO()
+        pstats.Stats(prof, stream=out).sort_stats("cumulative").print_stats(30)
+        PROFILES.append((time.strftime("%Y-%m-%d %H:%M:%S"), label, out.getvalue()))
@@ -0,0 +1,179 @@
+# --- 逐筆成交事件 (欄式儲存) ---
+# 每一筆成交都記成一列有型別的事件，經由事件寫入器批次寫成 Parquet 小段檔 (只增不改)；
+# 小段檔累積到一定數量就合併成大檔。後台分析整欄讀出後用 pandas/NumPy 向量化彙總，不逐列跑迴圈。
+import glob
+import os
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ledger import BUY, CLOSE
+
+try:
+    import fcntl
+except ImportError:   # Windows 沒有 fcntl，合併時只靠單一 process
+    fcntl = None
+
+TRADES_DIR = os.environ.get("GAME_TRADES_DIR", "trade_events")
+COMPACT_AT = 32           # 小段檔累積幾個就合併
+PART_ROWS = 1000000       # 合併後的大檔超過這個列數就不再併進新的
+HOLD_BINS = [0, 1, 5, 20, 60, 240, np.inf]
+HOLD_LABELS = ["<1", "1-5", "5-20", "20-60", "60-240", "240+"]
+
+SCHEMA = pa.schema([
+    ("time", pa.timestamp("ms")), ("sid", pa.string()), ("player", pa.string()), ("room", pa.string()),
+    ("seed", pa.int64()), ("round", pa.int16()), ("ticker", pa.string()), ("interval", pa.string()),
+    ("index", pa.int32()), ("side", pa.int8()), ("kind", pa.int8()), ("qty", pa.int32()),
+    ("price", pa.float32()), ("pnl", pa.float32()), ("roi", pa.float32()),
+    ("position", pa.int32()),        # 成交後部位
+    ("hold_bars", pa.int32()),       # 平倉：從開倉到平倉經過幾根 K 棒；開倉為 0
+    ("signal", pa.int8()),           # 成交那根 K 棒的訊號：1 攻擊、-1 棄守、0 無
+    ("entry_signal", pa.int8()),     # 這個部位開倉那根的訊號
+    ("hints", pa.bool_()),           # 玩家是否開著 AI 提示
+])
+
+
+# signals：含 Signal_Bull / Signal_Bear 的 DataFrame，或 FrameStore.lazy 回傳的陣列 (和 K 棒逐列對齊)
+def bar_signal(signals, i):
+    if i < 0 or "Signal_Bull" not in signals: return 0
+    return 1 if signals["Signal_Bull"][i] else -1 if signals["Signal_Bear"][i] else 0
+
+
+# 一次下單新增的成交 (Ledger.fills 的一段) -> 事件列；opened_at 是下單前的開倉位置
+def fill_events(fills, signals, opened_at, position, **meta):
+    now = pd.Timestamp.now()
+    entry = bar_signal(signals, opened_at)
+    rows = []
+    for f in fills:
+        i = int(f["index"]); kind = int(f["kind"]); sig = bar_signal(signals, i)
+        close = kind == CLOSE
+        rows.append(dict(meta, time=now, index=i, side=int(f["side"]), kind=kind, qty=int(f["qty"]), price=float(f["price"]),
+                         pnl=float(f["pnl"]), roi=float(f["roi"]), position=int(position),
+                         hold_bars=i - opened_at if close and opened_at >= 0 else 0,
+                         signal=sig, entry_signal=entry if close else sig))
+    return rows
+
+
+class TradeStore:
+    def __init__(self, root=TRADES_DIR, compact_at=COMPACT_AT, part_rows=PART_ROWS):
+        self.root = root
+        self.compact_at = compact_at
+        self.part_rows = part_rows
+        self.stats = {"written": 0, "segments": 0, "compactions": 0}
+
+    def _new_path(self, prefix):
+        return os.path.join(self.root, f"{prefix}-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet")
+
+    def _write_table(self, table, prefix):
+        path = self._new_path(prefix)
+        tmp = path + ".tmp"
+        pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, path)
+        return path
+
+    # 事件寫入器的 sink：一批寫成一個小段檔
+    def write(self, rows):
+        if not rows: return
+        os.makedirs(self.root, exist_ok=True)
+        self._write_table(pa.Table.from_pylist(rows, schema=SCHEMA), "seg")
+        self.stats["written"] += len(rows); self.stats["segments"] += 1
+        if len(self.segments()) >= self.compact_at: self.compact()
+
+    def segments(self):
+        return sorted(glob.glob(os.path.join(self.root, "seg-*.parquet")))
+
+    def parts(self):
+        return sorted(glob.glob(os.path.join(self.root, "part-*.parquet")))
+
+    def files(self):
+        return self.parts() + self.segments()
+
+    # 小段檔 (加上還沒滿的大檔) 合併成一個大檔；加跨 process 檔案鎖，同時只有一個人在合併
+    def compact(self):
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, ".compact.lock"), "a") as lock:
+            if fcntl: fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                small = [p for p in self.parts() if pq.ParquetFile(p).metadata.num_rows < self.part_rows]
+                inputs = small + self.segments()
+                if len(inputs) < 2: return 0
+                self._write_table(pa.concat_tables([pq.read_table(p, schema=SCHEMA) for p in inputs]), "part")
+                for p in inputs: os.remove(p)
+                self.stats["compactions"] += 1
+                return len(inputs)
+            finally:
+                if fcntl: fcntl.flock(lock, fcntl.LOCK_UN)
+
+    # 只讀需要的欄位；讀到一半檔案被合併掉就重新列一次
+    def table(self, columns=None):
+        for _ in range(3):
+            files = self.files()
+            if not files: return SCHEMA.empty_table().select(columns) if columns else SCHEMA.empty_table()
+            try: return pa.concat_tables([pq.read_table(p, columns=columns, schema=SCHEMA) for p in files])
+            except FileNotFoundError: continue
+        raise RuntimeError("trade store is being compacted")
+
+    def frame(self, columns=None):
+        return self.table(columns).to_pandas()
+
+    def count(self):
+        n = 0
+        for p in self.files():
+            try: n += pq.ParquetFile(p).metadata.num_rows
+            except (FileNotFoundError, OSError): pass
+        return n
+
+
+ANALYSIS_COLUMNS = ["player", "side", "kind", "pnl", "roi", "hold_bars", "entry_signal", "hints"]
+
+
+# 全部向量化：布林遮罩 + 整數代碼分組 (Categorical)，沒有逐列迴圈
+DIRECTIONS = ["多單", "空單"]
+ALIGNS = ["順訊號", "逆訊號", "無訊號"]
+HINTS = ["提示關", "提示開"]
+
+
+def analyze(df):
+    kind = df["kind"].to_numpy()
+    closes = df[kind == CLOSE]
+    opens_side = df["side"].to_numpy()[kind != CLOSE]
+    win = closes["pnl"].to_numpy() > 0
+    hold = closes["hold_bars"].to_numpy()
+    # 賣出平倉的是多單，買進回補的是空單
+    short = closes["side"].to_numpy() == BUY
+    d = np.where(short, -1, 1)
+    es = closes["entry_signal"].to_numpy()
+    align = np.where(es == 0, 2, np.where(es == d, 0, 1))
+    c = pd.DataFrame({"dir": pd.Categorical.from_codes(short.astype(np.int8), DIRECTIONS),
+                      "align": pd.Categorical.from_codes(align.astype(np.int8), ALIGNS),
+                      "hints": pd.Categorical.from_codes(closes["hints"].to_numpy().astype(np.int8), HINTS),
+                      "hold_bin": pd.cut(hold, HOLD_BINS, labels=HOLD_LABELS, right=False),
+                      "win": win, "roi": closes["roi"].to_numpy(), "hold": hold})
+    agg = dict(筆數=("win", "size"), 勝率=("win", "mean"), 平均報酬=("roi", "mean"), 持有中位數=("hold", "median"))
+    group = lambda keys: (lambda t: t.assign(勝率=t["勝率"] * 100))(c.groupby(keys, observed=False).agg(**agg))
+    summary = {
+        "fills": len(df), "closes": len(closes), "players": int(df["player"].nunique()),
+        "win_rate": float(win.mean() * 100) if len(win) else 0.0,
+        "median_hold": float(np.median(hold)) if len(hold) else 0.0,
+        "long_share": float((opens_side == BUY).mean() * 100) if len(opens_side) else 0.0,
+    }
+    return {"summary": summary, "by_direction": group("dir"), "by_signal": group(["hints", "align"]), "by_hold": group("hold_bin")}
+
+
+TRADES = TradeStore()
+_ANALYSIS = {}   # root -> (檔名清單, 分析結果)
+
+
+# 檔案只增不改 (合併也是寫成新檔名)，檔名清單沒變結果就不會變，不用重讀重算；沒有成交回傳 None
+def cached_analysis(store=TRADES):
+    files = tuple(store.files())
+    hit = _ANALYSIS.get(store.root)
+    if hit is not None and hit[0] == files: return hit[1]
+    df = store.frame(ANALYSIS_COLUMNS)
+    res = analyze(df) if len(df) else None
+    _ANALYSIS[store.root] = (files, res)
+    return res
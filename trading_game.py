@@ -1,20 +1,33 @@
+import time
+_T0 = time.perf_counter() # 冷啟動計時起點
 import streamlit as st
-import yfinance as yf
-import plotly.graph_objects as go
-import plotly.express as px
-from plotly.subplots import make_subplots
 import pandas as pd
-import random
-import time
-import os
+import uuid
 from datetime import datetime
-import math
+from market_data import MARKET_CACHE, HOT_STOCKS_MAP
+from rounds import RoundError, RoundPrefetcher, new_seed
+from rooms import create_room, get_room
+from charts import RoundChart, VIEWS, sparkline_svg
+from frames import FRAMES
+from leaderboard import get_board, PAGE_SIZE as LB_PAGE_SIZE
+from events import WRITER, CsvSink
+from metrics import get_rollups
+from trades import TRADES, fill_events
+from snapshots import SNAPSHOTS, SWEEPER, LiveState, valid_sid, realign, bar_ts
+from ledger import Ledger, power_score, risk_stats, RISK_WEIGHTS
+import tracing
+from tracing import span
+tracing.record_once("startup.imports", (time.perf_counter() - _T0) * 1000) # 只有 process 第一次跑時才是冷啟動
 
 # --- 1. 全域設定 ---
 st.set_page_config(page_title="交易挑戰賽", layout="wide", page_icon="⚔️")
 
+# 整頁重跑計時；網址加 ?profile=1 (或後台勾選) 時本 session 開 cProfile
+if st.query_params.get("profile") == "1": st.session_state.profiling = True
+tracing.begin_rerun(st.session_state, profile=st.session_state.get('profiling', False))
+
 # CSS 優化
-st.markdown("""
+with span("css"): st.markdown("""
 <style>
     /* 1. 全域容器 */
     .block-container { padding-top: 1rem !important; padding-bottom: 0rem !important; max-width: 100%; }
@@ -54,6 +67,10 @@ st.markdown("""
         font-family: 'Arial', sans-serif;
     }
     @keyframes pulse { 0% { transform: translate(-50%, -50%) scale(0.8); opacity: 0; } 50% { transform: translate(-50%, -50%) scale(1.2); opacity: 1; } 100% { transform: translate(-50%, -50%) scale(1); opacity: 0; } }
+    /* 倒數由瀏覽器自己跑，不卡住伺服器；--d 是已經過的秒數 (負值) */
+    .count::after { content: ""; animation: tick 3s steps(1) var(--d, 0s) forwards; }
+    @keyframes tick { 0% { content: "3"; } 33.33% { content: "2"; } 66.67% { content: "1"; } 100% { content: ""; } }
+    @keyframes hideLater { to { visibility: hidden; opacity: 0; pointer-events: none; } }
 
     /* 其他 */
     .asset-box { padding: 10px; background-color: #f0f2f6; border-radius: 8px; margin-bottom: 10px; }
@@ -75,213 +92,360 @@ st.markdown("""
 
 FILES = { "leaderboard": "leaderboard_tw_v4.csv", "feedback": "feedback.csv", "traffic": "traffic_log.csv" }
 
-HOT_STOCKS_MAP = {
-    '6462.TWO': '神盾', '8054.TWO': '安國', '6684.TWO': '安格', '3529.TWO': '力旺', 
-    '6531.TW': '愛普', '6643.TW': 'M31', '3661.TW': '世芯-KY',
-    '4979.TW': '華星光', '3363.TW': '上詮', '3450.TW': '聯鈞', '4908.TWO': '前鼎', 
-    '3163.TWO': '波若威', '4977.TW': '眾達-KY',
-    '1519.TW': '華城', '1514.TW': '亞力', '1513.TW': '中興電', '1609.TW': '大亞',
-    '6806.TW': '森崴能源', '9958.TW': '世紀鋼',
-    '6472.TWO': '保瑞', '4763.TWO': '材料-KY', '1795.TWO': '美時', '4114.TWO': '健喬',
-    '3017.TW': '奇鋐', '3324.TWO': '雙鴻', '8996.TWO': '高力', '3653.TW': '健策',
-    '3032.TW': '偉訓', '8210.TW': '勤誠',
-    '3583.TW': '辛耘', '3131.TW': '弘塑', '6187.TWO': '萬潤', '5443.TWO': '均豪'
-}
+# 所有寫檔都經過共用的事件寫入器 (背景批次 + 檔案鎖)；每個 process 只設定一次，不在每次重跑時重做
+def init_writers():
+    WRITER.register("traffic", CsvSink(FILES["traffic"], ["Time", "Page"]))
+    WRITER.register("feedback", CsvSink(FILES["feedback"], ["Time", "User", "Message"]))
+    WRITER.register("score", lambda rows: get_board().add_many(rows))
+    WRITER.register("trades", TRADES) # 逐筆成交，寫成 Parquet 小段檔給後台分析
+    WRITER.register("snapshot", SNAPSHOTS) # 遊戲進度快照，同一個 session 一批只寫最後一份
+    # 後台統計在事件寫出時同步累加
+    try: get_rollups().backfill(FILES["traffic"], FILES["feedback"], get_board())
+    except: pass
+    WRITER.listen("rollups", get_rollups().on_events)
+
+WRITER.setup_once("game", init_writers)
+
 
 # --- 3. 初始化 Session State ---
 default_values = {
-    'balance': 10000000.0, 'position': 0, 'avg_cost': 0.0, 'step': 0,
-    'history': [], 'trades_visual': [], 'data': None, 'ticker': "",
+    'ledger': None, 'step': 0,
+    'ticker': "", 'data_key': None,
     'stock_name': "", 'nickname': "", 'game_started': False, 
     'auto_play': False, 'first_load': True, 'is_admin': False,
-    'trade_returns': [], 'last_equity': 10000000.0,
+    'last_equity': 10000000.0,
     'show_hints': False,
-    'round': 1, 'max_rounds': 3, 'in_countdown': False,
+    'round': 1, 'max_rounds': 3, 'countdown_until': 0.0, 'reveal': None, 'last_tick': 0.0, 'play_anchor': None,
+    'game_seed': None, 'room': None, 'player_id': None, 'sid': None,
+    'interval': "5m", 'chart_view': "近 100 根", 'equity_hist': (), # 已結算各關的逐根權益
     'nav_selection': "📊 操盤室"
 }
 
 for key, value in default_values.items():
     if key not in st.session_state: st.session_state[key] = value
+if st.session_state.ledger is None: st.session_state.ledger = Ledger()
+# 資料參考 / 圖表 / 預先載入放在 LiveState，閒置太久會被背景清空，回來時依 data_key 重新取得
+if 'live' not in st.session_state: st.session_state.live = SWEEPER.track(LiveState())
+live = st.session_state.live
+live.touch()
+
+# 背景預熱行情快取 (每個 process 只會跑一次)
+MARKET_CACHE.warm_up(list(HOT_STOCKS_MAP.keys()))
 
 # --- 4. 後台與數據系統 ---
 def log_traffic():
     if 'traffic_logged' not in st.session_state:
-        try:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            new_data = pd.DataFrame([{"Time": timestamp, "Page": "Home"}])
-            hdr = not os.path.exists(FILES["traffic"])
-            new_data.to_csv(FILES["traffic"], mode='a', header=hdr, index=False)
-            st.session_state.traffic_logged = True
-        except: pass
-
-def get_admin_data():
-    data = {}
-    if os.path.exists(FILES["traffic"]):
-        df_t = pd.read_csv(FILES["traffic"]); df_t['Time'] = pd.to_datetime(df_t['Time']); data['traffic'] = df_t
-    else: data['traffic'] = pd.DataFrame()
-    if os.path.exists(FILES["feedback"]):
-        try:
-            with open(FILES["feedback"], "r", encoding="utf-8") as f: data['feedback'] = f.readlines()
-        except: data['feedback'] = []
-    else: data['feedback'] = []
-    if os.path.exists(FILES["leaderboard"]): data['leaderboard'] = pd.read_csv(FILES["leaderboard"])
-    else: data['leaderboard'] = pd.DataFrame()
-    return data
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        WRITER.emit("traffic", {"Time": timestamp, "Page": "Home"})
+        st.session_state.traffic_logged = True
 
 # --- 5. 核心邏輯 ---
-def calculate_technical_indicators(df):
-    try:
-        df['MA5'] = df['Close'].rolling(window=5).mean()
-        df['MA22'] = df['Close'].rolling(window=22).mean()
-        df['MA60'] = df['Close'].rolling(window=60).mean()
-        df['MA240'] = df['Close'].rolling(window=240).mean()
-        df['MA22_Slope'] = df['MA22'].diff()
-        exp1 = df['Close'].ewm(span=12, adjust=False).mean()
-        exp2 = df['Close'].ewm(span=26, adjust=False).mean()
-        df['MACD'] = exp1 - exp2
-        df['Signal'] = df['MACD'].ewm(span=9, adjust=False).mean()
-        df['MACD_Hist'] = df['MACD'] - df['Signal']
-        
-        df['Signal_Bull'] = ((df['MA5'] > df['MA22']) & (df['MA22_Slope'] > 0) & (df['MACD_Hist'] > 0) & (df['MACD_Hist'] > df['MACD_Hist'].shift(1)))
-        df['Signal_Bear'] = ((df['MA5'] < df['MA22']) & (df['MA22_Slope'] < 0) & (df['MACD_Hist'] < 0) & (df['MACD_Hist'] < df['MACD_Hist'].shift(1)))
-        return df
-    except: return df
-
+# 關卡由 (種子, 關卡) 決定，通常背景已經準備好，這裡只是取出
+@tracing.traced("load_data")
 def load_data():
-    max_retries = 60 # 限制嘗試次數，避免無限迴圈
-    ticker_list = list(HOT_STOCKS_MAP.keys())
-    
     status_placeholder = st.empty() # 用來顯示搜尋進度
-    
-    for i in range(max_retries):
-        selected_ticker = random.choice(ticker_list)
-        status_placeholder.info(f"🔍 正在掃描市場標的：{HOT_STOCKS_MAP[selected_ticker]} ({selected_ticker})...")
-        
-        try:
-            df = yf.download(selected_ticker, period="60d", interval="5m", progress=False)
-            if isinstance(df.columns, pd.MultiIndex): df.columns = df.columns.get_level_values(0)
-            df = df[df['Volume'] > 0]
-            if len(df) < 300: continue
-            
-            # 價格過濾: <= 200
-            current_price = df['Close'].iloc[-1]
-            if current_price > 200: continue
-
-            # 波動過濾
-            df['Fluctuation'] = (df['High'] - df['Low']) / df['Open'] * 100
-            if df['Fluctuation'].mean() < 0.15 or df['Fluctuation'].max() < 1.5: continue
-
-            df = calculate_technical_indicators(df)
-            df.dropna(inplace=True); df.reset_index(inplace=True); df['Bar_Index'] = range(len(df))
-            if len(df) < 200: continue
-            
-            max_start = len(df) - 150
-            start_idx = random.randint(50, max_start) if max_start > 50 else 50
-            st.session_state.step = start_idx
-            st.session_state.first_load = True
-            
-            status_placeholder.empty() # 清除進度條
-            return selected_ticker, HOT_STOCKS_MAP[selected_ticker], df
-        except: continue
-    
-    status_placeholder.error("搜尋超時，將隨機載入一檔。")
-    time.sleep(1)
-    status_placeholder.empty()
-    return selected_ticker, HOT_STOCKS_MAP.get(selected_ticker, "未知"), df
+    status_placeholder.info("🔍 正在掃描市場標的...")
+    if live.prefetch is None: # 沒經過 prepare_next_round(full_reset) 或剛被回收的 session
+        st.session_state.game_seed = st.session_state.game_seed or new_seed()
+        live.prefetch = RoundPrefetcher(st.session_state.game_seed, st.session_state.max_rounds, interval=st.session_state.interval)
+    prefetch = live.prefetch
+    try: rnd = prefetch.take(st.session_state.round)
+    except RoundError: # 合格名單是空的或全部連不上：不拿沒篩選過的股票頂替
+        status_placeholder.empty()
+        st.error("目前沒有可用的標的 (行情來源可能暫時連不上)，請稍後重新整理再試。"); st.stop()
+    prefetch.schedule(st.session_state.round) # 玩這關的同時先準備後面幾關
+    status_placeholder.empty() # 清除進度條
+    if rnd is None:
+        st.error("搜尋超時，請重新整理再試一次。"); st.stop()
+    st.session_state.step = rnd["start"]
+    st.session_state.first_load = True
+    ticker, period, interval, version = FRAMES.key_of(rnd["data"]) or (rnd["ticker"], None, st.session_state.interval, None)
+    st.session_state.data_key = {"ticker": ticker, "period": period, "interval": interval, "version": version,
+                                 "start": rnd["start"], "start_ts": bar_ts(rnd["data"], rnd["start"])}
+    return rnd["ticker"], rnd["name"], rnd["data"]
 
 # [修復] 將準備下一關的邏輯拆分，不在此處加載數據，避免UI卡死
 def prepare_next_round(full_reset=False):
     if full_reset:
-        st.session_state.balance = 10000000.0
+        if live.prefetch is not None: live.prefetch.cancel()
+        seed = st.query_params.get("seed") # 網址加 ?seed=123 可重現同樣的三關
+        st.session_state.game_seed = int(seed) if seed and seed.isdigit() else new_seed()
+        live.prefetch = RoundPrefetcher(st.session_state.game_seed, st.session_state.max_rounds, interval=st.session_state.interval)
+        st.session_state.reveal = None
+        st.session_state.room = None # 重新開局就離開比賽房間
+        st.session_state.ledger = Ledger(10000000.0)
         st.session_state.round = 1
-        st.session_state.trade_returns = []
         st.session_state.last_equity = 10000000.0
+        st.session_state.equity_hist = ()
         st.session_state.nav_selection = "📊 操盤室"
     else:
-        st.session_state.balance = st.session_state.last_equity
         st.session_state.round += 1
+        st.session_state.ledger.new_round(st.session_state.last_equity, st.session_state.round)
     
     # 關鍵：清空數據，觸發主流程的重新加載
-    st.session_state.data = None 
-    st.session_state.position = 0
-    st.session_state.avg_cost = 0.0
-    st.session_state.history = []
-    st.session_state.trades_visual = []
-    st.session_state.auto_play = False
-    st.session_state.in_countdown = True
-
+    live.data = None; st.session_state.data_key = None
+    st.session_state.auto_play = False; st.session_state.play_anchor = None
+
+# --- 進度快照 ---
+# 成交 / 結算 / 換關 / 暫停時寫出；房間模式不存 (房間不會跨重啟)
+SNAPSHOT_EVERY = 20 # 自動播放時每幾根 K 棒順便存一次
+
+def save_snapshot():
+    ss = st.session_state
+    if ss.room or not valid_sid(ss.sid): return
+    state, fills = ss.ledger.dump()
+    meta = {"saved_at": time.time(), "nickname": ss.nickname, "show_hints": ss.show_hints, "interval": ss.interval,
+            "seed": ss.game_seed, "round": ss.round, "max_rounds": ss.max_rounds, "ticker": ss.ticker, "stock_name": ss.stock_name,
+            "data": ss.data_key, "step": ss.step, "last_equity": ss.last_equity, "ledger": state, "equity_hist": list(ss.equity_hist)}
+    WRITER.emit("snapshot", {"sid": ss.sid, "meta": meta, "fills": fills})
+
+def drop_snapshot(): # 通關或破產後不再接回
+    if valid_sid(st.session_state.sid): WRITER.emit("snapshot", {"sid": st.session_state.sid, "delete": True})
+
+# 依 data_key 取回同一份資料；資料重新下載過就用本關起點的時間對齊 K 棒位置
+def rehydrate():
+    ss = st.session_state; k = ss.data_key
+    try:
+        with span("session.rehydrate"):
+            df = FRAMES.get(k["ticker"], k["period"], k["interval"])
+            key = FRAMES.key_of(df)
+            if key is not None and key[3] != k["version"]:
+                shift = realign(df, k["start"], k["start_ts"])
+                if shift is None: raise LookupError(k["ticker"])
+                ss.step += shift; ss.ledger.shift_round(shift)
+                ss.data_key = dict(k, start=k["start"] + shift, version=key[3])
+            live.data = df
+            if live.prefetch is None:
+                live.prefetch = RoundPrefetcher(ss.game_seed, ss.max_rounds, interval=ss.interval)
+                live.prefetch.schedule(ss.round)
+    except Exception: # 找不到原來的 K 棒：帳本回到本關開始時，照種子重新載入這一關
+        ss.data_key = None; ss.ledger.restart_round()
+        ss.round_restarted = True # 接著會重新載入 (整頁重跑)，提示留到畫面出來再顯示
+        return False
+    live.evicted = False; SWEEPER.stats["rehydrated"] += 1
+    return True
+
+# 新 session 帶著 ?sid= 進來 (重新整理或伺服器重啟) 時，從快照接回進度
+def resume_session(sid):
+    snap = SNAPSHOTS.read(sid)
+    if snap is None: return False
+    meta, fills = snap; ss = st.session_state
+    with span("session.resume"):
+        ss.sid = sid; ss.nickname = meta["nickname"]; ss.show_hints = meta["show_hints"]; ss.interval = meta["interval"]
+        ss.game_seed = meta["seed"]; ss.round = meta["round"]; ss.max_rounds = meta["max_rounds"]
+        ss.ticker = meta["ticker"]; ss.stock_name = meta["stock_name"]; ss.step = meta["step"]; ss.last_equity = meta["last_equity"]
+        ss.ledger = Ledger.load(meta["ledger"], fills); ss.data_key = meta["data"]; ss.equity_hist = tuple(meta.get("equity_hist", ()))
+        ss.game_started = True; ss.auto_play = False; ss.first_load = True
+        if ss.data_key: rehydrate()
+    st.toast("♻️ 已接回上次的進度", icon="♻️")
+    return True
+
+# 倒數 / 結算畫面：只記下結束時間，動畫交給瀏覽器，伺服器不 sleep
+COUNTDOWN = 3
+
+def start_countdown(reveal=None):
+    st.session_state.countdown_until = time.time() + COUNTDOWN
+    st.session_state.reveal = reveal
+
+def countdown_overlay():
+    left = st.session_state.countdown_until - time.time()
+    if left <= 0: return
+    gone = f"hideLater 0s {left:.2f}s forwards"
+    count = f"<span class='count' style='--d: {left - COUNTDOWN:.2f}s'></span>"
+    rv = st.session_state.reveal
+    if rv:
+        tail = f"下一關倒數 {count}" if not rv['final'] else "🏆 成績已上榜"
+        body = f"""<div class='reveal-box' style='animation: popIn 0.5s, {gone};'>
+            <div class='reveal-title'>🎉 結算完成</div>
+            <div class='reveal-stock'>{rv['name']} ({rv['ticker']})</div>
+            <div class='reveal-stat'>{rv['msg']}</div>
+            <div style='margin-top: 15px; font-size: 20px; color: #888;'>{tail}</div>
+        </div>"""
+    else:
+        body = f"<div class='countdown-box' style='animation: pulse 0.8s infinite, {gone};'>{count}</div>"
+    st.markdown(f"<div class='reveal-overlay' style='animation: {gone};'></div>{body}", unsafe_allow_html=True)
+
+# --- 比賽房間 ---
+# 房間模式下 K 棒位置一律由房間時鐘決定，session 只保留自己的帳本
+def current_room():
+    return get_room(st.session_state.room) if st.session_state.room else None
+
+def join_room(name, room):
+    if st.session_state.player_id is None: st.session_state.player_id = uuid.uuid4().hex
+    prepare_next_round(full_reset=True)
+    room.join(st.session_state.player_id, name)
+    st.session_state.room = room.code; st.session_state.room_saved = False
+    st.session_state.nickname = name; st.session_state.game_started = True; st.session_state.max_rounds = 1
+    st.session_state.ticker = room.ticker; st.session_state.stock_name = room.name; live.data = room.data
+    st.session_state.step = room.clock(); st.session_state.auto_play = True; st.session_state.first_load = True
+
+def leave_room():
+    st.session_state.room = None; st.session_state.max_rounds = 3
+    st.session_state.game_started = False; live.data = None
+
+# 房間排行榜：所有 session 共用同一份前 10 名，自己的名次用二分搜尋
+def room_standings():
+    room = current_room()
+    if room is None: return
+    rows = room.standings(10)
+    my_rank, total = room.rank(st.session_state.player_id)
+    st.markdown(f"#### 🏟️ 房間 {room.code} 即時排行 (你第 {my_rank} 名 / {total} 人)")
+    if rows: st.dataframe(pd.DataFrame([(n, int(e)) for n, e in rows], columns=["玩家", "總權益"], index=range(1, len(rows) + 1)), use_container_width=True)
+
+# 交易規則都在 Ledger 裡，這裡只負責提示
 def execute_trade(action, price, qty, current_step_index):
+    room = current_room()
+    if room is not None and not room.started(): st.toast("⏳ 比賽還沒開始", icon="⏳"); return
+    if room is not None and room.finished(): st.toast("🏁 比賽已結束", icon="🏁"); return
     try:
-        price = float(price); pos = st.session_state.position; avg = st.session_state.avg_cost
-        fee = price * qty * 0.002
-        if action == "buy":
-            if pos < 0:
-                cover_qty = min(abs(pos), qty); remaining_qty = qty - cover_qty
-                principal_returned = avg * cover_qty; profit = (avg - price) * cover_qty
-                trade_roi = (avg - price) / avg * 100
-                st.session_state.trade_returns.append(trade_roi)
-                st.session_state.balance += (principal_returned + profit - fee)
-                st.session_state.position += cover_qty
-                st.session_state.history.append(f"🔴 空單回補 {cover_qty}股 (損: {int(profit)}, {trade_roi:.2f}%)")
-                if remaining_qty > 0:
-                    cost_new = price * remaining_qty
-                    if st.session_state.balance >= cost_new:
-                        st.session_state.balance -= (cost_new + fee); st.session_state.position += remaining_qty
-                        st.session_state.avg_cost = price
-                        st.session_state.history.append(f"🔴 反手做多 {remaining_qty}股 @ {price:.2f}")
-            else:
-                cost = price * qty
-                if st.session_state.balance >= cost:
-                    st.session_state.balance -= (cost + fee)
-                    total_cost = (avg * pos) + cost; new_pos_size = pos + qty
-                    st.session_state.avg_cost = total_cost / new_pos_size; st.session_state.position += qty
-                    st.session_state.history.append(f"🔴 買進 {qty}股 @ {price:.2f}")
-                else: st.toast("❌ 資金不足", icon="💸")
-        elif action == "sell":
-            if pos > 0:
-                sell_qty = min(pos, qty); remaining_qty = qty - sell_qty
-                profit = (price - avg) * sell_qty; revenue = price * sell_qty
-                trade_roi = (price - avg) / avg * 100
-                st.session_state.trade_returns.append(trade_roi)
-                st.session_state.balance += (revenue - fee); st.session_state.position -= sell_qty
-                st.session_state.history.append(f"🟢 賣出 {sell_qty}股 (損: {int(profit)}, {trade_roi:.2f}%)")
-                if remaining_qty > 0:
-                    cost_new = price * remaining_qty
-                    if st.session_state.balance >= cost_new:
-                        st.session_state.balance -= (cost_new + fee); st.session_state.position -= remaining_qty
-                        st.session_state.avg_cost = price
-                        st.session_state.history.append(f"🟢 反手放空 {remaining_qty}股 @ {price:.2f}")
-            else:
-                cost = price * qty
-                if st.session_state.balance >= cost:
-                    st.session_state.balance -= (cost + fee)
-                    total_cost = (avg * abs(pos)) + cost; new_pos_size = abs(pos) + qty
-                    st.session_state.avg_cost = total_cost / new_pos_size; st.session_state.position -= qty
-                    st.session_state.history.append(f"🟢 放空 {qty}股 @ {price:.2f}")
-                else: st.toast(f"❌ 資金不足！", icon="💸")
-        marker_type = 'buy' if action == 'buy' else 'sell'
-        st.session_state.trades_visual.append({'index': current_step_index, 'price': price, 'type': marker_type})
+        ledger = st.session_state.ledger
+        opened_at, n0 = ledger.opened_at, ledger.n_fills
+        if not ledger.execute(action, price, qty, current_step_index): st.toast("❌ 資金不足", icon="💸"); return
+        log_fills(ledger.fills[n0:], opened_at, room)
+        if room is not None: room.report(st.session_state.player_id, ledger, st.session_state.nickname)
+        else: save_snapshot()
     except Exception as e: pass
 
-def save_score(player, ticker, name, assets, roi):
+def log_fills(fills, opened_at, room):
+    ss = st.session_state
+    for row in fill_events(fills, FRAMES.lazy(live.data), opened_at, ss.ledger.position, sid=ss.sid or "", player=ss.nickname,
+                           room=room.code if room is not None else "", seed=ss.game_seed or 0, round=ss.round,
+                           ticker=ss.ticker, interval=ss.interval, hints=bool(ss.show_hints)):
+        WRITER.emit("trades", row)
+
+def save_score(player, ticker, name, assets, roi, stock="三關通關", risk=None):
     try:
-        trades = st.session_state.trade_returns
-        avg_sniper = sum(trades) / len(trades) if trades else 0.0
+        avg_sniper = st.session_state.ledger.avg_return()
         total_profit = assets - 10000000
-        profit_score = (total_profit / 10000) 
-        power_score = (avg_sniper * 40) + (roi * 30) + (profit_score * 0.3 * 30) 
-        new = pd.DataFrame([{"日期": time.strftime("%Y-%m-%d %H:%M"), "玩家": player, "股名": "三關通關", "綜合戰力": round(power_score, 1), "狙擊率(%)": round(avg_sniper, 2), "總報酬(%)": round(roi, 2), "總獲利($)": int(total_profit)}])
-        hdr = not os.path.exists(FILES["leaderboard"]); new.to_csv(FILES["leaderboard"], mode='a', header=hdr, index=False)
+        power = power_score(avg_sniper, roi, assets, risk)
+        st.session_state.last_risk = risk
+        # 英雄榜緊接著要查名次，成績同步寫入，不等背景批次
+        WRITER.emit("score", {"date": time.strftime("%Y-%m-%d %H:%M"), "player": player, "stock": stock, "power": round(power, 1), "sniper": round(avg_sniper, 2), "roi": round(roi, 2), "profit": int(total_profit)}, sync=True)
+        st.session_state.last_power = round(power, 1) # 英雄榜用來查自己的名次
     except: pass
 
 def save_feedback(name, text):
-    try:
-        timestamp = time.strftime('%Y-%m-%d %H:%M')
-        if not os.path.exists(FILES["feedback"]):
-             with open(FILES["feedback"], "w", encoding="utf-8") as f: f.write("Time,User,Message\n")
-        clean_text = text.replace(",", "，").replace("\n", " ")
-        with open(FILES["feedback"], "a", encoding="utf-8") as f: f.write(f"{timestamp},{name},{clean_text}\n")
-    except: pass
+    timestamp = time.strftime('%Y-%m-%d %H:%M')
+    clean_text = text.replace(",", "，").replace("\n", " ")
+    WRITER.emit("feedback", {"Time": timestamp, "User": name, "Message": clean_text})
+
+# --- 播放與畫面 (fragment) ---
+PLAY_INTERVAL = 0.5 # 自動播放每根 K 棒的秒數
+
+def mark_to_market(df, step):
+    curr_idx = min(step, len(df)-1)
+    curr_row = df.iloc[curr_idx]; curr_price = round(float(curr_row['Close']), 2) # 資料存 float32，還原成兩位小數的報價
+    ledger = st.session_state.ledger
+    unrealized = ledger.unrealized(curr_price); est_total = ledger.equity(curr_price)
+    roi = ((est_total - 10000000) / 10000000) * 100
+    return curr_idx, curr_row, curr_price, unrealized, est_total, roi
+
+# 播放時鐘：側邊報價和 K 線兩個計時 fragment 畫之前都先呼叫，同一拍只有先到的那個前進一根，
+# 後到的直接用同一根，兩邊不會差一根。整頁重跑 (玩家操作) 會把這一拍記成已走過，不前進。
+TICK_GAP = PLAY_INTERVAL * 0.75 # 距離上次前進不到這麼久，就當作同一拍
+
+def advance_playback(df):
+    live.touch() # 播放中的 fragment 重跑也算有動作
+    room = current_room()
+    if room is not None: # 房間模式：跟著房間時鐘，比賽結束時整頁重跑顯示結果
+        st.session_state.step = room.clock()
+        if room.finished() and st.session_state.auto_play: st.session_state.auto_play = False; st.rerun()
+        return
+    now = time.time()
+    if not st.session_state.auto_play or now - st.session_state.last_tick < TICK_GAP: return
+    if now < st.session_state.countdown_until: return # 倒數中先不走
+    st.session_state.last_tick = now
+    if st.session_state.step < len(df)-1:
+        st.session_state.step += 1
+        if st.session_state.step % SNAPSHOT_EVERY == 0: save_snapshot()
+    else: st.session_state.auto_play = False; st.rerun()
+
+# 切到英雄榜 / 版本日誌時沒有計時 fragment，但播放時鐘照走：離開時記下時間，
+# 回到操盤室 (或在別頁按暫停) 的那次整頁重跑一次補上這段時間該走的根數
+def catch_up_playback(df):
+    ss = st.session_state
+    if ss.auto_play and ss.nav_selection != "📊 操盤室":
+        if ss.play_anchor is None: ss.play_anchor = max(time.time(), ss.countdown_until) # 倒數中離開，從倒數結束起算
+        return
+    if ss.play_anchor is None: return
+    missed = int(max(0.0, time.time() - ss.play_anchor) / PLAY_INTERVAL); ss.play_anchor = None
+    if missed <= 0: return
+    ss.step = min(ss.step + missed, len(df) - 1)
+    if ss.step >= len(df) - 1: ss.auto_play = False
+    save_snapshot()
+
+# 本關逐根權益：只在成交 (或換關) 後整段重算一次，之後每根 K 棒只是切片
+def round_origin():
+    room = current_room()
+    if room is not None: return room.start
+    return st.session_state.data_key["start"] if st.session_state.data_key else st.session_state.step
+
+def round_curve(df):
+    ledger = st.session_state.ledger; origin = round_origin()
+    key = (id(df), ledger.round, ledger.n_fills, origin)
+    if live.curve is None or live.curve[0] != key:
+        live.curve = (key, ledger.equity_curve(df["Close"].to_numpy(dtype="float64").round(2), origin, len(df) - 1)) # 和報價一樣取兩位小數
+    return live.curve[1][:max(1, min(st.session_state.step, len(df) - 1) - origin + 1)]
+
+# 側邊欄報價區，跟著播放時鐘單獨重跑
+@tracing.traced("fragment.quote_panel")
+def quote_panel():
+    df = live.data
+    advance_playback(df)
+    curr_idx, curr_row, curr_price, unrealized, est_total, roi = mark_to_market(df, st.session_state.step)
+    ledger = st.session_state.ledger; pos = ledger.position; avg = ledger.avg_cost
+    pnl_color = "red" if unrealized >= 0 else "green"
+    st.markdown(f"""
+    <div class="asset-box">
+        <div class="asset-label">總權益 / 報酬率</div>
+        <div class="asset-value">{int(est_total/10000)}萬 ({roi:.2f}%)</div>
+        <div class="asset-label" style="margin-top:5px;">未實現損益</div>
+        <div class="asset-value" style="color: {pnl_color};">{int(unrealized)}</div>
+        <div style="margin-top:5px;">{sparkline_svg(round_curve(df))}</div>
+    </div>
+    """, unsafe_allow_html=True)
+
+    room = current_room()
+    if room is not None:
+        now = time.time()
+        if not room.started(now): st.warning(f"⏳ 比賽 {int(room.starts_at - now) + 1} 秒後開始")
+        elif not room.finished(now): st.caption(f"⏱️ 比賽剩餘 {int(room.ends_at - now)} 秒")
+
+    if pos != 0: st.info(f"倉位: {'多單' if pos>0 else '空單'} {abs(pos)} 股 | 均价 {avg:.1f}")
+    else: st.caption("目前無庫存")
+    st.divider()
+
+    c_price, c_cap = st.columns([1, 1.5])
+    c_price.markdown(f"<div class='price-text'>{curr_price:.1f}</div>", unsafe_allow_html=True)
+    max_buy = int(ledger.balance // curr_price // 1000)
+    if max_buy < 1: c_cap.caption(f"⚠️ 資金不足買1張")
+    else: c_cap.caption(f"💰 可買: {max_buy} 張")
+
+    if st.session_state.show_hints:
+        sig = FRAMES.lazy(df) # 訊號欄位第一次開提示才算
+        is_bull = sig['Signal_Bull'][curr_idx]; is_bear = sig['Signal_Bear'][curr_idx]; slope = curr_row['MA22_Slope']
+        if is_bull: hint = "<span class='signal-bull'>🚀 攻擊訊號</span>：趨勢向上 + 動能增強！"
+        elif is_bear: hint = "<span class='signal-bear'>📉 棄守訊號</span>：趨勢轉弱 + 動能翻空。"
+        elif slope > 0: hint = "<span class='signal-wait'>🧘‍♀️ 多頭回檔</span>：月線向上，短線整理。"
+        else: hint = "<span class='signal-wait'>👀 震盪觀望</span>：趨勢不明，耐心等待。"
+        st.markdown(f"<div class='tip-box'>🤖 AI 觀點：<br>{hint}</div>", unsafe_allow_html=True)
+
+# 操盤室 K 線區：播放時只有這一塊重跑，不會重跑整個腳本
+@tracing.traced("fragment.trading_view")
+def trading_view():
+    df = live.data
+    advance_playback(df)
+    curr_idx, curr_row, curr_price, unrealized, est_total, roi = mark_to_market(df, st.session_state.step)
+    if est_total <= 0: st.rerun() # 斷頭交給整頁重跑處理
+    masked_name = "❓❓❓❓"
+    chart = live.chart
+    if chart is None or chart.df is not df or chart.show_hints != st.session_state.show_hints:
+        chart = live.chart = RoundChart(df, st.session_state.show_hints, lazy=FRAMES.lazy(df)) # 每局只預算一次
+    view = VIEWS.get(st.session_state.chart_view)
+    if view and chart.pyramid is None: chart.pyramid = FRAMES.pyramid(df) # 放大視野才需要多解析度資料
+    chart.set_view(view)
+    fig = chart.figure(curr_idx, st.session_state.ledger, f"{masked_name} - {curr_price}")
+    with span("chart.render"): st.plotly_chart(fig, use_container_width=True, config={'staticPlot': True}, theme=None) # 含驗證 + 序列化
 
 # --- 6. 程式進入點 ---
 log_traffic()
@@ -290,24 +454,14 @@ try: ADMIN_PASSWORD = st.secrets["admin_password"]
 except: ADMIN_PASSWORD = "admin_password_not_set"
 
 if st.session_state.is_admin:
-    st.title("🔒 系統管理後台")
-    if st.button("⬅️ 返回遊戲"): st.session_state.is_admin = False; st.rerun()
-    admin_data = get_admin_data()
-    k1, k2, k3 = st.columns(3)
-    k1.metric("👁️ 總瀏覽", len(admin_data['traffic'])); k2.metric("💬 回饋數", len(admin_data['feedback']) if isinstance(admin_data['feedback'], list) else pd.read_csv(FILES["feedback"]).shape[0] if os.path.exists(FILES["feedback"]) else 0); k3.metric("🎮 遊戲場數", len(admin_data['leaderboard']))
-    st.divider()
-    if not admin_data['traffic'].empty:
-        df_t = admin_data['traffic']; df_count = df_t.groupby(df_t['Time'].dt.date).size().reset_index(name='Visits')
-        st.plotly_chart(px.line(df_count, x='Time', y='Visits', title='每日訪問'), use_container_width=True)
-    c1, c2 = st.columns(2)
-    with c1: 
-        st.subheader("💬 意見回饋")
-        if os.path.exists(FILES["feedback"]): st.dataframe(pd.read_csv(FILES["feedback"]), use_container_width=True)
-    with c2: 
-        st.subheader("🏆 英雄榜")
-        if not admin_data['leaderboard'].empty: st.dataframe(admin_data['leaderboard'].sort_values(by="綜合戰力", ascending=False), use_container_width=True)
+    import admin # 後台才用得到 plotly.express，第一次進後台才載入
+    admin.render(FILES)
 
 else:
+    if not st.session_state.game_started and not st.session_state.get('resume_checked'):
+        st.session_state.resume_checked = True # 每個 session 只試一次
+        resume_session(st.query_params.get("sid"))
+
     if not st.session_state.game_started:
         st.markdown("<h1 style='text-align: center;'>⚡ 交易挑戰賽，戰力積分版</h1>", unsafe_allow_html=True)
         st.markdown("""
@@ -319,7 +473,7 @@ else:
         歡迎脆追蹤按起來 <a href="https://www.threads.net/@wowwow31001" target="_blank">wowwow31001</a>!<br>
         <strong style='background-color: #ffffcc; color: #ff0000; padding: 2px 5px; border-radius: 4px;'>真正有料的是12/7日那個程式</strong><br>
         <br>
-        如果畫面突然重啟，代表我正在修改程式，請見諒。
+        如果畫面突然重啟，代表我正在修改程式；重新整理就會接回剛才的進度。
         </div>
         """, unsafe_allow_html=True)
         
@@ -328,13 +482,30 @@ else:
             with st.form("login"):
                 name = st.text_input("輸入你的綽號", "邊看盤邊大跳")
                 show_hints = st.checkbox("🤖 啟用【AI 投顧提示】(K線圖顯示買賣訊號)")
+                fast = st.checkbox("⏱️ 1 分 K 快節奏模式")
                 if st.form_submit_button("🔥 進入操盤室", use_container_width=True):
                     st.session_state.nickname = name
                     st.session_state.accumulate_mode = True
                     st.session_state.show_hints = show_hints
+                    st.session_state.interval = "1m" if fast else "5m"
                     st.session_state.game_started = True
+                    if not valid_sid(st.session_state.sid): st.session_state.sid = uuid.uuid4().hex
+                    st.query_params["sid"] = st.session_state.sid # 網址帶著 sid，重新整理後可以接回進度
                     prepare_next_round(full_reset=True)
                     st.rerun()
+
+            with st.expander("🏟️ 比賽房間 (多人同步)"):
+                with st.form("room_login"):
+                    room_name = st.text_input("綽號", "邊看盤邊大跳")
+                    code = st.text_input("房間代碼 (建立新房間可留空)", max_chars=4)
+                    c_join, c_new = st.columns(2)
+                    join = c_join.form_submit_button("🚪 加入房間", use_container_width=True)
+                    new = c_new.form_submit_button("➕ 建立房間", use_container_width=True)
+                    if join or new:
+                        try: room = create_room() if new else get_room(code)
+                        except RoundError: room = None # 沒有可用的標的
+                        if room is None: st.error("找不到這個房間" if join else "目前沒有可用的標的，請稍後再試")
+                        else: join_room(room_name, room); st.rerun()
         
         with st.sidebar:
             st.markdown("---")
@@ -345,42 +516,46 @@ else:
                     else: st.error("錯誤")
 
     else:
+        room = current_room()
+        if st.session_state.room and room is None: # 房間已過期或伺服器重啟
+            leave_room(); st.rerun()
+        if room is not None:
+            st.session_state.step = room.clock()
+            if live.data is None: live.data = room.data # 閒置被回收過
+        elif live.data is None and st.session_state.data_key: rehydrate()
+
         # [核心修復] 在主流程中檢測數據是否為空，如果是，則觸發加載
         # 這樣可以確保 UI 已經刷新，彈窗消失，然後才顯示載入動畫
-        if st.session_state.data is None:
+        if live.data is None:
             with st.spinner('🎲 正在搜尋高波動、股價<200 的妖股...'):
                 t, n, d = load_data()
-                st.session_state.ticker = t; st.session_state.stock_name = n; st.session_state.data = d
+                st.session_state.ticker = t; st.session_state.stock_name = n; live.data = d
+                st.session_state.auto_play = True
+                save_snapshot()
+                if time.time() >= st.session_state.countdown_until: start_countdown() # 結算時已經開始倒數的就不重來
                 st.rerun() # 載入完成後再次刷新，顯示圖表
 
-        df = st.session_state.data
+        df = live.data
         # 再次檢查確保 df 存在 (理論上上面的 if 會處理)
         if df is None:
              st.stop()
 
-        if st.session_state.in_countdown:
-            placeholder = st.empty()
-            for i in range(3, 0, -1):
-                placeholder.markdown(f"""<div class='reveal-overlay'></div><div class='countdown-box'>{i}</div>""", unsafe_allow_html=True)
-                time.sleep(1)
-            placeholder.empty()
-            st.session_state.in_countdown = False
-            st.session_state.auto_play = True
-            st.rerun()
+        countdown_overlay()
 
         if st.session_state.first_load:
             st.toast("👈 手機請點左上角「>」打開下單面板！", icon="💡")
             st.session_state.first_load = False
-
-        curr_idx = st.session_state.step
-        if curr_idx >= len(df): st.session_state.auto_play = False; curr_idx = len(df)-1
-        curr_row = df.iloc[curr_idx]; curr_price = float(curr_row['Close'])
-        
-        masked_name = "❓❓❓❓"
-        pos = st.session_state.position; avg = st.session_state.avg_cost
-        unrealized = (curr_price - avg) * pos if pos > 0 else (avg - curr_price) * abs(pos) if pos < 0 else 0
-        est_total = st.session_state.balance + (pos * curr_price if pos > 0 else (abs(pos)*avg + unrealized if pos < 0 else 0))
-        roi = ((est_total - 10000000) / 10000000) * 100
+        if st.session_state.pop('round_restarted', False): st.toast("⚠️ 行情資料已更新，這一關從頭開始", icon="⚠️")
+
+        if room is None: catch_up_playback(df)
+        if st.session_state.step >= len(df): st.session_state.auto_play = False
+        curr_idx, curr_row, curr_price, unrealized, est_total, roi = mark_to_market(df, st.session_state.step)
+        st.session_state.last_tick = time.time() # 整頁重跑算走過這一拍，兩個播放 fragment 都不前進
+        # 只有在操盤室且自動播放時才啟動計時重跑
+        play_every = PLAY_INTERVAL if st.session_state.auto_play and st.session_state.nav_selection == "📊 操盤室" else None
+        if room is not None:
+            st.session_state.auto_play = not room.finished()
+            play_every = room.interval if st.session_state.auto_play and st.session_state.nav_selection == "📊 操盤室" else None
 
         # 斷頭機制
         if est_total <= 0:
@@ -388,6 +563,7 @@ else:
             real_name = st.session_state.stock_name
             real_ticker = st.session_state.ticker
             save_score(st.session_state.nickname, real_ticker, f"破產-{real_name}", 0, -100.0)
+            drop_snapshot()
             
             st.markdown(f"""
             <div class='reveal-overlay'></div>
@@ -405,145 +581,74 @@ else:
 
         with st.sidebar:
             st.markdown(f"#### 👤 {st.session_state.nickname}")
-            st.info(f"🏆 目前關卡：Round {st.session_state.round} / 3")
+            if room is not None: st.info(f"🏟️ 比賽房間 {room.code}")
+            else: st.info(f"🏆 目前關卡：Round {st.session_state.round} / 3")
             if st.session_state.show_hints: st.caption("🤖 AI 投顧提示 ON")
             
-            pnl_color = "red" if unrealized >= 0 else "green"
-            st.markdown(f"""
-            <div class="asset-box">
-                <div class="asset-label">總權益 / 報酬率</div>
-                <div class="asset-value">{int(est_total/10000)}萬 ({roi:.2f}%)</div>
-                <div class="asset-label" style="margin-top:5px;">未實現損益</div>
-                <div class="asset-value" style="color: {pnl_color};">{int(unrealized)}</div>
-            </div>
-            """, unsafe_allow_html=True)
-
-            if pos != 0: st.info(f"倉位: {'多單' if pos>0 else '空單'} {abs(pos)} 股 | 均价 {avg:.1f}")
-            else: st.caption("目前無庫存")
-            st.divider()
-
-            c_price, c_qty = st.columns([1, 1.5])
-            c_price.markdown(f"<div class='price-text'>{curr_price:.1f}</div>", unsafe_allow_html=True)
-            qty = c_qty.number_input("股數", 1000, 50000, 1000, step=1000, label_visibility="collapsed")
-            
-            max_buy = int(st.session_state.balance // curr_price // 1000)
-            if max_buy < 1: st.caption(f"⚠️ 資金不足買1張")
-            else: st.caption(f"💰 可買: {max_buy} 張")
+            st.fragment(run_every=play_every)(quote_panel)()
+            qty = st.number_input("股數", 1000, 50000, 1000, step=1000, label_visibility="collapsed")
 
             b_col, s_col = st.columns(2)
             if b_col.button(f"買進", use_container_width=True): execute_trade("buy", curr_price, qty, curr_idx); st.rerun()
             if s_col.button(f"賣出", use_container_width=True): execute_trade("sell", curr_price, qty, curr_idx); st.rerun()
 
             st.divider()
-            c_play, c_next, c_slow = st.columns([2, 1, 1])
-            if st.session_state.auto_play:
-                if c_play.button("⏸ 暫停", type="primary", use_container_width=True): st.session_state.auto_play = False; st.rerun()
+            if room is not None:
+                if room.finished():
+                    if not st.session_state.get('room_saved'): # 比賽結束時記一次成績
+                        save_score(st.session_state.nickname, room.ticker, room.name, est_total, roi, stock=f"房間 {room.code}", risk=risk_stats(round_curve(df)))
+                        st.session_state.room_saved = True
+                    st.success(f"🏁 比賽結束！真相：{room.name} ({room.ticker})")
+                if st.button("🚪 離開房間", use_container_width=True): leave_room(); st.rerun()
             else:
-                if c_play.button("▶ 播放", use_container_width=True): st.session_state.auto_play = True; st.rerun()
-            if c_next.button("⏭", use_container_width=True):
-                if st.session_state.step < len(df)-1: st.session_state.step += 1; st.rerun()
-            if c_slow.button("🐢", help="減速", use_container_width=True): st.toast("無法減速！", icon="😈")
+                c_play, c_next, c_slow = st.columns([2, 1, 1])
+                if st.session_state.auto_play:
+                    if c_play.button("⏸ 暫停", type="primary", use_container_width=True): st.session_state.auto_play = False; save_snapshot(); st.rerun()
+                else:
+                    if c_play.button("▶ 播放", use_container_width=True): st.session_state.auto_play = True; st.rerun()
+                if c_next.button("⏭", use_container_width=True):
+                    if st.session_state.step < len(df)-1: st.session_state.step += 1; st.rerun()
+                if c_slow.button("🐢", help="減速", use_container_width=True): st.toast("無法減速！", icon="😈")
 
-            st.divider()
+                st.divider()
             
-            btn_text = "🏁 結算本局 (下一關)" if st.session_state.round < 3 else "🏆 最終結算 (上榜)"
-            if st.button(btn_text, use_container_width=True):
-                real_name = st.session_state.stock_name
-                real_ticker = st.session_state.ticker
-                st.session_state.last_equity = est_total
-                st.balloons()
-                
-                if st.session_state.round >= 3:
-                    save_score(st.session_state.nickname, "ALL_CLEAR", "三關制霸", est_total, roi)
-                    msg_main = f"🎉 恭喜通關！最終資產：${int(est_total):,}"
-                    st.session_state.nav_selection = "🏆 英雄榜 (戰力積分)"
-                else:
-                    msg_main = f"💰 Round {st.session_state.round} 完成！資產 ${int(est_total):,} 帶入下一關"
-
-                st.markdown(f"""
-                <div class='reveal-overlay'></div>
-                <div class='reveal-box'>
-                    <div class='reveal-title'>🎉 結算完成</div>
-                    <div class='reveal-stock'>{real_name} ({real_ticker})</div>
-                    <div class='reveal-stat'>{msg_main}</div>
-                    <div style='margin-top: 15px; font-size: 14px; color: #888;'>請等待 3 秒...</div>
-                </div>
-                """, unsafe_allow_html=True)
+                btn_text = "🏁 結算本局 (下一關)" if st.session_state.round < 3 else "🏆 最終結算 (上榜)"
+                if st.button(btn_text, use_container_width=True):
+                    st.session_state.last_equity = est_total
+                    st.balloons()
+                    final = st.session_state.round >= 3
+                    hist = st.session_state.equity_hist = st.session_state.equity_hist + (round_curve(df).round(0).tolist(),)
                 
-                time.sleep(3)
-                if st.session_state.round >= 3:
-                    pass 
-                else:
-                    # 這裡只清空狀態，不下載數據，避免UI卡死
-                    prepare_next_round(full_reset=False)
-                st.rerun()
+                    if final:
+                        risk = risk_stats([v for c in hist for v in c]) # 三關串起來的權益曲線
+                        save_score(st.session_state.nickname, "ALL_CLEAR", "三關制霸", est_total, roi, risk=risk)
+                        msg_main = f"🎉 恭喜通關！最終資產：${int(est_total):,}<br>最大回撤 {risk['max_drawdown']:.1f}% · 類夏普 {risk['sharpe']:.2f}"
+                        st.session_state.nav_selection = "🏆 英雄榜 (戰力積分)"
+                        st.session_state.auto_play = False
+                    else:
+                        msg_main = f"💰 Round {st.session_state.round} 完成！資產 ${int(est_total):,} 帶入下一關"
+
+                    # 結算畫面和下一關倒數同時跑；下一關通常已在背景準備好，直接換上
+                    start_countdown({"name": st.session_state.stock_name, "ticker": st.session_state.ticker, "msg": msg_main, "final": final})
+                    if not final: prepare_next_round(full_reset=False); save_snapshot() # 下一關還沒載入，接回時照種子重新取出
+                    else: drop_snapshot()
+                    st.rerun()
 
             with st.popover("💬 回饋"):
                 with st.form("fb"):
                     t = st.text_area("內容"); submit = st.form_submit_button("送出")
                     if submit: save_feedback(st.session_state.nickname, t); st.toast("感謝")
-            
-            if st.session_state.show_hints:
-                ma5 = curr_row['MA5']; ma22 = curr_row['MA22']; macd = curr_row['MACD']
-                is_bull = curr_row['Signal_Bull']; is_bear = curr_row['Signal_Bear']; slope = curr_row['MA22_Slope']
-                if is_bull: hint = "<span class='signal-bull'>🚀 攻擊訊號</span>：趨勢向上 + 動能增強！"
-                elif is_bear: hint = "<span class='signal-bear'>📉 棄守訊號</span>：趨勢轉弱 + 動能翻空。"
-                elif slope > 0: hint = "<span class='signal-wait'>🧘‍♀️ 多頭回檔</span>：月線向上，短線整理。"
-                else: hint = "<span class='signal-wait'>👀 震盪觀望</span>：趨勢不明，耐心等待。"
-                st.markdown(f"<div class='tip-box'>🤖 AI 觀點：<br>{hint}</div>", unsafe_allow_html=True)
-        
+
         st.markdown("---")
         view_mode = st.radio("功能切換", ["📊 操盤室", "🏆 英雄榜 (戰力積分)", "📜 版本日誌"], horizontal=True, label_visibility="collapsed", key="nav_selection")
 
         if view_mode == "📊 操盤室":
-            display_start = max(0, curr_idx - 100)
-            display_df = df.iloc[display_start : curr_idx+1]
-            chart_title = f"{masked_name} - {curr_price}"
-            
-            fig = make_subplots(rows=3, cols=1, shared_xaxes=True, vertical_spacing=0.02, row_heights=[0.65, 0.15, 0.2])
-            fig.add_trace(go.Candlestick(x=display_df['Bar_Index'], open=display_df['Open'], high=display_df['High'], low=display_df['Low'], close=display_df['Close'], name="K線", increasing_line_color='#ef5350', decreasing_line_color='#26a69a'), row=1, col=1)
-            
-            if st.session_state.show_hints:
-                bull_signals = display_df[display_df['Signal_Bull']]
-                if not bull_signals.empty: fig.add_trace(go.Scatter(x=bull_signals['Bar_Index'], y=bull_signals['Low']*0.995, mode='markers', name='轉強', marker=dict(symbol='triangle-up', size=10, color='#d90000')), row=1, col=1)
-                bear_signals = display_df[display_df['Signal_Bear']]
-                if not bear_signals.empty: fig.add_trace(go.Scatter(x=bear_signals['Bar_Index'], y=bear_signals['High']*1.005, mode='markers', name='轉弱', marker=dict(symbol='triangle-down', size=10, color='#008000')), row=1, col=1)
-
-            colors = {'MA5': '#FFD700', 'MA22': '#9370DB', 'MA60': '#2E8B57', 'MA240': '#A9A9A9'}
-            widths = {'MA5': 1, 'MA22': 1, 'MA60': 1.5, 'MA240': 2}
-            for ma in ['MA5', 'MA22', 'MA60', 'MA240']:
-                fig.add_trace(go.Scatter(x=display_df['Bar_Index'], y=display_df[ma], line=dict(color=colors[ma], width=widths[ma]), name=ma), row=1, col=1)
-            
-            visible = [t for t in st.session_state.trades_visual if display_start <= t['index'] <= curr_idx]
-            bx = [t['index'] for t in visible if t['type']=='buy']; by = [t['price']*0.99 for t in visible if t['type']=='buy']
-            sx = [t['index'] for t in visible if t['type']=='sell']; sy = [t['price']*1.01 for t in visible if t['type']=='sell']
-            if bx: fig.add_trace(go.Scatter(x=bx, y=by, mode='markers', name='買', marker=dict(symbol='triangle-up', size=12, color='red')), row=1, col=1)
-            if sx: fig.add_trace(go.Scatter(x=sx, y=sy, mode='markers', name='賣', marker=dict(symbol='triangle-down', size=12, color='green')), row=1, col=1)
-            
-            vol_colors = ['#ef5350' if r['Open'] < r['Close'] else '#26a69a' for i, r in display_df.iterrows()]
-            fig.add_trace(go.Bar(x=display_df['Bar_Index'], y=display_df['Volume'], marker_color=vol_colors, name="量"), row=2, col=1)
-            
-            hist_c = ['#ef5350' if v > 0 else '#26a69a' for v in display_df['MACD_Hist']]
-            fig.add_trace(go.Bar(x=display_df['Bar_Index'], y=display_df['MACD_Hist'], marker_color=hist_c, name="MACD"), row=3, col=1)
-            fig.add_trace(go.Scatter(x=display_df['Bar_Index'], y=display_df['MACD'], line=dict(color='#ffc107', width=1)), row=3, col=1)
-            fig.add_trace(go.Scatter(x=display_df['Bar_Index'], y=display_df['Signal'], line=dict(color='#2196f3', width=1)), row=3, col=1)
-            
-            fig.update_layout(height=450, margin=dict(l=10, r=10, t=10, b=10), showlegend=False, 
-                            title=dict(text=chart_title, x=0.05, y=0.98, font=dict(color="white")),
-                            xaxis_rangeslider_visible=False, dragmode=False,
-                            paper_bgcolor='#0e1117', plot_bgcolor='#0e1117', font=dict(color='white'))
-            
-            fig.update_xaxes(showticklabels=False, row=1, col=1, fixedrange=True, gridcolor='#333')
-            fig.update_yaxes(fixedrange=True, row=1, col=1, gridcolor='#333')
-            fig.update_xaxes(showticklabels=False, row=2, col=1, fixedrange=True, gridcolor='#333')
-            fig.update_yaxes(fixedrange=True, row=2, col=1, gridcolor='#333')
-            fig.update_xaxes(showticklabels=False, row=3, col=1, fixedrange=True, gridcolor='#333')
-            fig.update_yaxes(fixedrange=True, row=3, col=1, gridcolor='#333')
-            
-            st.plotly_chart(fig, use_container_width=True, config={'staticPlot': True}, theme=None)
+            st.select_slider("視野", list(VIEWS), key="chart_view", label_visibility="collapsed") # 放大時改用較粗的 K 棒，每次傳送的根數不變
+            st.fragment(run_every=play_every)(trading_view)()
+            if room is not None: st.fragment(run_every=play_every)(room_standings)()
             
             with st.expander("📝 交易紀錄 (倒序)"):
-                for log in reversed(st.session_state.history[-10:]): st.caption(log)
+                for log in reversed(st.session_state.ledger.history(10)): st.caption(log)
 
         elif view_mode == "🏆 英雄榜 (戰力積分)":
             st.markdown("### 🏆 華爾街英雄榜")
@@ -558,10 +663,20 @@ else:
             > * **總報酬 (30%)**：本局總資產報酬率，考驗你的穩定性。
             > * **獲利力 (30%)**：絕對獲利金額，考驗你的部位管理。
             """)
-            if os.path.exists(FILES["leaderboard"]):
-                try: st.dataframe(pd.read_csv(FILES["leaderboard"]).sort_values(by="綜合戰力", ascending=False), use_container_width=True)
-                except: st.write("無紀錄")
-            else: st.info("尚無紀錄")
+            if any(RISK_WEIGHTS.values()): st.caption(f"📉 風險調整：最大回撤每 1% 扣 {RISK_WEIGHTS['max_drawdown']} 分，類夏普每 1 加 {RISK_WEIGHTS['sharpe']} 分")
+            try:
+                board = get_board(); total = board.count()
+                if 'last_power' in st.session_state:
+                    my_rank, _, pct = board.rank(st.session_state.last_power)
+                    st.success(f"🎯 你的最新戰力 {st.session_state.last_power}：第 {my_rank} 名 / 共 {total} 筆 (前 {pct:.1f}%)")
+                    risk = st.session_state.get('last_risk')
+                    if risk: st.caption(f"📉 最大回撤 {risk['max_drawdown']:.1f}% · 最長水下 {risk['underwater_bars']} 根 ({risk['underwater_pct']:.0f}% 時間) · 類夏普 {risk['sharpe']:.2f}")
+                if total:
+                    pages = (total - 1) // LB_PAGE_SIZE + 1
+                    page = st.number_input("頁數", 1, pages, 1, step=1) if pages > 1 else 1
+                    st.dataframe(board.top(LB_PAGE_SIZE, page - 1), use_container_width=True)
+                else: st.info("尚無紀錄")
+            except: st.write("無紀錄")
 
         elif view_mode == "📜 版本日誌":
             st.markdown("### 📜 版本日誌")
@@ -570,6 +685,6 @@ else:
             * **v4.22**: [UX] 通關後自動跳轉英雄榜。
             * **v4.21**: [GamePlay] 3關制生存戰。
             """)
-        
-        if st.session_state.auto_play:
-            time.sleep(0.5); st.session_state.step += 1; st.rerun()
+
+tracing.end_rerun(st.session_state, st.session_state.nickname or ("admin" if st.session_state.is_admin else "-"))
+tracing.record_once("startup.first_run", (time.perf_counter() - _T0) * 1000)